@@ -0,0 +1,336 @@
+"""
+Инструменты нагрузочных замеров API.
+
+Запросы выполняются либо тестовым клиентом Django в текущем процессе,
+либо по HTTP к gunicorn, запущенному отдельным процессом. В обоих
+случаях для каждого запроса известны статус, время ответа и количество
+SQL-запросов: в процессе они считаются через execute_wrapper, у
+gunicorn берутся из заголовка Server-Timing.
+"""
+
+import http.client
+import json
+import os
+import re
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+from contextlib import ExitStack
+from pathlib import Path
+from urllib.parse import quote
+
+import numpy as np
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.db.models import Max
+from django.test import Client
+
+from recipes.models import Recipe, User
+
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+IMAGE = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAf'
+         'FcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg==')
+
+
+class ClientTransport:
+    """Запросы через тестовый клиент Django в текущем процессе."""
+
+    mode = 'client'
+
+    def __init__(self):
+        self.client = Client()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def request(self, method, path, body=None, headers=None):
+        """Выполняет запрос; возвращает статус, тело, запросы и время."""
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        extra = {
+            'HTTP_' + name.upper().replace('-', '_'): value
+            for name, value in (headers or {}).items()}
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(count_query))
+            response = self.client.generic(
+                method, path, data=body or '',
+                content_type='application/json', **extra)
+            content = (b''.join(response.streaming_content)
+                       if response.streaming else response.content)
+        elapsed = time.perf_counter() - started
+        return response.status_code, content, queries, elapsed
+
+    def peak_rss(self):
+        """Пиковая резидентная память процесса в байтах."""
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ServerTransport:
+    """Запросы по HTTP к gunicorn, запущенному отдельным процессом."""
+
+    mode = 'server'
+
+    def __init__(self, workers=2, port=0, extra_args=(), env=None):
+        self.workers = workers
+        self.port = port or self.free_port()
+        self.extra_args = list(extra_args)
+        self.env = dict(os.environ, SERVER_TIMING='true',
+                        SERVER_TIMING_SAMPLE_RATE='1', **(env or {}))
+        self.process = None
+        self.local = threading.local()
+        self.connections = []
+
+    @staticmethod
+    def free_port():
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn',
+             '--config', 'gunicorn.conf.py',
+             '--bind', f'127.0.0.1:{self.port}',
+             '--workers', str(self.workers), *self.extra_args],
+            cwd=settings.BASE_DIR, env=self.env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError('gunicorn завершился при запуске.')
+            try:
+                socket.create_connection(
+                    ('127.0.0.1', self.port), timeout=1).close()
+                return self
+            except OSError:
+                time.sleep(0.1)
+        self.process.terminate()
+        raise RuntimeError('gunicorn не начал принимать соединения.')
+
+    def __exit__(self, *exc_info):
+        for connection in self.connections:
+            connection.close()
+        self.process.terminate()
+        self.process.wait()
+
+    def connection(self):
+        """Постоянное соединение текущего потока."""
+        if not hasattr(self.local, 'connection'):
+            self.local.connection = http.client.HTTPConnection(
+                '127.0.0.1', self.port, timeout=60)
+            self.connections.append(self.local.connection)
+        return self.local.connection
+
+    def request(self, method, path, body=None, headers=None):
+        """Выполняет запрос; возвращает статус, тело, запросы и время."""
+        connection = self.connection()
+        headers = dict(headers or {}, Host='localhost')
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+        path = quote(path, safe="/?&=%:+,;@-._~")
+        started = time.perf_counter()
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            content = response.read()
+        except (http.client.HTTPException, OSError):
+            connection.close()
+            raise
+        elapsed = time.perf_counter() - started
+        if response.getheader('Connection', '').lower() == 'close':
+            connection.close()
+        match = SERVER_TIMING_QUERIES.search(
+            response.getheader('Server-Timing', ''))
+        queries = int(match.group(1)) if match else None
+        return response.status, content, queries, elapsed
+
+    def pids(self):
+        """Идентификаторы мастера и воркеров gunicorn."""
+        pid = self.process.pid
+        children = Path(f'/proc/{pid}/task/{pid}/children')
+        try:
+            return [pid, *map(int, children.read_text().split())]
+        except OSError:
+            return [pid]
+
+    def peak_rss(self):
+        """Наибольшая пиковая резидентная память воркера в байтах."""
+        peaks = []
+        for pid in self.pids():
+            try:
+                status = Path(f'/proc/{pid}/status').read_text()
+            except OSError:
+                continue
+            match = re.search(r'VmHWM:\s+(\d+) kB', status)
+            if match:
+                peaks.append(int(match.group(1)) * 1024)
+        return max(peaks, default=None)
+
+
+def summarize(samples, wall_time):
+    """Сводка по замерам: перцентили, пропускная способность, запросы."""
+    latencies = np.array([elapsed for _, elapsed, _ in samples]) * 1000
+    queries = [count for _, _, count in samples if count is not None]
+    statuses = {}
+    for status, _, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    p50, p95, p99 = np.percentile(latencies, (50, 95, 99))
+    return {
+        'requests': len(samples),
+        'errors': sum(status >= 500 for status, _, _ in samples),
+        'statuses': statuses,
+        'mean_ms': round(float(latencies.mean()), 3),
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'throughput_rps': round(len(samples) / wall_time, 2),
+        'queries_per_request': (
+            round(sum(queries) / len(queries), 2) if queries else None),
+    }
+
+
+class Snapshot:
+    """
+    Запоминает последние id пользователей и рецептов и файлы в MEDIA_ROOT.
+
+    restore() удаляет созданные после снимка записи вместе с зависимыми
+    и появившиеся файлы: загруженные изображения рецептов и аватары,
+    включая замененные, на которые записи уже не ссылаются.
+    """
+
+    def __init__(self):
+        self.last_user = User.objects.aggregate(Max('id'))['id__max'] or 0
+        self.last_recipe = Recipe.all_objects.aggregate(
+            Max('id'))['id__max'] or 0
+        self.files = self.media_files()
+
+    @staticmethod
+    def media_files():
+        try:
+            return set(default_storage.listdir('')[1])
+        except FileNotFoundError:
+            return set()
+
+    def restore(self):
+        Recipe.all_objects.filter(id__gt=self.last_recipe).delete()
+        User.objects.filter(id__gt=self.last_user).delete()
+        for name in self.media_files() - self.files:
+            default_storage.delete(name)
+
+
+class PostmanCollection:
+    """
+    Воспроизводит запросы postman-коллекции по порядку.
+
+    Тестовые скрипты коллекции не выполняются. Из них извлекаются только
+    присваивания переменных вида
+    pm.collectionVariables.set("name", value), где value - поле ответа
+    или поле элемента списка в ответе.
+    """
+
+    VARIABLE = re.compile(r'\{\{(\w+)\}\}')
+    LOCAL = re.compile(r'(\w+) = _\.get\(responseData, "(\w+)"\)')
+    SET = re.compile(
+        r'collectionVariables\.set\(["\'](\w+)["\'],\s*(.+?)\)\s*;?\s*$')
+    ITEM_FIELD = re.compile(
+        r'responseData\[(\d+)\]\.(\w+)(\.slice\(0,\s*1\))?$')
+
+    def __init__(self, path):
+        with open(path, encoding='utf-8') as file:
+            self.data = json.load(file)
+
+    def requests(self):
+        """Запросы коллекции с унаследованными настройками авторизации."""
+
+        def walk(items, auth):
+            for item in items:
+                item_auth = item.get('auth') or auth
+                if 'item' in item:
+                    yield from walk(item['item'], item_auth)
+                    continue
+                request = item['request']
+                yield item, request, (
+                    request['auth'] if 'auth' in request and request['auth']
+                    else item_auth)
+
+        yield from walk(self.data['item'], self.data.get('auth'))
+
+    def substitute(self, text, variables):
+        return self.VARIABLE.sub(
+            lambda match: str(variables.get(match.group(1), '')), text)
+
+    def extract(self, item, payload, variables):
+        """Применяет присваивания переменных из тестовых скриптов."""
+        for event in item.get('event', ()):
+            if event.get('listen') != 'test':
+                continue
+            lines = event['script']['exec']
+            fields = dict(
+                match.groups() for match in map(self.LOCAL.search, lines)
+                if match)
+            for match in filter(None, map(self.SET.search, lines)):
+                name, expression = match.groups()
+                value = None
+                item_field = self.ITEM_FIELD.match(expression)
+                if expression in fields and isinstance(payload, dict):
+                    value = payload.get(fields[expression])
+                elif item_field and isinstance(payload, list):
+                    index, field, first_letter = item_field.groups()
+                    if int(index) < len(payload):
+                        value = payload[int(index)].get(field)
+                        if first_letter and value:
+                            value = value[:1]
+                if value is not None:
+                    variables[name] = value
+
+    def replay(self, transport):
+        """Выполняет все запросы; возвращает имена и результаты."""
+        variables = {
+            variable['key']: variable['value']
+            for variable in self.data.get('variable', ())}
+        variables['baseUrl'] = ''
+        results = []
+        for item, request, auth in self.requests():
+            url = request['url']
+            path = self.substitute(
+                url['raw'] if isinstance(url, dict) else url, variables)
+            headers = {
+                header['key']: self.substitute(header['value'], variables)
+                for header in request.get('header', ())
+                if not header.get('disabled')}
+            if auth and auth.get('type') == 'apikey':
+                options = {
+                    option['key']: option['value']
+                    for option in auth['apikey']}
+                if options.get('in', 'header') == 'header':
+                    headers.setdefault(
+                        options['key'],
+                        self.substitute(options['value'], variables))
+            body = request.get('body') or {}
+            raw = (self.substitute(body['raw'], variables).encode()
+                   if body.get('mode') == 'raw' else None)
+            status, content, queries, elapsed = transport.request(
+                request['method'], path, raw, headers)
+            try:
+                payload = json.loads(content)
+            except ValueError:
+                payload = None
+            self.extract(item, payload, variables)
+            results.append((item['name'], (status, elapsed, queries)))
+        return results
@@ -0,0 +1,238 @@
+"""
+Двухуровневый кэш и инвалидация по тегам.
+
+TwoTierCache - бэкенд кэша Django: перед общим для всех процессов
+кэшем (memcached или файловым) стоит LRU-кэш процесса (LocMemCache) с
+коротким временем жизни. Запись идет в оба уровня, чтение - сначала
+из локального.
+
+Значения, зависящие от данных, кэшируются под тегами: к ключу
+добавляются версии тегов, например recipe:15 или user:3:cart. Сигналы
+моделей (api/signals.py) меняют версии затронутых тегов, и старые
+значения перестают находиться во всех процессах. Версии хранятся в
+отдельном хранилище, которое не вытесняет записи: вытесненная версия
+сбрасывала бы все значения тега разом. Процесс запоминает версии на
+CACHE_TAG_VERSION_TIMEOUT секунд: столько другой процесс может видеть
+устаревшее значение.
+Процесс, изменивший данные, видит новую версию сразу.
+"""
+
+import secrets
+import threading
+import time
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.functional import cached_property
+
+from api.constants import CACHE_TAG_VERSION_TIMEOUT, CACHE_TAG_VERSIONS_SIZE
+from api.metrics import record_cache
+
+MISSING = object()
+
+# Версии тегов, известные процессу: тег -> (срок, версия)
+_versions = {}
+_versions_lock = threading.Lock()
+
+
+class TwoTierCache(BaseCache):
+    """
+    Локальный LRU-кэш перед общим кэшем.
+
+    Псевдонимы уровней задаются в OPTIONS как LOCAL и SHARED, хранилища
+    версий тегов - как TAGS (по умолчанию общий уровень). Локальный
+    уровень хранит значения не дольше своего TIMEOUT, поэтому изменения
+    из других процессов становятся видны не позже чем через него.
+    """
+
+    def __init__(self, location, params):
+        options = dict(params.get('OPTIONS', {}))
+        self.local_alias = options.pop('LOCAL', 'local')
+        self.shared_alias = options.pop('SHARED', 'shared')
+        self.tags_alias = options.pop('TAGS', self.shared_alias)
+        super().__init__(dict(params, OPTIONS=options))
+
+    @cached_property
+    def local(self):
+        return caches[self.local_alias]
+
+    @cached_property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    @cached_property
+    def tags(self):
+        return caches[self.tags_alias]
+
+    def _timeouts(self, timeout):
+        """Время жизни значения в общем и в локальном уровне."""
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        local = self.local.default_timeout
+        return timeout, local if timeout is None else min(timeout, local)
+
+    def get(self, key, default=None, version=None):
+        value = self.local.get(key, MISSING, version)
+        record_cache('local', value is not MISSING)
+        if value is not MISSING:
+            return value
+        value = self.shared.get(key, MISSING, version)
+        record_cache('shared', value is not MISSING)
+        if value is MISSING:
+            return default
+        self.local.set(key, value, version=version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = self.local.get_many(keys, version)
+        for key in keys:
+            record_cache('local', key in found)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            shared = self.shared.get_many(missing, version)
+            for key in missing:
+                record_cache('shared', key in shared)
+            if shared:
+                self.local.set_many(shared, version=version)
+                found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        shared, local = self._timeouts(timeout)
+        self.shared.set(key, value, shared, version)
+        self.local.set(key, value, local, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        shared, local = self._timeouts(timeout)
+        failed = self.shared.set_many(data, shared, version)
+        self.local.set_many(data, local, version)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        shared, local = self._timeouts(timeout)
+        if not self.shared.add(key, value, shared, version):
+            return False
+        self.local.set(key, value, local, version)
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.local.delete(key, version)
+        return self.shared.touch(key, self._timeouts(timeout)[0], version)
+
+    def delete(self, key, version=None):
+        self.local.delete(key, version)
+        return self.shared.delete(key, version)
+
+    def has_key(self, key, version=None):
+        return (self.local.has_key(key, version)
+                or self.shared.has_key(key, version))
+
+    def incr(self, key, delta=1, version=None):
+        self.local.delete(key, version)
+        return self.shared.incr(key, delta, version)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+        if self.tags is not self.shared:
+            self.tags.clear()
+        with _versions_lock:
+            _versions.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+
+def shared_cache():
+    """Общий для процессов уровень кэша (корзины токенов)."""
+    return getattr(cache, 'shared', cache)
+
+
+def tag_store():
+    """Хранилище версий тегов."""
+    return getattr(cache, 'tags', cache)
+
+
+def _version_key(tag):
+    return f'tag-version:{tag}'
+
+
+def tag_versions(tags, fresh=False):
+    """
+    Текущие версии тегов; отсутствующим назначается новая версия.
+
+    С fresh=True версии читаются из хранилища, а не из запомненных
+    процессом.
+    """
+    now = time.monotonic()
+    versions = {}
+    with _versions_lock:
+        for tag in () if fresh else tags:
+            entry = _versions.get(tag)
+            if entry is not None and entry[0] > now:
+                versions[tag] = entry[1]
+    missing = [tag for tag in tags if tag not in versions]
+    if missing:
+        store = tag_store()
+        found = store.get_many([_version_key(tag) for tag in missing])
+        for tag in missing:
+            key = _version_key(tag)
+            version = found.get(key)
+            if version is None:
+                store.add(key, secrets.token_hex(6), None)
+                version = store.get(key)
+            versions[tag] = version
+        with _versions_lock:
+            if len(_versions) > CACHE_TAG_VERSIONS_SIZE:
+                _versions.clear()
+            expires = now + CACHE_TAG_VERSION_TIMEOUT
+            for tag in missing:
+                _versions[tag] = (expires, versions[tag])
+    return [versions[tag] for tag in tags]
+
+
+def invalidate(*tags):
+    """Делает недействительными значения, закэшированные под тегами."""
+    versions = {tag: secrets.token_hex(6) for tag in set(tags)}
+    tag_store().set_many(
+        {_version_key(tag): version for tag, version in versions.items()},
+        None)
+    expires = time.monotonic() + CACHE_TAG_VERSION_TIMEOUT
+    with _versions_lock:
+        for tag, version in versions.items():
+            _versions[tag] = (expires, version)
+
+
+def tagged_key(name, key, tags, fresh=False):
+    """Ключ значения name с учетом текущих версий тегов."""
+    return f'{name}:{key}:{".".join(tag_versions(tags, fresh))}'
+
+
+def tagged_keys(name, tags_by_key):
+    """
+    Ключи значений name для нескольких ключей сразу.
+
+    tags_by_key - словарь ключ -> теги; недостающие версии всех тегов
+    читаются из хранилища одним запросом.
+    """
+    tags = list({tag for tags in tags_by_key.values() for tag in tags})
+    versions = dict(zip(tags, tag_versions(tags)))
+    return {
+        key: f'{name}:{key}:{".".join(versions[tag] for tag in key_tags)}'
+        for key, key_tags in tags_by_key.items()}
+
+
+def get_or_set(name, key, tags, compute, timeout):
+    """
+    Значение name из кэша или вычисленное compute().
+
+    Вычисленное значение кэшируется на timeout секунд и до изменения
+    любого из тегов.
+    """
+    full_key = tagged_key(name, key, tags)
+    value = cache.get(full_key, MISSING)
+    record_cache(name, value is not MISSING)
+    if value is MISSING:
+        value = compute()
+        cache.set(full_key, value, timeout)
+    return value
@@ -0,0 +1,57 @@
+"""Проверки настроек проекта."""
+
+from django.apps import apps
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+from django.utils.module_loading import import_string
+
+PATH_SCOPED = 'api.middleware.PathScopedMiddleware'
+
+# Middleware, без которых не работает админка, и проверки админки,
+# которые ищут их только в MIDDLEWARE
+ADMIN_MIDDLEWARE = (
+    ('django.contrib.auth.middleware.AuthenticationMiddleware',
+     'admin.E408'),
+    ('django.contrib.messages.middleware.MessageMiddleware', 'admin.E409'),
+    ('django.contrib.sessions.middleware.SessionMiddleware', 'admin.E410'),
+)
+
+
+def _contains_subclass(class_path, candidate_paths):
+    """Есть ли среди candidate_paths класс class_path или его потомок."""
+    cls = import_string(class_path)
+    for path in candidate_paths:
+        try:
+            candidate = import_string(path)
+        except ImportError:
+            continue
+        if isinstance(candidate, type) and issubclass(candidate, cls):
+            return True
+    return False
+
+
+@register(Tags.admin)
+def check_admin_middleware(app_configs, **kwargs):
+    """
+    Проверки admin.E408-E410 с учетом PATH_SCOPED_MIDDLEWARE.
+
+    Сами проверки админки отключены в SILENCED_SYSTEM_CHECKS: middleware
+    сессий, аутентификации и сообщений подключены не в MIDDLEWARE, а
+    внутри PathScopedMiddleware. Эта проверка требует их в одном из
+    списков, а PathScopedMiddleware - в MIDDLEWARE, если они в его
+    списке.
+    """
+    if not apps.is_installed('django.contrib.admin'):
+        return []
+    scoped = getattr(settings, 'PATH_SCOPED_MIDDLEWARE', [])
+    if not _contains_subclass(PATH_SCOPED, settings.MIDDLEWARE):
+        scoped = []
+    return [
+        Error(
+            f"'{middleware}' должен быть в MIDDLEWARE или в "
+            f"PATH_SCOPED_MIDDLEWARE при подключенном '{PATH_SCOPED}', "
+            f"чтобы работала админка.",
+            id=f'api.{check_id.split(".")[1]}')
+        for middleware, check_id in ADMIN_MIDDLEWARE
+        if not _contains_subclass(
+            middleware, [*settings.MIDDLEWARE, *scoped])]
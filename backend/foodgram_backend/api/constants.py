@@ -3,8 +3,141 @@
 # Минимальное значение количества ингредиента
 MIN_INGREDIENT_AMOUNT = 1
 
-# Минимальное значение количества ингредиента
-MIN_LENGTH_HASH_CODE = 5
-
 # Пользовательские имена, которые нельзя использовать как username
 FORBIDDEN_USERNAME = ('me',)
+
+# Максимальный размер страницы ленты подписок
+MAX_FEED_PAGE_SIZE = 100
+
+# Максимальное количество рецептов, запрашиваемых по списку id
+MAX_RECIPES_MULTI_GET = 100
+
+# Границы корзин гистограммы времени обработки запроса, секунды
+METRICS_LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Границы корзин гистограммы количества SQL-запросов на запрос
+METRICS_QUERIES_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# Минимальный интервал обновления метрики памяти воркера, секунды
+METRICS_MEMORY_INTERVAL = 5
+
+# Минимальный интервал между проверками доступности реплики, секунды
+REPLICA_HEALTH_CHECK_INTERVAL = 5
+
+# Cookie со временем, до которого чтение клиента идет с основной базы
+REPLICA_STICKY_COOKIE = 'db_primary_until'
+
+# Префикс ключей кэша, закрепляющих клиента за основной базой
+REPLICA_STICKY_CACHE_PREFIX = 'db-primary:'
+
+# Размер части списка покупок, отдаваемой клиенту за раз, байты
+SHOPPING_CART_CHUNK_SIZE = 64 * 1024
+
+# Время хранения найденного рецепта в кэше коротких ссылок, секунды
+SHORT_LINK_CACHE_TIMEOUT = 600
+
+# Время хранения ненайденного кода в кэше коротких ссылок, секунды
+SHORT_LINK_NEGATIVE_CACHE_TIMEOUT = 60
+
+# Доля ложноположительных ответов фильтра коротких кодов
+SHORT_LINK_FILTER_ERROR_RATE = 0.01
+
+# Интервал перестроения фильтра коротких кодов, секунды
+SHORT_LINK_FILTER_REFRESH = 600
+
+# Время кэширования редиректа с короткой ссылки клиентами, секунды
+SHORT_LINK_REDIRECT_MAX_AGE = 3600
+
+# Время, на которое процесс запоминает версию тега кэша, секунды
+CACHE_TAG_VERSION_TIMEOUT = 1
+
+# Максимальное количество версий тегов, запоминаемых процессом
+CACHE_TAG_VERSIONS_SIZE = 10000
+
+# Время хранения множеств избранного, корзины и подписок пользователя
+# в кэше, секунды
+INTERACTIONS_CACHE_TIMEOUT = 600
+
+# Наибольший размер множества, по которому рецепты фильтруются через
+# id__in; для больших множеств фильтр соединяет таблицы
+INTERACTIONS_IN_LIMIT = 1000
+
+# Время хранения закодированных карточек рецептов и авторов, секунды
+RECIPE_CARD_CACHE_TIMEOUT = 3600
+
+# Количество записей в ответе синхронизации по умолчанию
+SYNC_BATCH_SIZE = 500
+
+# Максимальное количество записей в ответе синхронизации
+SYNC_MAX_BATCH_SIZE = 2000
+
+# Возраст записей, начиная с которого они отдаются синхронизации,
+# секунды: изменения незавершенных транзакций не должны оказаться
+# позади курсора
+SYNC_SETTLE_SECONDS = 2
+
+# Путь потока событий пользователя (обслуживается только через ASGI)
+EVENTS_PATH = '/api/events/'
+
+# Интервал проверки новых событий процессом, секунды
+EVENTS_POLL_INTERVAL = 1
+
+# Наибольшая пауза перед повтором опроса событий после ошибки, секунды
+EVENTS_POLL_MAX_BACKOFF = 30
+
+# Количество событий, читаемых из базы одним запросом
+EVENTS_BATCH_SIZE = 100
+
+# Количество событий в очереди соединения; при переполнении соединение
+# дочитывает пропущенное из базы
+EVENTS_QUEUE_SIZE = 100
+
+# Интервал отправки комментария, удерживающего соединение, секунды
+EVENTS_HEARTBEAT_INTERVAL = 15
+
+# Время жизни соединения, после которого клиент переподключается с
+# Last-Event-ID, секунды
+EVENTS_MAX_AGE = 600
+
+# Пауза перед переподключением клиента, миллисекунды
+EVENTS_RETRY_MS = 3000
+
+# Время действия одноразового билета для подключения к потоку событий,
+# секунды
+EVENTS_TICKET_TIMEOUT = 30
+
+# Корзины токенов клиента (IP-адреса, пользователя или учетной записи)
+# для дорогих запросов: вместимость и токенов в минуту
+THROTTLE_CLIENT_BUCKETS = {
+    'login': (10, 10),
+    'password': (5, 5),
+    'upload': (20, 20),
+}
+
+# Общие корзины токенов классов дорогих запросов всех клиентов:
+# вместимость и токенов в минуту
+THROTTLE_TOTAL_BUCKETS = {
+    'login': (60, 600),
+    'password': (30, 300),
+    'upload': (60, 600),
+}
+
+# Загрузка процессора (средняя за минуту на ядро), с которой запросы
+# расходуют из общих корзин больше токенов
+THROTTLE_LOAD_START = 0.7
+
+# Загрузка процессора, при которой запрос расходует из общей корзины
+# больше всего токенов
+THROTTLE_LOAD_LIMIT = 1.5
+
+# Наибольшее количество токенов общей корзины на один запрос
+THROTTLE_MAX_COST = 10
+
+# Количество корзин в памяти процесса, которыми ограничение частоты
+# пользуется, пока общий кэш недоступен
+THROTTLE_LOCAL_BUCKETS_SIZE = 10000
+
+# Начала путей, запросы к которым проходят мимо PATH_SCOPED_MIDDLEWARE:
+# API аутентифицируется токеном и не использует сессии, CSRF и сообщения
+LEAN_MIDDLEWARE_PATHS = ('/api/',)
@@ -0,0 +1,7 @@
+from django.db.backends.postgresql import base
+
+from api.db_connections import HealthCheckMixin
+
+
+class DatabaseWrapper(HealthCheckMixin, base.DatabaseWrapper):
+    """Бэкенд postgresql с проверкой постоянных соединений."""
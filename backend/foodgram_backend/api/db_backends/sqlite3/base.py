@@ -0,0 +1,7 @@
+from django.db.backends.sqlite3 import base
+
+from api.db_connections import HealthCheckMixin
+
+
+class DatabaseWrapper(HealthCheckMixin, base.DatabaseWrapper):
+    """Бэкенд sqlite3 с проверкой постоянных соединений."""
@@ -0,0 +1,45 @@
+"""
+Проверка постоянных соединений с базой данных.
+
+При CONN_MAX_AGE > 0 соединение переживает запрос и может быть
+разорвано сервером базы между запросами: перезапуск, таймаут простоя,
+переключение реплики. С CONN_HEALTH_CHECKS соединение, оставшееся от
+прошлого запроса, проверяется один раз - перед первым обращением к
+нему в новом запросе, и неработающее закрывается, чтобы обращение
+открыло новое вместо ошибки. Соединения, к которым запрос не
+обращается, и только что открытые не проверяются. Аналог
+CONN_HEALTH_CHECKS из Django 4.1; бэкенды с проверкой - в
+api/db_backends.
+"""
+
+from django.conf import settings
+
+
+class HealthCheckMixin:
+    """Проверка соединения при первом обращении к нему в запросе."""
+
+    health_check_done = False
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        # Вызывается в начале и в конце каждого запроса
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def close_if_health_check_failed(self):
+        """Закрывает соединение, если оно перестало отвечать."""
+        if (self.connection is None
+                or not settings.CONN_HEALTH_CHECKS
+                or self.health_check_done
+                or self.in_atomic_block):
+            return
+        if not self.is_usable():
+            self.close()
+        self.health_check_done = True
+
+    def _cursor(self, *args, **kwargs):
+        self.close_if_health_check_failed()
+        return super()._cursor(*args, **kwargs)
@@ -0,0 +1,159 @@
+"""
+Чтение с реплик базы данных.
+
+Реплики - все базы из DATABASES, кроме default. Запись всегда идет в
+default. Чтение уходит на реплику только внутри запроса, который
+ReplicaRoutingMiddleware пометил как подходящий: безопасный метод,
+представление с атрибутом use_read_replica и клиент, не закрепленный
+за основной базой после недавней записи. Во всех остальных случаях
+роутер не вмешивается и чтение идет с default.
+
+Доступность реплики проверяется не чаще раза в
+REPLICA_HEALTH_CHECK_INTERVAL секунд в каждом процессе; недоступная
+или отставшая больше чем на DB_REPLICA_MAX_LAG секунд реплика не
+используется, пока следующая проверка не пройдет.
+"""
+
+import hashlib
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.throttling import BaseThrottle
+
+from api.constants import (REPLICA_HEALTH_CHECK_INTERVAL,
+                           REPLICA_STICKY_CACHE_PREFIX,
+                           REPLICA_STICKY_COOKIE)
+
+_read_database = ContextVar('read_database', default=None)
+
+# Результаты проверок реплик: псевдоним -> (время проверки, доступна)
+_health = {}
+
+# Отставание реплики PostgreSQL; 0, если все полученные изменения
+# применены, иначе время с последнего примененного изменения
+REPLICATION_LAG_SQL = (
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() '
+    'THEN 0 ELSE EXTRACT(EPOCH FROM now() - '
+    'pg_last_xact_replay_timestamp()) END')
+
+
+def replicas():
+    """Псевдонимы реплик."""
+    return [alias for alias in settings.DATABASES
+            if alias != DEFAULT_DB_ALIAS]
+
+
+def current_read_database():
+    """База, с которой читает текущий запрос; None - основная."""
+    return _read_database.get()
+
+
+def use_database(alias):
+    """Направляет чтение текущего запроса в базу alias."""
+    return _read_database.set(alias)
+
+
+def reset_database(token):
+    _read_database.reset(token)
+
+
+def check_replica(alias):
+    """Проверяет, что реплика отвечает и не слишком отстала."""
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor != 'postgresql':
+                cursor.execute('SELECT 1')
+                return True
+            cursor.execute(REPLICATION_LAG_SQL)
+            lag = cursor.fetchone()[0]
+    except DatabaseError:
+        connection.close()
+        return False
+    return lag is None or lag <= settings.DB_REPLICA_MAX_LAG
+
+
+def is_healthy(alias):
+    checked_at, healthy = _health.get(alias, (None, False))
+    now = time.monotonic()
+    if checked_at is None or now - checked_at >= (
+            REPLICA_HEALTH_CHECK_INTERVAL):
+        healthy = check_replica(alias)
+        _health[alias] = (now, healthy)
+    return healthy
+
+
+def mark_unhealthy(alias):
+    """Исключает реплику до следующей проверки."""
+    _health[alias] = (time.monotonic(), False)
+    connections[alias].close()
+
+
+def choose_replica():
+    """Случайная доступная реплика или None, если таких нет."""
+    available = [alias for alias in replicas() if is_healthy(alias)]
+    return random.choice(available) if available else None
+
+
+def client_keys(request):
+    """
+    Ключи кэша, по которым клиент закрепляется за основной базой.
+
+    Клиент с токеном определяется по хэшу заголовка Authorization,
+    анонимный - по IP. Вход выполняется анонимно, поэтому чтение
+    сразу после получения токена тоже проверяется по IP. IP берется из
+    X-Forwarded-For с учетом NUM_PROXIES, как в ограничении частоты.
+    """
+    address = BaseThrottle().get_ident(request)
+    keys = [f'{REPLICA_STICKY_CACHE_PREFIX}ip:{address}']
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if authorization:
+        digest = hashlib.sha256(authorization.encode()).hexdigest()
+        keys.append(f'{REPLICA_STICKY_CACHE_PREFIX}token:{digest}')
+    return keys
+
+
+def is_sticky(request):
+    """Писал ли клиент в последние DB_REPLICA_STICKY_SECONDS секунд."""
+    try:
+        if float(request.COOKIES.get(REPLICA_STICKY_COOKIE, 0)) > (
+                time.time()):
+            return True
+    except ValueError:
+        pass
+    return bool(cache.get_many(client_keys(request)))
+
+
+def stick_to_primary(request, response):
+    """
+    Закрепляет клиента за основной базой после записи.
+
+    Кэш работает для любых клиентов, если он общий для воркеров;
+    cookie - для браузера и при локальном кэше в каждом воркере.
+    """
+    timeout = settings.DB_REPLICA_STICKY_SECONDS
+    keys = client_keys(request)
+    cache.set(keys[-1], 1, timeout)
+    response.set_cookie(
+        REPLICA_STICKY_COOKIE, f'{time.time() + timeout:.0f}',
+        max_age=timeout, httponly=True, samesite='Lax')
+
+
+class ReplicaRouter:
+    """Роутер: чтение с выбранной для запроса базы, запись в default."""
+
+    def db_for_read(self, model, **hints):
+        return _read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
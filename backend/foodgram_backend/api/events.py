@@ -0,0 +1,369 @@
+"""
+Поток событий пользователя (Server-Sent Events).
+
+GET /api/events/ держит соединение и отправляет события изменения
+избранного, списка покупок и подписок пользователя и публикации
+рецептов авторами, на которых он подписан (recipes.models.UserEvent).
+Django 3.2 не отдает асинхронные потоковые ответы, поэтому поток -
+отдельное ASGI-приложение, которое foodgram_backend/asgi.py ставит
+перед Django; при запуске через WSGI этого эндпоинта нет.
+
+Новые события читает из базы один опрос на процесс (EventHub) и
+раскладывает по очередям соединений ограниченного размера. id события -
+его id в базе: клиент, переподключаясь с Last-Event-ID, сначала
+получает пропущенные события из базы. Соединение с переполненной
+очередью так же дочитывает пропущенное из базы, поэтому память на
+соединение не растет вместе с потоком событий. Ошибка опроса (например,
+недоступна база) не останавливает его: опрос повторяется с растущей
+паузой, а соединения ждут.
+
+EventSource в браузере не задает заголовки, поэтому вместо токена в
+адресе передается одноразовый билет (?ticket=), выданный
+POST /api/events/ticket/: адреса попадают в журналы nginx и gunicorn,
+а билет после подключения или через EVENTS_TICKET_TIMEOUT секунд уже
+недействителен.
+"""
+
+import asyncio
+import json
+import logging
+import re
+import secrets
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.db.models import Q
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated
+
+from api.cache import shared_cache
+from api.constants import (EVENTS_BATCH_SIZE, EVENTS_HEARTBEAT_INTERVAL,
+                           EVENTS_MAX_AGE, EVENTS_POLL_INTERVAL,
+                           EVENTS_POLL_MAX_BACKOFF, EVENTS_QUEUE_SIZE,
+                           EVENTS_RETRY_MS, EVENTS_TICKET_TIMEOUT)
+from api.interactions import interactions
+from recipes.models import User, UserEvent
+
+logger = logging.getLogger(__name__)
+
+# Поля события в том порядке, в котором они читаются из базы
+FIELDS = ('id', 'user_id', 'author_id', 'kind', 'object_id', 'added')
+
+HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    # nginx не должен буферизовать поток
+    (b'x-accel-buffering', b'no'),
+]
+
+
+def database(function):
+    """Выполняет function в потоке с соединением с базой."""
+    def run(*args):
+        close_old_connections()
+        try:
+            return function(*args)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def _ticket_key(ticket):
+    return f'events-ticket:{ticket}'
+
+
+def issue_ticket(user_id):
+    """Одноразовый билет для подключения пользователя к потоку."""
+    ticket = secrets.token_urlsafe(32)
+    shared_cache().set(_ticket_key(ticket), user_id, EVENTS_TICKET_TIMEOUT)
+    return ticket
+
+
+def redeem_ticket(ticket):
+    """id пользователя по билету или None; билет действует один раз."""
+    if not re.fullmatch(r'[\w-]{1,64}', ticket, re.ASCII):
+        return None
+    store = shared_cache()
+    user_id = store.get(_ticket_key(ticket))
+    # Из одновременных подключений с одним билетом проходит то, которое
+    # удалило его первым
+    if user_id is None or not store.delete(_ticket_key(ticket)):
+        return None
+    return user_id
+
+
+@database
+def authenticate(key=None, ticket=None):
+    """
+    id пользователя по токену или билету и id авторов, на которых он
+    подписан.
+    """
+    if key is not None:
+        user, _ = TokenAuthentication().authenticate_credentials(key)
+    else:
+        user_id = redeem_ticket(ticket)
+        user = user_id and User.objects.filter(
+            pk=user_id, is_active=True).first()
+        if not user:
+            raise AuthenticationFailed(
+                'Недействительный или уже использованный билет.')
+    return user.pk, set(interactions(user).follows)
+
+
+@database
+def fetch_events(after, user_id=None, follows=()):
+    """События после id after: все или только для пользователя."""
+    queryset = UserEvent.objects.filter(id__gt=after)
+    if user_id is not None:
+        queryset = queryset.filter(
+            Q(user_id=user_id) | Q(author_id__in=follows))
+    return list(queryset.order_by('id').values_list(
+        *FIELDS)[:EVENTS_BATCH_SIZE])
+
+
+@database
+def last_event_id():
+    return UserEvent.objects.order_by('-id').values_list(
+        'id', flat=True).first() or 0
+
+
+@database
+def pruned_after(event_id):
+    """Признак, что события после event_id могли быть уже удалены."""
+    first = UserEvent.objects.order_by('id').values_list(
+        'id', flat=True).first()
+    return first is not None and event_id < first - 1
+
+
+def encode(event):
+    event_id, _, author_id, kind, object_id, added = event
+    data = {'id': object_id}
+    if kind == 'recipe':
+        data['author'] = author_id
+    else:
+        data['added'] = added
+    return (f'id: {event_id}\nevent: {kind}\n'
+            f'data: {json.dumps(data)}\n\n').encode()
+
+
+class Connection:
+    """Очередь событий одного клиента."""
+
+    def __init__(self, user_id, follows, last_id):
+        self.user_id = user_id
+        self.follows = follows
+        self.last_id = last_id
+        self.queue = asyncio.Queue(EVENTS_QUEUE_SIZE)
+        self.overflow = False
+
+    def offer(self, event):
+        """Ставит событие в очередь, если оно адресовано клиенту."""
+        if self.overflow or event[0] <= self.last_id:
+            return
+        if event[1] != self.user_id and event[2] not in self.follows:
+            return
+        # Подписки учитываются сразу: следующие события той же пачки
+        # могут быть от нового автора
+        self.track_follows(event)
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflow = True
+
+    def accept(self, event):
+        """Учитывает событие перед отправкой; False, если оно уже было."""
+        if event[0] <= self.last_id:
+            return False
+        self.last_id = event[0]
+        self.track_follows(event)
+        return True
+
+    def track_follows(self, event):
+        _, user_id, _, kind, object_id, added = event
+        if kind == 'follow' and user_id == self.user_id:
+            if added:
+                self.follows.add(object_id)
+            else:
+                self.follows.discard(object_id)
+
+    def reset_overflow(self):
+        """Очищает переполненную очередь: пропущенное дочитается из базы."""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.overflow = False
+
+
+class EventHub:
+    """Опрос новых событий, общий для соединений процесса."""
+
+    def __init__(self):
+        self.connections = set()
+        self.task = None
+        self.ready = None
+        self.last_id = None
+
+    def subscribe(self, connection):
+        self.connections.add(connection)
+        if self.task is None or self.task.done():
+            self.ready = asyncio.Event()
+            self.task = asyncio.ensure_future(self.poll())
+
+    def unsubscribe(self, connection):
+        self.connections.discard(connection)
+
+    async def poll(self):
+        """
+        Раскладывает новые события по очередям, пока есть соединения.
+
+        ready устанавливается, когда известна позиция, с которой начат
+        опрос. После ошибки чтения из базы опрос повторяется через паузу,
+        которая удваивается до EVENTS_POLL_MAX_BACKOFF.
+        """
+        backoff = EVENTS_POLL_INTERVAL
+        while self.connections:
+            try:
+                if not self.ready.is_set():
+                    self.last_id = await last_event_id()
+                    self.ready.set()
+                events = await fetch_events(self.last_id)
+            except Exception:
+                logger.exception(
+                    'Ошибка опроса событий, повтор через %s с.', backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, EVENTS_POLL_MAX_BACKOFF)
+                continue
+            backoff = EVENTS_POLL_INTERVAL
+            for event in events:
+                for connection in list(self.connections):
+                    connection.offer(event)
+            if events:
+                self.last_id = events[-1][0]
+            if len(events) < EVENTS_BATCH_SIZE:
+                await asyncio.sleep(EVENTS_POLL_INTERVAL)
+
+
+hub = EventHub()
+
+
+async def catch_up(connection, write):
+    """
+    Отправляет из базы события клиента после connection.last_id.
+
+    Вызывается после подписки на hub, когда опрос уже начался: события
+    до его позиции читаются здесь, после - приходят в очередь.
+    """
+    while True:
+        events = await fetch_events(
+            connection.last_id, connection.user_id, connection.follows)
+        for event in events:
+            if connection.accept(event):
+                await write(encode(event))
+        if len(events) < EVENTS_BATCH_SIZE:
+            return
+
+
+async def stream(connection, write, resume, disconnected):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + EVENTS_MAX_AGE
+    await write(f'retry: {EVENTS_RETRY_MS}\n\n'.encode())
+    await hub.ready.wait()
+    if resume:
+        if await pruned_after(connection.last_id):
+            await write(b'event: reset\ndata: {}\n\n')
+        await catch_up(connection, write)
+    while not disconnected.done():
+        timeout = min(EVENTS_HEARTBEAT_INTERVAL, deadline - loop.time())
+        if timeout <= 0:
+            return
+        if connection.overflow:
+            connection.reset_overflow()
+            await catch_up(connection, write)
+            continue
+        getter = asyncio.ensure_future(connection.queue.get())
+        done, _ = await asyncio.wait(
+            {getter, disconnected}, timeout=timeout,
+            return_when=asyncio.FIRST_COMPLETED)
+        if getter not in done:
+            getter.cancel()
+            if not disconnected.done():
+                await write(b': ping\n\n')
+            continue
+        event = getter.result()
+        if connection.accept(event):
+            await write(encode(event))
+
+
+async def respond(send, status, detail, headers=()):
+    await send({
+        'type': 'http.response.start', 'status': status,
+        'headers': [(b'content-type', b'application/json'), *headers]})
+    await send({
+        'type': 'http.response.body',
+        'body': json.dumps({'detail': str(detail)},
+                           ensure_ascii=False).encode()})
+
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+def _token(headers):
+    keyword, _, key = headers.get(b'authorization', b'').decode(
+        'latin-1').partition(' ')
+    if keyword == TokenAuthentication.keyword and key:
+        return key.strip()
+    return None
+
+
+def _last_event_id(headers, query):
+    value = headers.get(b'last-event-id', b'').decode('latin-1') or (
+        query.get('last_event_id', [''])[0])
+    return int(value) if value.isdigit() else None
+
+
+async def events_app(scope, receive, send):
+    """
+    ASGI-приложение потока событий.
+
+    Токен передается в заголовке Authorization или, так как EventSource
+    в браузере не задает заголовки, вместо него передается билет в
+    параметре ticket.
+    """
+    if scope['method'] != 'GET':
+        await respond(send, 405, 'Метод не разрешен.',
+                      [(b'allow', b'GET')])
+        return
+    headers = dict(scope['headers'])
+    query = parse_qs(scope['query_string'].decode('latin-1'))
+    key = _token(headers)
+    ticket = query.get('ticket', [None])[0]
+    keyword = TokenAuthentication.keyword.encode()
+    if key is None and ticket is None:
+        await respond(send, 401, NotAuthenticated.default_detail,
+                      [(b'www-authenticate', keyword)])
+        return
+    try:
+        user_id, follows = await authenticate(key, ticket)
+    except AuthenticationFailed as error:
+        await respond(send, 401, error.detail,
+                      [(b'www-authenticate', keyword)])
+        return
+    last_id = _last_event_id(headers, query)
+    connection = Connection(user_id, follows, last_id or 0)
+
+    async def write(chunk):
+        await send({'type': 'http.response.body', 'body': chunk,
+                    'more_body': True})
+
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': HEADERS})
+    hub.subscribe(connection)
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        await stream(connection, write, last_id is not None, disconnected)
+    finally:
+        hub.unsubscribe(connection)
+        disconnected.cancel()
+    await send({'type': 'http.response.body', 'body': b''})
@@ -0,0 +1,208 @@
+"""
+Быстрое формирование списков рецептов.
+
+Строки ответа собираются из кортежей values_list() и заранее
+сгруппированных связей в обычные словари, минуя построение моделей
+и вызовы to_representation() у каждого поля DRF. Схема ответа
+совпадает с RecipeSerializer.
+
+recipe_fragments() кэширует эти строки без флагов пользователя уже
+закодированными в JSON и собирает из них ответ, вставляя флаги.
+"""
+
+from collections import defaultdict
+from hashlib import md5
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+
+from api.cache import tagged_keys
+from api.constants import RECIPE_CARD_CACHE_TIMEOUT
+from api.interactions import interactions
+from api.renderers import Fragment, orjson
+from recipes.models import Recipe, RecipeIngredient, User
+
+
+class MediaUrls:
+    """Абсолютные ссылки на файлы без build_absolute_uri для каждого."""
+
+    def __init__(self, request):
+        self.origin = request.build_absolute_uri('/')[:-1]
+
+    def __call__(self, name):
+        if not name:
+            return None
+        url = default_storage.url(name)
+        return self.origin + url if url.startswith('/') else url
+
+
+def author_rows(author_ids, media_url):
+    """Представления авторов без флага подписки: id -> словарь."""
+    authors = {}
+    for author_id, username, email, first_name, last_name, avatar in (
+            User.objects.filter(id__in=author_ids).values_list(
+                'id', 'username', 'email', 'first_name', 'last_name',
+                'avatar')):
+        authors[author_id] = {
+            'id': author_id,
+            'username': username,
+            'email': email,
+            'first_name': first_name,
+            'last_name': last_name,
+            'avatar': media_url(avatar),
+        }
+    return authors
+
+
+def recipe_rows(recipe_ids, request, flags=True):
+    """
+    Возвращает представления рецептов в порядке recipe_ids.
+
+    Отсутствующие (удаленные) рецепты пропускаются. С flags=False в
+    представлениях нет флагов текущего пользователя: is_subscribed,
+    is_favorited и is_in_shopping_cart.
+    """
+    media_url = MediaUrls(request)
+    recipes = Recipe.objects.filter(id__in=recipe_ids).values_list(
+        'id', 'name', 'image', 'text', 'cooking_time', 'author_id')
+    recipes = {recipe[0]: recipe for recipe in recipes}
+    authors = author_rows(
+        {recipe[5] for recipe in recipes.values()}, media_url)
+    if flags:
+        user_sets = interactions(request.user)
+        for author_id, author in authors.items():
+            author['is_subscribed'] = author_id in user_sets.follows
+
+    tags = defaultdict(list)
+    for recipe_id, tag_id, name, slug in Recipe.tags.through.objects.filter(
+            recipe_id__in=list(recipes)).order_by(
+            'recipe_id', 'tag__name', 'tag_id').values_list(
+            'recipe_id', 'tag_id', 'tag__name', 'tag__slug'):
+        tags[recipe_id].append({'id': tag_id, 'name': name, 'slug': slug})
+
+    ingredients = defaultdict(list)
+    for recipe_id, ingredient_id, name, unit, amount in (
+            RecipeIngredient.objects.filter(
+                recipe_id__in=list(recipes)).order_by(
+                'id').values_list(
+                'recipe_id', 'ingredient_id', 'ingredient__name',
+                'ingredient__measurement_unit', 'amount')):
+        ingredients[recipe_id].append({
+            'id': ingredient_id,
+            'name': name,
+            'measurement_unit': unit,
+            'amount': amount,
+        })
+
+    rows = []
+    for recipe_id in recipe_ids:
+        if recipe_id not in recipes:
+            continue
+        _, name, image, text, cooking_time, author_id = recipes[recipe_id]
+        row = {
+            'id': recipe_id,
+            'author': authors[author_id],
+            'name': name,
+            'image': media_url(image),
+            'text': text,
+            'ingredients': ingredients[recipe_id],
+            'tags': tags[recipe_id],
+            'cooking_time': cooking_time,
+        }
+        if flags:
+            row['is_favorited'] = recipe_id in user_sets.favorites
+            row['is_in_shopping_cart'] = recipe_id in user_sets.cart
+        rows.append(row)
+    return rows
+
+
+def _encode_author(author):
+    """Автор без закрывающей скобки: дальше дописывается is_subscribed."""
+    return orjson.dumps(author)[:-1]
+
+
+def _flag(value):
+    return b'true' if value else b'false'
+
+
+def _cached(name, tags_by_id, origin):
+    """Ключи кэша для id и значения, найденные в кэше по ним."""
+    keys = tagged_keys(name, {
+        f'{pk}:{origin}': tags for pk, tags in tags_by_id.items()})
+    keys = {pk: keys[f'{pk}:{origin}'] for pk in tags_by_id}
+    found = cache.get_many(list(keys.values()))
+    return keys, {pk: found[key] for pk, key in keys.items() if key in found}
+
+
+def recipe_fragments(recipe_ids, request):
+    """
+    Представления рецептов в порядке recipe_ids в виде orjson.Fragment.
+
+    Общая для всех пользователей часть рецепта и его автора хранится в
+    кэше закодированной, флаги текущего пользователя вставляются при
+    сборке ответа. Карточка рецепта устаревает вместе с рецептом, его
+    тегами и ингредиентами, карточка автора - вместе с автором.
+    Отсутствующие и удаленные рецепты пропускаются: id проверяются
+    одним запросом к опубликованным рецептам.
+    """
+    # Карточки в кэше не проверяют, опубликован ли рецепт: удаленные
+    # отбрасываются до сборки
+    published = set(Recipe.objects.filter(id__in=recipe_ids).values_list(
+        'id', flat=True))
+    recipe_ids = [pk for pk in recipe_ids if pk in published]
+    media_url = MediaUrls(request)
+    origin = md5(media_url.origin.encode()).hexdigest()[:8]
+    keys, cards = _cached('recipe-card', {
+        pk: (f'recipe:{pk}', 'tags', 'ingredients') for pk in recipe_ids},
+        origin)
+    authors = {}
+    missing = [pk for pk in recipe_ids if pk not in cards]
+    if missing:
+        built = {}
+        for row in recipe_rows(missing, request, flags=False):
+            recipe_id, author = row.pop('id'), row.pop('author')
+            authors[author['id']] = _encode_author(author)
+            cards[recipe_id] = built[keys[recipe_id]] = (
+                author['id'], orjson.dumps(row)[1:-1])
+        cache.set_many(built, RECIPE_CARD_CACHE_TIMEOUT)
+
+    author_keys, cached_authors = _cached('author-card', {
+        author_id: (f'user:{author_id}',)
+        for author_id, _ in cards.values()}, origin)
+    missing = set(author_keys) - set(authors) - set(cached_authors)
+    if missing:
+        authors.update(
+            (author_id, _encode_author(author))
+            for author_id, author in author_rows(missing, media_url).items())
+    cache.set_many({
+        author_keys[author_id]: author
+        for author_id, author in authors.items()
+        if author_id not in cached_authors}, RECIPE_CARD_CACHE_TIMEOUT)
+    authors.update(cached_authors)
+
+    user_sets = interactions(request.user)
+    fragments = []
+    for recipe_id in recipe_ids:
+        if recipe_id not in cards or cards[recipe_id][0] not in authors:
+            continue
+        author_id, body = cards[recipe_id]
+        fragments.append(Fragment(b''.join((
+            b'{"id":%d,"author":' % recipe_id, authors[author_id],
+            b',"is_subscribed":', _flag(author_id in user_sets.follows),
+            b'},', body,
+            b',"is_favorited":', _flag(recipe_id in user_sets.favorites),
+            b',"is_in_shopping_cart":', _flag(recipe_id in user_sets.cart),
+            b'}'))))
+    return fragments
+
+
+def recipe_payloads(recipe_ids, request):
+    """
+    Полные представления рецептов в порядке recipe_ids.
+
+    Собираются из карточек, если orjson поддерживает Fragment, иначе
+    быстрым путем без кэша.
+    """
+    if Fragment is None:
+        return recipe_rows(recipe_ids, request)
+    return recipe_fragments(recipe_ids, request)
@@ -2,6 +2,8 @@
 
 from django_filters import (AllValuesMultipleFilter, CharFilter, FilterSet)
 
+from api.constants import INTERACTIONS_IN_LIMIT
+from api.interactions import interactions
 from recipes.models import Ingredient, Recipe
 
 
@@ -26,14 +28,28 @@ class RecipeFilter(FilterSet):
         model = Recipe
         fields = ('tags', 'author', 'is_in_shopping_cart', 'is_favorited')
 
+    def filter_user_recipes(self, queryset, kind, **lookup):
+        """
+        Оставляет рецепты из множества kind пользователя.
+
+        Небольшое множество подставляется в id__in, для большого таблицы
+        соединяются по lookup.
+        """
+        recipe_ids = interactions(self.request.user).get(kind)
+        if len(recipe_ids) > INTERACTIONS_IN_LIMIT:
+            return queryset.filter(**lookup)
+        return queryset.filter(id__in=list(recipe_ids))
+
     def filter_is_in_shopping_cart(self, queryset, name, value):
         """Фильтр для наличия рецепта в корзине."""
         if self.request.user.is_authenticated and value == '1':
-            return queryset.filter(shopping_carts__user=self.request.user)
+            return self.filter_user_recipes(
+                queryset, 'cart', shopping_carts__user=self.request.user)
         return queryset
 
     def filter_is_favorited(self, queryset, name, value):
         """Фильтр для наличия рецепта в избранном."""
         if self.request.user.is_authenticated and value == '1':
-            return queryset.filter(favorites__user=self.request.user)
+            return self.filter_user_recipes(
+                queryset, 'favorites', favorites__user=self.request.user)
         return queryset
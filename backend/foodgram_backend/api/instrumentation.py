@@ -0,0 +1,108 @@
+"""
+Замеры времени обработки запроса.
+
+Замеры текущего запроса хранятся в contextvar и заполняются
+middleware (SQL-запросы, отрисовка ответа) и сериализаторами.
+Если замер для запроса не ведется, span() сводится к одной
+проверке contextvar.
+"""
+
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+_current_timings = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Замеры времени одного запроса в миллисекундах."""
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.durations = defaultdict(float)
+        self.queries = 0
+        self.view = None
+        self.total = None
+        self._open = {}
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """Обертка connection.execute_wrapper для учета SQL-запросов."""
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.durations['db'] += (perf_counter() - started) * 1000
+            self.queries += 1
+
+    def start(self, name):
+        """Начинает замер; повторный вызов внутри замера игнорируется."""
+        if name in self._open:
+            return False
+        self._open[name] = (perf_counter(), self.durations['db'])
+        return True
+
+    def stop(self, name):
+        """Завершает замер, исключая из него время SQL-запросов."""
+        started, db_started = self._open.pop(name)
+        elapsed = (perf_counter() - started) * 1000
+        self.durations[name] += elapsed - (
+            self.durations['db'] - db_started)
+
+    def finish(self):
+        self.total = (perf_counter() - self.started) * 1000
+
+    def header(self):
+        """Значение заголовка Server-Timing."""
+        metrics = [f'db;dur={self.durations["db"]:.1f};'
+                   f'desc="{self.queries} queries"']
+        metrics.extend(
+            f'{name};dur={duration:.1f}'
+            for name, duration in self.durations.items() if name != 'db')
+        metrics.append(f'total;dur={self.total:.1f}')
+        return ', '.join(metrics)
+
+    def as_dict(self):
+        data = {
+            'view': self.view,
+            'queries': self.queries,
+            'total_ms': round(self.total, 2),
+        }
+        data.update(
+            (f'{name}_ms', round(duration, 2))
+            for name, duration in self.durations.items())
+        return data
+
+
+def activate(timings):
+    """Делает замеры текущими; возвращает токен для deactivate()."""
+    return _current_timings.set(timings)
+
+
+def deactivate(token):
+    _current_timings.reset(token)
+
+
+def current_timings():
+    return _current_timings.get()
+
+
+@contextmanager
+def span(name):
+    """Учитывает время блока кода в замерах текущего запроса."""
+    timings = _current_timings.get()
+    if timings is None or not timings.start(name):
+        yield
+        return
+    try:
+        yield
+    finally:
+        timings.stop(name)
+
+
+class TimedSerializerMixin:
+    """Учитывает время to_representation() в замере serialize."""
+
+    def to_representation(self, instance):
+        with span('serialize'):
+            return super().to_representation(instance)
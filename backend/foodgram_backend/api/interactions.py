@@ -0,0 +1,114 @@
+"""
+Избранное, корзина и подписки пользователя в виде множеств id.
+
+Флаги is_favorited, is_in_shopping_cart и is_subscribed проверяются по
+отсортированным массивам id избранных рецептов, рецептов в корзине и
+авторов, на которых подписан пользователь, без соединения выборок с
+этими таблицами. Каждый массив загружается одним запросом и хранится в
+кэше под тегом пользователя (api/cache.py). Добавление и удаление
+(api/signals.py) сбрасывают тег, и следующее чтение загружает массив
+из базы заново: правка массива в кэше на месте не атомарна, и
+одновременные изменения затирали бы друг друга.
+"""
+
+from array import array
+from bisect import bisect_left
+
+from api.cache import get_or_set
+from api.constants import INTERACTIONS_CACHE_TIMEOUT
+from recipes.constants import FEED_POPULAR_AUTHORS_TIMEOUT
+from recipes.feed import popular_authors
+from recipes.models import Favorite, ShoppingCart, Subscription
+
+# Виды множеств: модель, поле с id элемента и тег кэша пользователя
+KINDS = {
+    'favorites': (Favorite, 'recipe_id', 'user:{}:favorites'),
+    'cart': (ShoppingCart, 'recipe_id', 'user:{}:cart'),
+    'follows': (Subscription, 'subscriber_id', 'user:{}:subscriptions'),
+}
+
+
+class IdSet:
+    """Отсортированный массив id с проверкой вхождения за O(log n)."""
+
+    def __init__(self, ids=None):
+        self.ids = ids if ids is not None else array('q')
+
+    def __contains__(self, value):
+        index = bisect_left(self.ids, value)
+        return index < len(self.ids) and self.ids[index] == value
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def _cache_name(kind):
+    return f'interactions-{kind}'
+
+
+def _tag(kind, user_id):
+    return KINDS[kind][2].format(user_id)
+
+
+def _load(kind, user_id):
+    model, field, _ = KINDS[kind]
+    return array('q', model.objects.filter(user_id=user_id).order_by(
+        field).values_list(field, flat=True))
+
+
+class UserInteractions:
+    """Множества пользователя, загружаемые при первом обращении."""
+
+    def __init__(self, user):
+        self.user_id = user.pk if user.is_authenticated else None
+        self.sets = {}
+
+    def get(self, kind):
+        if kind not in self.sets:
+            if self.user_id is None:
+                self.sets[kind] = IdSet()
+            else:
+                self.sets[kind] = IdSet(get_or_set(
+                    _cache_name(kind), self.user_id,
+                    (_tag(kind, self.user_id),),
+                    lambda: _load(kind, self.user_id),
+                    INTERACTIONS_CACHE_TIMEOUT))
+        return self.sets[kind]
+
+    @property
+    def favorites(self):
+        return self.get('favorites')
+
+    @property
+    def cart(self):
+        return self.get('cart')
+
+    @property
+    def follows(self):
+        return self.get('follows')
+
+
+def interactions(user):
+    """Множества пользователя, запомненные на объекте user до конца запроса."""
+    if not hasattr(user, '_interactions'):
+        user._interactions = UserInteractions(user)
+    return user._interactions
+
+
+def feed_popular_authors(user):
+    """
+    Авторы с fan-out on read среди подписок пользователя из кэша.
+
+    Кэш сбрасывается при изменении подписок пользователя и у всех
+    пользователей - когда число подписчиков автора переходит через
+    FEED_FANOUT_SUBSCRIBERS_LIMIT (api/signals.py): иначе рецепты
+    автора, ставшего популярным, не попадали бы в ленты до истечения
+    времени хранения.
+    """
+    return get_or_set(
+        'feed_popular_authors', user.pk,
+        (f'user:{user.pk}:subscriptions', 'feed_popular_authors'),
+        lambda: popular_authors(user), FEED_POPULAR_AUTHORS_TIMEOUT)
@@ -0,0 +1,309 @@
+import json
+import random
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Max
+from django.test.utils import setup_test_environment
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api.benchmark import (IMAGE, ClientTransport, PostmanCollection,
+                           ServerTransport, Snapshot, summarize)
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            Subscription, Tag, User)
+
+POSTMAN_COLLECTION = (settings.BASE_DIR.parent.parent / 'postman_collection'
+                      / 'foodgram.postman_collection.json')
+
+# Количество рецептов, из которых выбираются запрашиваемые
+SAMPLE_SIZE = 2000
+
+# Количество первых страниц списка рецептов, которые запрашиваются
+LIST_PAGES = 50
+
+# Показатели, сравниваемые с предыдущим запуском
+COMPARED = ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps',
+            'queries_per_request')
+
+
+class BenchmarkData:
+    """Пользователь и объекты, к которым обращаются сценарии."""
+
+    def __init__(self, user, seed):
+        self.rng = random.Random(seed)
+        self.user = user
+        self.token, self.token_created = Token.objects.get_or_create(
+            user=user)
+        last_id = Recipe.objects.aggregate(Max('id'))['id__max'] or 0
+        candidates = [self.rng.randint(1, last_id)
+                      for _ in range(SAMPLE_SIZE)]
+        self.recipes = list(Recipe.objects.filter(
+            id__in=candidates).values_list('id', 'author_id'))
+        if not self.recipes:
+            raise CommandError(
+                'В базе нет рецептов: сгенерируйте данные командой '
+                'generate_dataset.')
+        self.pages = max(1, min(
+            LIST_PAGES, Recipe.objects.count() // settings.REST_FRAMEWORK[
+                'PAGE_SIZE']))
+        self.tags = list(Tag.objects.values_list('id', 'slug'))
+        names = Ingredient.objects.values_list('name', flat=True)
+        self.prefixes = sorted({
+            name[:length] for name in names[:SAMPLE_SIZE]
+            for length in (1, 2, 3)})
+        self.ingredients = list(
+            Ingredient.objects.values_list('id', flat=True)[:20])
+        self.own_recipe = self.create_own_recipe()
+
+    def create_own_recipe(self):
+        """Рецепт пользователя для сценария обновления."""
+        recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт для замеров', text='Описание',
+            cooking_time=10, image='benchmark.png')
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient_id=ingredient,
+                             amount=10)
+            for ingredient in self.ingredients[:3])
+        recipe.tags.set([tag for tag, _ in self.tags[:2]])
+        return recipe.id
+
+    def recipe_body(self):
+        return json.dumps({
+            'name': f'Рецепт {self.rng.randint(1, 10 ** 6)}',
+            'text': 'Описание',
+            'cooking_time': self.rng.randint(5, 120),
+            'image': IMAGE,
+            'tags': [tag for tag, _ in self.rng.sample(
+                self.tags, min(2, len(self.tags)))],
+            'ingredients': [
+                {'id': ingredient, 'amount': self.rng.randint(1, 500)}
+                for ingredient in self.rng.sample(
+                    self.ingredients, min(5, len(self.ingredients)))],
+        }).encode()
+
+    def cleanup(self):
+        if self.token_created:
+            self.token.delete()
+
+
+def recipes_list(data):
+    return 'GET', f'/api/recipes/?page={data.rng.randint(1, data.pages)}', None
+
+
+def recipes_filtered(data):
+    recipe_id, author_id = data.rng.choice(data.recipes)
+    _, slug = data.rng.choice(data.tags)
+    query = data.rng.choice((
+        f'tags={slug}', f'author={author_id}', 'is_favorited=1',
+        'is_in_shopping_cart=1', f'tags={slug}&is_favorited=1'))
+    return 'GET', f'/api/recipes/?{query}', None
+
+
+def recipe_detail(data):
+    recipe_id, _ = data.rng.choice(data.recipes)
+    return 'GET', f'/api/recipes/{recipe_id}/', None
+
+
+def ingredients_autocomplete(data):
+    prefix = quote(data.rng.choice(data.prefixes))
+    return 'GET', f'/api/ingredients/?name={prefix}', None
+
+
+def subscriptions(data):
+    return ('GET', '/api/users/subscriptions/?limit=6&recipes_limit=3'
+            f'&offset={6 * data.rng.randint(0, 4)}', None)
+
+
+def shopping_cart_download(data):
+    return 'GET', '/api/recipes/download_shopping_cart/', None
+
+
+def recipe_create(data):
+    return 'POST', '/api/recipes/', data.recipe_body()
+
+
+def recipe_update(data):
+    return 'PATCH', f'/api/recipes/{data.own_recipe}/', data.recipe_body()
+
+
+SCENARIOS = {
+    'recipes_list': recipes_list,
+    'recipes_filtered': recipes_filtered,
+    'recipe_detail': recipe_detail,
+    'ingredients_autocomplete': ingredients_autocomplete,
+    'subscriptions': subscriptions,
+    'shopping_cart_download': shopping_cart_download,
+    'recipe_create': recipe_create,
+    'recipe_update': recipe_update,
+}
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'), cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    """Команда на замер задержек и пропускной способности API."""
+
+    help = ('Выполняет сценарии запросов к API через тестовый клиент или '
+            'запущенный gunicorn (--server) на текущей базе, например '
+            'созданной generate_dataset. Выводит p50/p95/p99, пропускную '
+            'способность, SQL-запросы на запрос и пиковую память, '
+            'сохраняет результат в JSON и сравнивает его с предыдущим. '
+            'Сценарий postman воспроизводит postman-коллекцию. Созданные '
+            'при замере пользователи и рецепты удаляются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario', action='append', choices=(*SCENARIOS, 'postman'),
+            help='Сценарий; по умолчанию выполняются все.')
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Количество замеряемых запросов в сценарии.')
+        parser.add_argument(
+            '--warmup', type=int, default=10,
+            help='Количество незамеряемых запросов перед сценарием.')
+        parser.add_argument(
+            '--postman-runs', type=int, default=1,
+            help='Количество прогонов postman-коллекции.')
+        parser.add_argument(
+            '--server', action='store_true',
+            help='Запустить gunicorn и отправлять запросы по HTTP.')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Количество параллельных клиентов (только с --server).')
+        parser.add_argument(
+            '--user', help='Email пользователя, от имени которого идут '
+                           'запросы; по умолчанию - с наибольшим числом '
+                           'подписок.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Файл для результата в JSON.')
+        parser.add_argument(
+            '--compare', help='JSON предыдущего запуска для сравнения.')
+
+    def get_user(self, email):
+        if email:
+            try:
+                return User.objects.get(email=email)
+            except User.DoesNotExist:
+                raise CommandError(f'Пользователь {email} не найден.')
+        busiest = Subscription.objects.values('user').annotate(
+            subscriptions=Count('id')).order_by('-subscriptions').first()
+        user = (User.objects.get(id=busiest['user']) if busiest
+                else User.objects.filter(is_active=True).first())
+        if user is None:
+            raise CommandError('В базе нет пользователей.')
+        return user
+
+    def run_scenario(self, transport, name, data, options):
+        headers = {'Authorization': f'Token {data.token.key}'}
+        requests = [SCENARIOS[name](data) for _ in range(
+            options['warmup'] + options['requests'])]
+
+        def send(request):
+            method, path, body = request
+            status, _, queries, elapsed = transport.request(
+                method, path, body, headers)
+            return status, elapsed, queries
+
+        for request in requests[:options['warmup']]:
+            send(request)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            samples = list(executor.map(
+                send, requests[options['warmup']:]))
+        return summarize(samples, time.perf_counter() - started)
+
+    def run_postman(self, transport, options):
+        collection = PostmanCollection(POSTMAN_COLLECTION)
+        samples = []
+        wall_time = 0
+        for _ in range(options['postman_runs']):
+            snapshot = Snapshot()
+            started = time.perf_counter()
+            try:
+                samples.extend(
+                    sample for _, sample in collection.replay(transport))
+            finally:
+                wall_time += time.perf_counter() - started
+                snapshot.restore()
+        return summarize(samples, wall_time)
+
+    def report(self, name, result, previous=None):
+        self.stdout.write(
+            f'{name:<26} {result["requests"]:>6} '
+            f'{result["p50_ms"]:>9.2f} {result["p95_ms"]:>9.2f} '
+            f'{result["p99_ms"]:>9.2f} {result["throughput_rps"]:>9.1f} '
+            f'{result["queries_per_request"] or 0:>8.1f} '
+            f'{result["errors"]:>6}')
+        if not previous:
+            return
+        changes = []
+        for metric in COMPARED:
+            old, new = previous.get(metric), result.get(metric)
+            if old and new is not None:
+                changes.append(f'{metric} {(new - old) / old:+.1%}')
+        self.stdout.write(f'{"":<26} {", ".join(changes)}')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] > 1 and not options['server']:
+            raise CommandError('--concurrency работает только с --server.')
+        previous = {}
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                previous = json.load(file)['scenarios']
+        scenarios = options['scenario'] or [*SCENARIOS, 'postman']
+        setup_test_environment()
+        snapshot = Snapshot()
+        data = BenchmarkData(self.get_user(options['user']), options['seed'])
+        results = {}
+        transport = (ServerTransport(options['workers']) if options['server']
+                     else ClientTransport())
+        self.stdout.write(
+            f'{"Сценарий":<26} {"Запр.":>6} {"p50, мс":>9} {"p95, мс":>9} '
+            f'{"p99, мс":>9} {"RPS":>9} {"SQL":>8} {"5xx":>6}')
+        try:
+            with transport:
+                for name in scenarios:
+                    if name == 'postman':
+                        results[name] = self.run_postman(transport, options)
+                    else:
+                        results[name] = self.run_scenario(
+                            transport, name, data, options)
+                    self.report(name, results[name], previous.get(name))
+                peak_rss = transport.peak_rss()
+        finally:
+            snapshot.restore()
+            data.cleanup()
+        if peak_rss:
+            self.stdout.write(
+                f'Пиковая память: {peak_rss / 2 ** 20:.1f} МБ.')
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({
+                    'commit': current_commit(),
+                    'created_at': timezone.now().isoformat(),
+                    'mode': transport.mode,
+                    'workers': options['workers'] if options['server']
+                    else None,
+                    'concurrency': options['concurrency'],
+                    'dataset': {
+                        'users': User.objects.count(),
+                        'recipes': Recipe.objects.count(),
+                    },
+                    'peak_rss_bytes': peak_rss,
+                    'scenarios': results,
+                }, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результат сохранен в {options["output"]}.')
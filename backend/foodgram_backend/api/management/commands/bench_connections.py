@@ -0,0 +1,101 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import setup_test_environment
+
+from api.benchmark import ServerTransport, summarize
+from recipes.models import Recipe
+
+# Настройки соединений с базой, с которыми запускается gunicorn
+PROFILES = {
+    'per_request': {'CONN_MAX_AGE': '0', 'CONN_HEALTH_CHECKS': 'false'},
+    'persistent': {'CONN_MAX_AGE': '60', 'CONN_HEALTH_CHECKS': 'false'},
+    'persistent_checked': {'CONN_MAX_AGE': '60',
+                           'CONN_HEALTH_CHECKS': 'true'},
+}
+
+# Количество замеров времени открытия соединения
+CONNECT_SAMPLES = 50
+
+
+class Command(BaseCommand):
+    """Команда на замер выигрыша от постоянных соединений с базой."""
+
+    help = ('Запускает gunicorn с соединением на каждый запрос, с '
+            'постоянными соединениями и с постоянными соединениями и их '
+            'проверкой, выполняет одинаковые легкие запросы к API и '
+            'выводит задержки и пропускную способность каждого варианта '
+            'вместе со временем открытия одного соединения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--warmup', type=int, default=50)
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def connect_time(self):
+        """Среднее время открытия соединения с основной базой, мс."""
+        connection = connections['default']
+        samples = []
+        for _ in range(CONNECT_SAMPLES):
+            connection.close()
+            started = time.perf_counter()
+            connection.ensure_connection()
+            samples.append(time.perf_counter() - started)
+        return float(np.mean(samples)) * 1000
+
+    def run_profile(self, env, paths, options):
+        transport = ServerTransport(
+            options['workers'], env=env,
+            extra_args=('--threads', str(options['threads'])))
+
+        def send(path):
+            status, _, queries, elapsed = transport.request('GET', path)
+            return status, elapsed, queries
+
+        with transport:
+            for path in paths[:options['warmup']]:
+                send(path)
+            started = time.perf_counter()
+            with ThreadPoolExecutor(options['concurrency']) as executor:
+                samples = list(executor.map(
+                    send, paths[options['warmup']:]))
+            return summarize(samples, time.perf_counter() - started)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        recipes = list(Recipe.objects.values_list('id', flat=True)[:1000])
+        if not recipes:
+            raise CommandError(
+                'В базе нет рецептов: сгенерируйте данные командой '
+                'generate_dataset.')
+        rng = random.Random(options['seed'])
+        paths = [
+            rng.choice(('/api/tags/', f'/api/recipes/{rng.choice(recipes)}/'))
+            for _ in range(options['warmup'] + options['requests'])]
+
+        self.stdout.write(
+            f'Открытие соединения ({connections["default"].vendor}): '
+            f'{self.connect_time():.2f} мс.')
+        self.stdout.write(
+            f'{"Вариант":<20} {"p50, мс":>9} {"p95, мс":>9} '
+            f'{"p99, мс":>9} {"RPS":>9} {"5xx":>6}')
+        baseline = None
+        for name, env in PROFILES.items():
+            result = self.run_profile(env, paths, options)
+            line = (f'{name:<20} {result["p50_ms"]:>9.2f} '
+                    f'{result["p95_ms"]:>9.2f} {result["p99_ms"]:>9.2f} '
+                    f'{result["throughput_rps"]:>9.1f} '
+                    f'{result["errors"]:>6}')
+            if baseline is None:
+                baseline = result
+            else:
+                line += (f'  p50 {result["p50_ms"] - baseline["p50_ms"]:+.2f}'
+                         ' мс')
+            self.stdout.write(line)
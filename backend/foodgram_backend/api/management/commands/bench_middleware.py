@@ -0,0 +1,112 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings, setup_test_environment
+from rest_framework.authtoken.models import Token
+
+from api.benchmark import ClientTransport, summarize
+from recipes.models import User
+
+# Запросы замера: путь и признак запроса с токеном
+ENDPOINTS = (
+    ('/api/', False),
+    ('/api/tags/', False),
+    ('/api/users/me/', True),
+)
+
+
+def full_stack():
+    """MIDDLEWARE, в котором PATH_SCOPED_MIDDLEWARE выполняются для всех."""
+    middleware = []
+    for path in settings.MIDDLEWARE:
+        if path == 'api.middleware.PathScopedMiddleware':
+            middleware.extend(settings.PATH_SCOPED_MIDDLEWARE)
+        else:
+            middleware.append(path)
+    return middleware
+
+
+class Command(BaseCommand):
+    """Команда на замер накладных расходов middleware запросов к API."""
+
+    help = ('Выполняет запросы к API тестовым клиентом с полным набором '
+            'middleware (сессии, CSRF, аутентификация по сессии, '
+            'сообщения) и с набором, который PathScopedMiddleware '
+            'оставляет для /api/, и сравнивает время ответа и количество '
+            'SQL-запросов. Запросы идут с cookie сессии, как из браузера '
+            'пользователя, вошедшего в админку.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=2000,
+            help='Количество запросов к каждому эндпоинту.')
+
+    def measure(self, transports, path, headers):
+        """
+        Замеры запросов к path через каждый набор middleware.
+
+        Запросы через разные наборы чередуются, чтобы дрейф времени
+        (прогрев кэшей, фоновая нагрузка) одинаково сказывался на всех.
+        """
+        samples = {name: [] for name in transports}
+        for transport in transports.values():
+            transport.request('GET', path, headers=headers)
+        started = time.perf_counter()
+        for _ in range(self.requests):
+            for name, transport in transports.items():
+                status, _, queries, elapsed = transport.request(
+                    'GET', path, headers=headers)
+                samples[name].append((status, elapsed, queries))
+        wall_time = (time.perf_counter() - started) / len(transports)
+        return {name: summarize(results, wall_time)
+                for name, results in samples.items()}
+
+    def transport(self, middleware):
+        """Тестовый клиент с сессией пользователя и набором middleware."""
+        transport = ClientTransport()
+        transport.client.force_login(self.user)
+        # Тестовый клиент собирает цепочку middleware при первом запросе
+        with override_settings(MIDDLEWARE=middleware):
+            transport.request('GET', '/api/')
+        return transport
+
+    def handle(self, *args, **options):
+        self.requests = options['requests']
+        self.user = User.objects.filter(
+            is_active=True, deleted_at__isnull=True).first()
+        if self.user is None:
+            raise CommandError('В базе нет пользователей.')
+        setup_test_environment()
+        token, token_created = Token.objects.get_or_create(user=self.user)
+        transports = {
+            'полный': self.transport(full_stack()),
+            'для API': self.transport(settings.MIDDLEWARE),
+        }
+        self.stdout.write(
+            f'{"Эндпоинт":<20} {"Набор":<10} {"p50, мс":>9} '
+            f'{"среднее, мс":>12} {"SQL":>5} {"статусы":>12}')
+        try:
+            for path, authorized in ENDPOINTS:
+                headers = (
+                    {'Authorization': f'Token {token.key}'} if authorized
+                    else None)
+                results = self.measure(transports, path, headers)
+                for name, result in results.items():
+                    statuses = ','.join(sorted(result['statuses']))
+                    self.stdout.write(
+                        f'{path:<20} {name:<10} {result["p50_ms"]:>9.3f} '
+                        f'{result["mean_ms"]:>12.3f} '
+                        f'{result["queries_per_request"]:>5} {statuses:>12}')
+                full, lean = results.values()
+                saved = (full['p50_ms'] - lean['p50_ms']) * 1000
+                queries = (full['queries_per_request']
+                           - lean['queries_per_request'])
+                self.stdout.write(self.style.SUCCESS(
+                    f'{path:<20} экономия {saved:.0f} мкс на запрос (p50), '
+                    f'{queries:.2f} SQL-запросов'))
+        finally:
+            for transport in transports.values():
+                transport.client.logout()
+            if token_created:
+                token.delete()
@@ -0,0 +1,81 @@
+import io
+import json
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.test.utils import setup_test_environment
+from django.urls import resolve
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from api.parsers import ORJSONParser
+from api.renderers import ORJSONRenderer
+
+ENDPOINTS = (
+    '/api/ingredients/',
+    '/api/recipes/?limit=100',
+    '/api/users/?limit=100',
+    '/api/tags/',
+)
+
+# Размер тела запроса с изображением в base64, как у загрузки рецепта
+UPLOAD_BODY_SIZE = 10 * 1024 * 1024
+
+
+class Command(BaseCommand):
+    """Команда на сравнение стандартного и orjson рендереров и парсеров."""
+
+    help = ('Сравнивает время кодирования ответов реальных эндпоинтов '
+            'и разбора тела загрузки изображения стандартными JSONRenderer/'
+            'JSONParser и ORJSONRenderer/ORJSONParser.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Количество повторов каждого замера.')
+
+    def measure(self, func):
+        return min(timeit.repeat(func, number=1, repeat=self.repeat)) * 1000
+
+    def report(self, name, size, stock, fast):
+        self.stdout.write(
+            f'{name:<40} {size / 1024:>9.1f} КБ {stock:>9.2f} мс '
+            f'{fast:>9.2f} мс {stock / fast:>6.1f}x')
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        self.stdout.write(
+            f'{"Эндпоинт":<40} {"Размер":>12} {"json":>12} {"orjson":>12}')
+        try:
+            setup_test_environment()
+        except RuntimeError:
+            # Окружение уже настроено, команда запущена из тестов
+            pass
+        factory = RequestFactory()
+        for path in ENDPOINTS:
+            request = factory.get(path)
+            match = resolve(request.path)
+            response = match.func(request, *match.args, **match.kwargs)
+            # Карточки рецептов в ответе - заранее закодированные Fragment,
+            # которые стандартный рендерер не кодирует, поэтому оба
+            # рендерера сравниваются на тех же данных в виде объектов Python
+            fast = ORJSONRenderer().render(response.data)
+            data = json.loads(fast)
+            stock = JSONRenderer().render(data)
+            if json.loads(stock) != json.loads(fast):
+                self.stderr.write(f'{path}: ответы рендереров различаются.')
+            self.report(
+                f'GET {path}', len(stock),
+                self.measure(lambda: JSONRenderer().render(data)),
+                self.measure(lambda: ORJSONRenderer().render(data)))
+
+        body = json.dumps({
+            'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 10,
+            'tags': [1], 'ingredients': [{'id': 1, 'amount': 10}],
+            'image': 'data:image/png;base64,' + 'A' * UPLOAD_BODY_SIZE,
+        }).encode()
+        self.report(
+            'POST /api/recipes/ (разбор тела)', len(body),
+            self.measure(lambda: JSONParser().parse(io.BytesIO(body))),
+            self.measure(lambda: ORJSONParser().parse(io.BytesIO(body))))
@@ -0,0 +1,153 @@
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment
+from rest_framework.authtoken.models import Token
+
+from api.benchmark import IMAGE, ServerTransport, Snapshot, summarize
+from recipes.models import User
+
+# Варианты запуска gunicorn: переменные окружения и аргументы
+PROFILES = {
+    'gthread': ({'GUNICORN_WORKER_CLASS': 'gthread'}, True),
+    'uvicorn': ({'GUNICORN_WORKER_CLASS': 'uvicorn.workers.UvicornWorker'},
+                False),
+}
+
+# Запросы, которые выполняют быстрые клиенты
+PROBE_PATHS = ('/api/tags/', '/api/recipes/', '/api/ingredients/?name=а')
+
+
+def slow_upload(port, token, seconds, parts):
+    """
+    Загружает аватар, отправляя тело запроса частями за seconds секунд.
+
+    Возвращает статус ответа и время запроса.
+    """
+    body = json.dumps({'avatar': IMAGE}).encode()
+    head = (f'PUT /api/users/me/avatar/ HTTP/1.1\r\n'
+            f'Host: localhost\r\n'
+            f'Authorization: Token {token}\r\n'
+            f'Content-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: close\r\n\r\n').encode()
+    size = -(-len(body) // parts)
+    started = time.perf_counter()
+    with socket.create_connection(('127.0.0.1', port), timeout=120) as sock:
+        sock.sendall(head)
+        for start in range(0, len(body), size):
+            time.sleep(seconds / parts)
+            sock.sendall(body[start:start + size])
+        response = b''
+        while chunk := sock.recv(65536):
+            response += chunk
+    status = int(response.split(b' ', 2)[1]) if response else 0
+    return status, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    """Команда на замер работы воркера при медленных клиентах."""
+
+    help = ('Запускает gunicorn с воркерами gthread и uvicorn и в каждом '
+            'варианте держит --slow-clients клиентов, медленно '
+            'загружающих аватар, пока быстрые клиенты выполняют '
+            '--requests легких запросов. Выводит задержки быстрых '
+            'запросов и количество завершенных медленных загрузок: при '
+            'ASGI медленные клиенты не занимают потоки воркера.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--concurrency', type=int, default=2)
+        parser.add_argument('--slow-clients', type=int, default=8)
+        parser.add_argument(
+            '--slow-seconds', type=float, default=2,
+            help='Время отправки тела одного медленного запроса.')
+        parser.add_argument(
+            '--slow-parts', type=int, default=20,
+            help='Количество частей, которыми отправляется тело.')
+        parser.add_argument('--user', help='Email загружающего аватар.')
+
+    def get_user(self, email):
+        users = User.objects.filter(is_active=True)
+        user = (users.filter(email=email) if email else users).first()
+        if user is None:
+            raise CommandError('Пользователь не найден.')
+        return user
+
+    def run_profile(self, env, with_threads, token, options):
+        extra_args = (('--threads', str(options['threads']))
+                      if with_threads else ())
+        transport = ServerTransport(
+            options['workers'], env=env, extra_args=extra_args)
+        stop = threading.Event()
+        uploads = []
+
+        def slow_client():
+            while not stop.is_set():
+                try:
+                    uploads.append(slow_upload(
+                        transport.port, token, options['slow_seconds'],
+                        options['slow_parts']))
+                except OSError:
+                    uploads.append((0, 0))
+
+        def probe(number):
+            status, _, queries, elapsed = transport.request(
+                'GET', PROBE_PATHS[number % len(PROBE_PATHS)])
+            return status, elapsed, queries
+
+        with transport:
+            for number in range(len(PROBE_PATHS)):
+                probe(number)
+            clients = [threading.Thread(target=slow_client)
+                       for _ in range(options['slow_clients'])]
+            for client in clients:
+                client.start()
+            time.sleep(options['slow_seconds'] / 2)
+            started = time.perf_counter()
+            try:
+                with ThreadPoolExecutor(options['concurrency']) as executor:
+                    samples = list(executor.map(
+                        probe, range(options['requests'])))
+            finally:
+                wall_time = time.perf_counter() - started
+                stop.set()
+                for client in clients:
+                    client.join()
+        result = summarize(samples, wall_time)
+        result['slow_uploads'] = sum(
+            200 <= status < 300 for status, _ in uploads)
+        result['slow_errors'] = sum(
+            not 200 <= status < 300 for status, _ in uploads)
+        return result
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        user = self.get_user(options['user'])
+        avatar = user.avatar.name
+        token, token_created = Token.objects.get_or_create(user=user)
+        snapshot = Snapshot()
+        self.stdout.write(
+            f'{"Воркер":<10} {"p50, мс":>9} {"p95, мс":>9} {"p99, мс":>9} '
+            f'{"RPS":>9} {"Загрузок":>9} {"Ошибок":>7}')
+        try:
+            for name, (env, with_threads) in PROFILES.items():
+                result = self.run_profile(
+                    env, with_threads, token.key, options)
+                self.stdout.write(
+                    f'{name:<10} {result["p50_ms"]:>9.2f} '
+                    f'{result["p95_ms"]:>9.2f} {result["p99_ms"]:>9.2f} '
+                    f'{result["throughput_rps"]:>9.1f} '
+                    f'{result["slow_uploads"]:>9} '
+                    f'{result["slow_errors"] + result["errors"]:>7}')
+        finally:
+            User.objects.filter(id=user.id).update(avatar=avatar)
+            snapshot.restore()
+            if token_created:
+                token.delete()
@@ -0,0 +1,89 @@
+"""
+Метрики в формате Prometheus.
+
+Под gunicorn каждый воркер пишет значения в файлы каталога
+PROMETHEUS_MULTIPROC_DIR, а metrics_view собирает их со всех
+воркеров. Без этой переменной используется реестр текущего процесса.
+"""
+
+import os
+import resource
+from time import monotonic
+
+from django.http import HttpResponse
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+from api.constants import (METRICS_LATENCY_BUCKETS, METRICS_MEMORY_INTERVAL,
+                           METRICS_QUERIES_BUCKETS)
+
+REQUEST_LATENCY = Histogram(
+    'foodgram_request_duration_seconds',
+    'Время обработки запроса.',
+    ('route', 'method', 'status'),
+    buckets=METRICS_LATENCY_BUCKETS)
+DB_QUERIES = Histogram(
+    'foodgram_db_queries_per_request',
+    'Количество SQL-запросов на один запрос.',
+    ('route',),
+    buckets=METRICS_QUERIES_BUCKETS)
+CACHE_REQUESTS = Counter(
+    'foodgram_cache_requests_total',
+    'Обращения к кешам API.',
+    ('cache', 'result'))
+WORKER_MEMORY = Gauge(
+    'foodgram_worker_resident_memory_bytes',
+    'Резидентная память воркера.',
+    multiprocess_mode='all')
+RECIPES_CREATED = Counter(
+    'foodgram_recipes_created_total',
+    'Созданные рецепты.')
+SHOPPING_CART_DOWNLOADS = Counter(
+    'foodgram_shopping_cart_downloads_total',
+    'Скачивания списка покупок.')
+IMAGE_UPLOADS = Counter(
+    'foodgram_image_uploads_total',
+    'Загруженные изображения.',
+    ('kind',))
+THROTTLED_REQUESTS = Counter(
+    'foodgram_throttled_requests_total',
+    'Запросы, отклоненные ограничением частоты.',
+    ('scope',))
+
+_memory_updated = None
+
+
+def record_cache(cache, hit):
+    """Учитывает попадание или промах кеша."""
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def _resident_memory():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def update_worker_memory():
+    """Обновляет память воркера не чаще METRICS_MEMORY_INTERVAL секунд."""
+    global _memory_updated
+    now = monotonic()
+    if (_memory_updated is not None
+            and now - _memory_updated < METRICS_MEMORY_INTERVAL):
+        return
+    _memory_updated = now
+    WORKER_MEMORY.set(_resident_memory())
+
+
+def metrics_view(request):
+    """Метрики всех воркеров в текстовом формате Prometheus."""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(
+        generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,305 @@
+"""Middleware."""
+
+import asyncio
+import json
+import logging
+import random
+from contextlib import ExitStack
+from time import perf_counter
+
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import OperationalError, connections
+from django.utils.module_loading import import_string
+from rest_framework.permissions import SAFE_METHODS
+
+from api.constants import LEAN_MIDDLEWARE_PATHS
+from api.db_routing import (choose_replica, current_read_database,
+                            is_sticky, mark_unhealthy, replicas,
+                            reset_database, stick_to_primary, use_database)
+from api.instrumentation import (RequestTimings, activate, current_timings,
+                                 deactivate)
+from api.metrics import (DB_QUERIES, REQUEST_LATENCY,
+                         update_worker_memory)
+from api.query_inspector import QueryBudgetExceeded, QueryInspector
+
+logger = logging.getLogger('api.performance')
+queries_logger = logging.getLogger('api.queries')
+
+
+def view_name(view_func, method):
+    """Имя представления вида ReciepesViewSet.list."""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+    actions = getattr(view_func, 'actions', None) or {}
+    return f'{view_class.__name__}.{actions.get(method, method)}'
+
+
+class ServerTimingMiddleware:
+    """
+    Замеряет время обработки запроса.
+
+    Количество и время SQL-запросов, время сериализации, отрисовки
+    ответа и общее время отдаются в заголовке Server-Timing и пишутся
+    одной строкой в лог api.performance. Замеряется доля запросов
+    SERVER_TIMING_SAMPLE_RATE; при выключенном SERVER_TIMING
+    middleware не подключается.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.SERVER_TIMING_SAMPLE_RATE
+
+    def __call__(self, request):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return self.get_response(request)
+        timings = RequestTimings()
+        token = activate(timings)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timings.execute_wrapper))
+                response = self.get_response(request)
+        finally:
+            deactivate(token)
+        timings.finish()
+        response['Server-Timing'] = timings.header()
+        logger.info(json.dumps(dict(
+            timings.as_dict(), method=request.method, path=request.path,
+            status=response.status_code)))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = current_timings()
+        if timings is not None:
+            timings.view = view_name(view_func, request.method.lower())
+
+    def process_template_response(self, request, response):
+        timings = current_timings()
+        if timings is not None and timings.start('render'):
+            response.add_post_render_callback(
+                lambda response: timings.stop('render'))
+        return response
+
+
+class QueryInspectorMiddleware:
+    """
+    Ищет N+1 и медленные SQL-запросы в каждом запросе.
+
+    Найденные проблемы пишутся в лог api.queries вместе с представлением
+    и кадрами стека. При QUERY_INSPECTOR_RAISE вместо записи в лог
+    выбрасывается QueryBudgetExceeded, что роняет тесты и скрипты,
+    работающие через тестовый клиент. При выключенном QUERY_INSPECTOR
+    middleware не подключается.
+    """
+
+    def __init__(self, get_response):
+        if not settings.QUERY_INSPECTOR:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        inspector = QueryInspector()
+        with inspector.inspect():
+            response = self.get_response(request)
+        if inspector.has_problems:
+            view = getattr(request, 'inspected_view', None)
+            message = (f'{request.method} {request.path} ({view}):\n'
+                       f'{inspector.report()}')
+            if settings.QUERY_INSPECTOR_RAISE:
+                raise QueryBudgetExceeded(message)
+            queries_logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.inspected_view = view_name(
+            view_func, request.method.lower())
+
+
+class MetricsMiddleware:
+    """
+    Собирает метрики Prometheus по каждому запросу.
+
+    Время обработки учитывается по маршруту (имени представления),
+    методу и статусу ответа, количество SQL-запросов - по маршруту.
+    При выключенном METRICS middleware не подключается.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        started = perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(count_query))
+            response = self.get_response(request)
+        route = getattr(request, 'metrics_route', 'unresolved')
+        REQUEST_LATENCY.labels(
+            route, request.method, response.status_code
+        ).observe(perf_counter() - started)
+        DB_QUERIES.labels(route).observe(queries)
+        update_worker_memory()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_route = view_name(view_func, request.method.lower())
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Направляет чтение на реплики базы данных.
+
+    Запросы безопасными методами к представлениям с атрибутом
+    use_read_replica читают со случайной доступной реплики. После
+    успешного запроса другим методом клиент на DB_REPLICA_STICKY_SECONDS
+    секунд закрепляется за основной базой, чтобы видеть свою запись.
+    Ошибка соединения с репликой исключает ее до следующей проверки.
+    Без реплик в DATABASES middleware не подключается.
+    """
+
+    def __init__(self, get_response):
+        if not replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = use_database(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            reset_database(token)
+        if request.method not in SAFE_METHODS and (
+                response.status_code < 400):
+            stick_to_primary(request, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None)
+        if (request.method in SAFE_METHODS
+                and getattr(view_class, 'use_read_replica', False)
+                and not is_sticky(request)):
+            use_database(choose_replica())
+
+    def process_exception(self, request, exception):
+        alias = current_read_database()
+        if alias is not None and isinstance(exception, OperationalError):
+            mark_unhealthy(alias)
+
+
+def adapt_mode(handler, handler_is_async, is_async):
+    """Обработчик в нужном режиме, как BaseHandler.adapt_method_mode."""
+    if is_async and not handler_is_async:
+        return sync_to_async(handler, thread_sensitive=True)
+    if not is_async and handler_is_async:
+        return async_to_sync(handler)
+    return handler
+
+
+class PathScopedMiddleware:
+    """
+    Выполняет PATH_SCOPED_MIDDLEWARE только для путей вне API.
+
+    Для админки и остальных страниц вложенные middleware работают как
+    обычно, включая их process_view, process_template_response и
+    process_exception. Запросы к LEAN_MIDDLEWARE_PATHS сразу передаются
+    следующему middleware: API аутентифицируется токеном, и сессии,
+    CSRF и сообщения ему не нужны.
+
+    Как и MiddlewareMixin, работает и в синхронной, и в асинхронной
+    цепочке: под ASGI асинхронные представления API не переводятся в
+    поток ради этого middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.lean = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        self.middleware = []
+        # Цепочка вложенных middleware собирается как в
+        # BaseHandler.load_middleware: синхронные получают синхронный
+        # обработчик, асинхронные - асинхронный
+        handler, handler_is_async = get_response, self.is_async
+        for path in reversed(settings.PATH_SCOPED_MIDDLEWARE):
+            middleware = import_string(path)
+            middleware_is_async = (
+                handler_is_async and getattr(
+                    middleware, 'async_capable', False)
+                or not getattr(middleware, 'sync_capable', True))
+            try:
+                handler = middleware(adapt_mode(
+                    handler, handler_is_async, middleware_is_async))
+            except MiddlewareNotUsed:
+                continue
+            handler_is_async = middleware_is_async
+            self.middleware.insert(0, handler)
+        self.full = adapt_mode(handler, handler_is_async, self.is_async)
+        self.view_hooks = self.hooks('process_view')
+        self.template_response_hooks = self.hooks(
+            'process_template_response')[::-1]
+        self.exception_hooks = self.hooks('process_exception')[::-1]
+        if self.is_async:
+            # Обработчик Django определяет режим middleware так же,
+            # как у MiddlewareMixin
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def hooks(self, name):
+        return [getattr(middleware, name) for middleware in self.middleware
+                if hasattr(middleware, name)]
+
+    def is_lean(self, request):
+        return request.path_info.startswith(LEAN_MIDDLEWARE_PATHS)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if self.is_lean(request):
+            return self.lean(request)
+        return self.full(request)
+
+    async def __acall__(self, request):
+        if self.is_lean(request):
+            return await self.lean(request)
+        return await self.full(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.is_lean(request):
+            return None
+        for hook in self.view_hooks:
+            response = hook(request, view_func, view_args, view_kwargs)
+            if response is not None:
+                return response
+        return None
+
+    def process_template_response(self, request, response):
+        if not self.is_lean(request):
+            for hook in self.template_response_hooks:
+                response = hook(request, response)
+        return response
+
+    def process_exception(self, request, exception):
+        if self.is_lean(request):
+            return None
+        for hook in self.exception_hooks:
+            response = hook(request, exception)
+            if response is not None:
+                return response
+        return None
@@ -1,7 +1,15 @@
-"""Пагинатор для рецептов."""
+"""Пагинаторы."""
 
-from rest_framework.pagination import PageNumberPagination
+from base64 import b64decode, b64encode
+from binascii import Error as DecodeError
+
+from django.conf import settings
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from api.constants import MAX_FEED_PAGE_SIZE
 
 
 class RecipePagination(PageNumberPagination):
@@ -17,3 +25,63 @@ class RecipePagination(PageNumberPagination):
             'count': self.page.paginator.count,
             'results': data
         })
+
+
+class FeedCursorPagination(BasePagination):
+    """
+    Курсорный пагинатор для ленты подписок.
+
+    Курсор хранит id последнего показанного рецепта, поэтому новые
+    рецепты не сдвигают следующие страницы.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return settings.REST_FRAMEWORK['PAGE_SIZE']
+        return min(max(page_size, 1), MAX_FEED_PAGE_SIZE)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            return int(b64decode(encoded.encode('ascii')).decode('ascii'))
+        except (DecodeError, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        encoded = b64encode(str(position).encode('ascii')).decode('ascii')
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded)
+
+    def paginate_ids(self, request, fetch_ids):
+        """
+        Возвращает id рецептов текущей страницы.
+
+        fetch_ids(before, limit) должна вернуть не более limit id,
+        меньших before, в порядке убывания.
+        """
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        recipe_ids = fetch_ids(self.decode_cursor(request), page_size + 1)
+        self.has_next = len(recipe_ids) > page_size
+        self.page_ids = recipe_ids[:page_size]
+        return self.page_ids
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page_ids[-1])
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data
+        })
@@ -30,3 +30,30 @@ class IsAuthorOrReadOnly(BasePermission):
             False в противном случае.
         """
         return request.method in SAFE_METHODS or obj.author == request.user
+
+
+class IsCurrentUser(BasePermission):
+    """
+    Ограничение, представляющее доступ к учетной записи только ее владельцу.
+
+    Методы
+    ------
+    has_object_permission(self, request, view, obj):
+        Проверяет права пользователя на выполнение запроса.
+    """
+
+    def has_object_permission(self, request, view, obj):
+        """
+        Проверяет, является ли пользователь владельцем учетной записи.
+
+        Параметры
+        ------
+        request (Request): Запрос от клиента.
+        view (View): Представление, обрабатывающее запрос.
+        obj (User): Учетная запись, к которой запрашивается доступ.
+
+        Возвращаемое значение:
+        bool: True, если obj - учетная запись пользователя запроса.
+            False в противном случае.
+        """
+        return obj == request.user
@@ -0,0 +1,140 @@
+"""
+Поиск N+1 и медленных SQL-запросов.
+
+Выполненные запросы группируются по форме: текст запроса с замененными
+литералами и списками параметров. Форма, повторившаяся не меньше
+QUERY_INSPECTOR_REPEAT_THRESHOLD раз, и запрос дольше
+QUERY_INSPECTOR_SLOW_MS считаются проблемой. Для каждой проблемы
+сохраняются кадры стека из кода проекта, откуда был выполнен запрос.
+"""
+
+import re
+import traceback
+from contextlib import ExitStack, contextmanager
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER_LIST = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+WHITESPACE = re.compile(r'\s+')
+
+# Количество кадров стека, сохраняемых для проблемного запроса
+STACK_DEPTH = 6
+# Файлы проекта, кадры которых не указывают на источник запроса
+IGNORED_FILES = ('api/middleware.py', 'api/query_inspector.py', 'manage.py')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Найдены повторяющиеся или медленные запросы."""
+
+
+def normalize(sql):
+    """Форма запроса без конкретных значений параметров."""
+    sql = STRING_LITERAL.sub('?', sql)
+    sql = NUMBER_LITERAL.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = PLACEHOLDER_LIST.sub('(...)', sql)
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+def project_stack():
+    """Кадры стека из кода проекта, начиная с ближайшего к запросу."""
+    base_dir = str(settings.BASE_DIR)
+    frames = []
+    for frame in reversed(traceback.extract_stack()):
+        if not frame.filename.startswith(base_dir):
+            continue
+        filename = frame.filename[len(base_dir) + 1:]
+        if filename not in IGNORED_FILES:
+            frames.append(f'{filename}:{frame.lineno} in {frame.name}')
+    return frames[:STACK_DEPTH]
+
+
+class QueryShape:
+    """Статистика запросов одной формы."""
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.count = 0
+        self.duration = 0
+        self.slowest = 0
+        self.stack = project_stack()
+
+    def add(self, duration):
+        self.count += 1
+        self.duration += duration
+        self.slowest = max(self.slowest, duration)
+
+
+class QueryInspector:
+    """Собирает запросы, выполненные внутри inspect()."""
+
+    def __init__(self, repeat_threshold=None, slow_ms=None):
+        self.repeat_threshold = (
+            repeat_threshold or settings.QUERY_INSPECTOR_REPEAT_THRESHOLD)
+        self.slow_ms = slow_ms or settings.QUERY_INSPECTOR_SLOW_MS
+        self.shapes = {}
+        self.slow = []
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (perf_counter() - started) * 1000
+            shape = normalize(sql)
+            if shape not in self.shapes:
+                self.shapes[shape] = QueryShape(shape)
+            self.shapes[shape].add(duration)
+            if duration > self.slow_ms:
+                self.slow.append((duration, sql, project_stack()))
+
+    @contextmanager
+    def inspect(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(self.execute_wrapper))
+            yield self
+
+    @property
+    def repeated(self):
+        return sorted(
+            (shape for shape in self.shapes.values()
+             if shape.count >= self.repeat_threshold),
+            key=lambda shape: -shape.count)
+
+    @property
+    def has_problems(self):
+        return bool(self.slow or self.repeated)
+
+    def report(self):
+        """Текстовый отчет о найденных проблемах."""
+        lines = []
+        for shape in self.repeated:
+            lines.append(
+                f'{shape.count} похожих запросов '
+                f'({shape.duration:.1f} мс): {shape.sql}')
+            lines.extend(f'    {frame}' for frame in shape.stack)
+        for duration, sql, stack in self.slow:
+            lines.append(f'Медленный запрос ({duration:.1f} мс): {sql}')
+            lines.extend(f'    {frame}' for frame in stack)
+        return '\n'.join(lines)
+
+
+@contextmanager
+def inspect_queries(raise_on_problems=True, **kwargs):
+    """
+    Проверяет запросы блока кода.
+
+    Используется в тестах и скриптах: при raise_on_problems найденные
+    проблемы приводят к QueryBudgetExceeded.
+    """
+    inspector = QueryInspector(**kwargs)
+    with inspector.inspect():
+        yield inspector
+    if raise_on_problems and inspector.has_problems:
+        raise QueryBudgetExceeded(inspector.report())
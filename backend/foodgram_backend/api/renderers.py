@@ -0,0 +1,58 @@
+"""Рендерер JSON на основе orjson."""
+
+import json
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Типы, которые orjson не кодирует сам (Decimal, ленивые строки перевода,
+# QuerySet), и даты в формате DRF кодируются так же, как в JSONRenderer.
+ORJSON_OPTIONS = (
+    orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+    if orjson else 0)
+
+# Заранее закодированный JSON, который вставляется в ответ как есть
+# (orjson 3.9 и новее)
+Fragment = getattr(orjson, 'Fragment', None)
+
+
+class FragmentJSONEncoder(JSONEncoder):
+    """Кодировщик DRF, раскрывающий Fragment для стандартного рендерера."""
+
+    def default(self, obj):
+        if Fragment is not None and isinstance(obj, Fragment):
+            return json.loads(orjson.dumps(obj))
+        return super().default(obj)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    Рендерер JSON на основе orjson.
+
+    Результат совпадает с JSONRenderer при настройках по умолчанию.
+    Если orjson не установлен или запрошен отступ (Browsable API),
+    используется стандартный рендерер.
+    """
+
+    encoder_class = FragmentJSONEncoder
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.get_indent(
+                accepted_media_type, renderer_context or {}) is not None:
+            return super().render(
+                data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        ret = orjson.dumps(
+            data, default=self.encoder.default, option=ORJSON_OPTIONS)
+        # Как и JSONRenderer, экранируем U+2028 и U+2029.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+                b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -1,17 +1,48 @@
 """Сериализаторы."""
 
+from copy import deepcopy
+
 from django.contrib.auth import password_validation
 from django.core.validators import MinValueValidator
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from api.constants import FORBIDDEN_USERNAME, MIN_INGREDIENT_AMOUNT
+from api.constants import (FORBIDDEN_USERNAME, MAX_RECIPES_MULTI_GET,
+                           MIN_INGREDIENT_AMOUNT)
+from api.instrumentation import TimedSerializerMixin
+from api.interactions import interactions
+from recipes.feed import backfill, drop_author
 from recipes.models import (Favorite, Ingredient, ShoppingCart, Subscription,
                             RecipeIngredient, Recipe, Tag, User)
 
 
-class BaseUserSerializer(serializers.ModelSerializer):
+class SparseFieldsetMixin:
+    """
+    Оставляет в ответе только запрошенные клиентом поля.
+
+    Имена полей передаются в context['fields'], связи из context['expand']
+    выводятся вложенными объектами. Остальные запрошенные связи заменяются
+    полями из collapsed_fields и выводятся в виде id.
+    """
+
+    collapsed_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = self.context.get('fields')
+        if requested is None:
+            return
+        expand = self.context.get('expand', ())
+        for name in list(self.fields):
+            if name not in requested and name not in expand:
+                self.fields.pop(name)
+            elif name in self.collapsed_fields and name not in expand:
+                self.fields[name] = deepcopy(self.collapsed_fields[name])
+
+
+class BaseUserSerializer(TimedSerializerMixin, SparseFieldsetMixin,
+                         serializers.ModelSerializer):
 
     avatar = serializers.SerializerMethodField()
     is_subscribed = serializers.SerializerMethodField()
@@ -27,9 +58,10 @@ class BaseUserSerializer(serializers.ModelSerializer):
             obj.avatar.url) if obj.avatar else None
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        return user.is_authenticated and Subscription.objects.filter(
-            user=user, subscriber=obj).exists()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.pk in interactions(
+            self.context.get('request').user).follows
 
     class Meta:
         """Meta."""
@@ -114,6 +146,8 @@ class SubscribedUserSerializer(BaseUserSerializer):
         ).data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
 
@@ -146,6 +180,7 @@ class SubscriptionSerializer(serializers.Serializer):
         author = self.context.get('author')
         subscription = Subscription.objects.create(
             user=user, subscriber=author)
+        backfill(user, author)
         return subscription
 
     def delete(self):
@@ -153,6 +188,7 @@ class SubscriptionSerializer(serializers.Serializer):
         user = self.context['request'].user
         author = self.context.get('author')
         Subscription.objects.filter(user=user, subscriber=author).delete()
+        drop_author(user, author)
 
     def to_representation(self, instance):
         """Возвращает данные о подписке."""
@@ -176,7 +212,8 @@ class AvatarSerializer(serializers.ModelSerializer):
         fields = ('avatar',)
 
 
-class IngredientsSerializer(serializers.ModelSerializer):
+class IngredientsSerializer(TimedSerializerMixin,
+                            serializers.ModelSerializer):
     """Сериализатор рецептов."""
 
     class Meta:
@@ -186,7 +223,8 @@ class IngredientsSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit')
 
 
-class ShortRecipeSerializer(serializers.ModelSerializer):
+class ShortRecipeSerializer(TimedSerializerMixin,
+                            serializers.ModelSerializer):
     """Сериализатор для вывода рецептов в подписках."""
 
     image = Base64ImageField(required=False, allow_null=True)
@@ -213,7 +251,7 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class TagsSerializer(serializers.ModelSerializer):
+class TagsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор рецептов."""
 
     name = serializers.ReadOnlyField()
@@ -286,6 +324,16 @@ class FavoriteSerializer(BaseFavoriteShoppingCartCerializer):
         model_name = 'recipe'
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    """Сериализатор списка id рецептов для получения нескольких рецептов."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False, max_length=MAX_RECIPES_MULTI_GET,
+        error_messages={'max_length': (
+            f'Можно запросить не больше {MAX_RECIPES_MULTI_GET} рецептов.')})
+
+
 class RecipeIngredientCreateSerializer(serializers.Serializer):
     """Сериализатор для обработки ингредиентов и их количества в рецепте."""
 
@@ -301,9 +349,18 @@ class RecipeIngredientCreateSerializer(serializers.Serializer):
         return value
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(TimedSerializerMixin, SparseFieldsetMixin,
+                       serializers.ModelSerializer):
     """Общий сериализатор для рецептов."""
 
+    collapsed_fields = {
+        'author': serializers.PrimaryKeyRelatedField(read_only=True),
+        'tags': serializers.PrimaryKeyRelatedField(many=True, read_only=True),
+        'ingredients': serializers.SlugRelatedField(
+            many=True, read_only=True, slug_field='ingredient_id',
+            source='recipeingredient_set'),
+    }
+
     image = Base64ImageField(required=True)
     author = BaseUserSerializer(
         read_only=True, default=serializers.CurrentUserDefault())
@@ -322,14 +379,11 @@ class RecipeSerializer(serializers.ModelSerializer):
             'tags', 'cooking_time', 'is_favorited', 'is_in_shopping_cart')
 
     def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        return user.is_authenticated and obj.favorites.filter(
-            user=user).exists()
+        return obj.pk in interactions(
+            self.context.get('request').user).favorites
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        return user.is_authenticated and obj.shopping_carts.filter(
-            user=user).exists()
+        return obj.pk in interactions(self.context.get('request').user).cart
 
 
 class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
@@ -0,0 +1,170 @@
+"""
+Разрешение коротких ссылок без запросов к базе.
+
+Ответ для кода ищется по порядку:
+
+1. в кэше (api/cache.py) под тегом кода: там хранятся и найденные
+   рецепты, и ненайденные коды (с меньшим временем жизни), а изменение
+   рецепта сбрасывает запись во всех процессах;
+2. в фильтре Блума по кодам опубликованных рецептов: кода, которого в
+   нем нет, не существует, и он отбрасывается без запроса;
+3. в базе по уникальному индексу Recipe.short_code.
+
+Фильтр строится двумя запросами при первом обращении и перестраивается
+раз в SHORT_LINK_FILTER_REFRESH секунд. Коды новых рецептов
+добавляются в него по тегу recipes: если тег изменился с прошлой
+сборки, перед запросом к базе догружаются рецепты с большими id.
+"""
+
+import hashlib
+import math
+import threading
+import time
+
+from django.core.cache import cache
+from django.db.models import Max
+
+from api.cache import MISSING, tag_versions, tagged_key
+from api.constants import (SHORT_LINK_CACHE_TIMEOUT,
+                           SHORT_LINK_FILTER_ERROR_RATE,
+                           SHORT_LINK_FILTER_REFRESH,
+                           SHORT_LINK_NEGATIVE_CACHE_TIMEOUT)
+from api.metrics import record_cache
+from recipes.models import Recipe
+
+
+class BloomFilter:
+    """Фильтр Блума по строкам: возможны только ложноположительные."""
+
+    def __init__(self, capacity, error_rate):
+        capacity = max(capacity, 1)
+        self.size = max(8, math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + number * second) % self.size
+                for number in range(self.hashes))
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self.positions(key))
+
+
+class ShortLinkResolver:
+    """Фильтр коротких кодов процесса и обращения к кэшу."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.filter = None
+            self.max_id = 0
+            self.version = None
+            self.built_at = None
+
+    def is_stale(self):
+        return self.built_at is None or (
+            time.monotonic() - self.built_at >= SHORT_LINK_FILTER_REFRESH)
+
+    @staticmethod
+    def recipes_version():
+        return tag_versions(('recipes',))[0]
+
+    def rebuild(self):
+        """Строит фильтр по кодам всех опубликованных рецептов."""
+        version = self.recipes_version()
+        codes = Recipe.objects.exclude(short_code=None).values_list(
+            'short_code', flat=True)
+        codes = list(codes.iterator())
+        bloom = BloomFilter(2 * len(codes), SHORT_LINK_FILTER_ERROR_RATE)
+        for code in codes:
+            bloom.add(code)
+        max_id = Recipe.all_objects.aggregate(Max('id'))['id__max'] or 0
+        with self.lock:
+            self.filter, self.max_id = bloom, max_id
+            self.version = version
+            self.built_at = time.monotonic()
+
+    def sync(self):
+        """
+        Добавляет в фильтр коды рецептов, созданных после его сборки.
+
+        Рецепты без кода еще сохраняются: они и следующие за ними
+        добавятся при следующем изменении тега recipes.
+        """
+        version = self.recipes_version()
+        with self.lock:
+            max_id = self.max_id
+        rows = list(Recipe.all_objects.filter(id__gt=max_id).values_list(
+            'id', 'short_code'))
+        with self.lock:
+            for recipe_id, code in sorted(rows):
+                if code is None:
+                    break
+                self.filter.add(code)
+                self.max_id = max(self.max_id, recipe_id)
+            self.version = version
+
+    @staticmethod
+    def cache_key(code):
+        return tagged_key('short_links', code, (f'short_link:{code}',))
+
+    def cached(self, code):
+        """
+        Ответ, известный без запроса к базе.
+
+        Возвращает (True, id рецепта или None), если код найден в кэше
+        или отброшен фильтром, и (False, None), если нужен запрос:
+        кода нет ни в кэше, ни в фильтре, но с построения фильтра
+        рецепты менялись.
+        """
+        value = cache.get(self.cache_key(code), MISSING)
+        record_cache('short_links', value is not MISSING)
+        if value is not MISSING:
+            return True, value
+        return self.rejected(code), None
+
+    def rejected(self, code):
+        """Отброшен ли код фильтром, актуальным для текущих рецептов."""
+        with self.lock:
+            if self.is_stale() or code in self.filter:
+                return False
+            version = self.version
+        return self.recipes_version() == version
+
+    def remember(self, code, recipe_id):
+        cache.set(
+            self.cache_key(code), recipe_id,
+            SHORT_LINK_CACHE_TIMEOUT if recipe_id is not None
+            else SHORT_LINK_NEGATIVE_CACHE_TIMEOUT)
+
+    def resolve(self, code):
+        """
+        Идентификатор опубликованного рецепта по коду или None.
+
+        Вызывается после промаха cached(): кэш повторно не проверяется.
+        """
+        if self.is_stale():
+            self.rebuild()
+        elif self.recipes_version() != self.version:
+            self.sync()
+        if self.rejected(code):
+            return None
+        recipe_id = Recipe.objects.filter(short_code=code).values_list(
+            'id', flat=True).first()
+        self.remember(code, recipe_id)
+        return recipe_id
+
+
+resolver = ShortLinkResolver()
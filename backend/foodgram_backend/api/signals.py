@@ -0,0 +1,79 @@
+"""
+Инвалидация кэша по изменениям моделей.
+
+Сохранение и удаление объекта меняют версии его тегов, изменение тегов
+рецепта - версии тегов рецептов. Массовые операции (bulk_create,
+update у QuerySet) сигналов не отправляют и кэш не трогают: код,
+изменяющий так рецепты, отправляет recipes_changed; удаление
+через QuerySet отправляет post_delete для каждого объекта, поэтому у
+этих моделей оно выполняется двумя запросами вместо одного.
+
+Изменения избранного, корзины и подписок сбрасывают и множества id
+пользователя (api/interactions.py): они перечитываются из базы при
+следующем обращении.
+"""
+
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from api.cache import invalidate
+from recipes.feed import crossed_fanout_limit
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                            Subscription, Tag, User, recipes_changed)
+
+# Теги кэша, которые затрагивает изменение объекта модели
+MODEL_TAGS = {
+    Recipe: lambda recipe: (
+        'recipes', f'recipe:{recipe.pk}',
+        f'user:{recipe.author_id}:recipes',
+        f'short_link:{recipe.short_code}'),
+    Tag: lambda tag: ('tags',),
+    Ingredient: lambda ingredient: ('ingredients',),
+    User: lambda user: (f'user:{user.pk}',),
+    Favorite: lambda favorite: (
+        f'recipe:{favorite.recipe_id}:favorites',
+        f'user:{favorite.user_id}:favorites'),
+    ShoppingCart: lambda cart: (f'user:{cart.user_id}:cart',),
+    Subscription: lambda subscription: (
+        f'user:{subscription.subscriber_id}:subscribers',
+        f'user:{subscription.user_id}:subscriptions'),
+}
+
+
+def invalidate_instance(sender, instance, **kwargs):
+    invalidate(*MODEL_TAGS[sender](instance))
+
+
+# Обработчики подключаются только к этим моделям: обработчик post_delete
+# без sender отключил бы быстрое удаление одним запросом у всех моделей
+for model in MODEL_TAGS:
+    post_save.connect(invalidate_instance, sender=model)
+    post_delete.connect(invalidate_instance, sender=model)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate(*MODEL_TAGS[Recipe](instance))
+    else:
+        invalidate('recipes', *(f'recipe:{pk}' for pk in pk_set or ()))
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_popular_authors(sender, instance, signal, created=False,
+                               **kwargs):
+    """Сбрасывает списки популярных авторов лент всех пользователей."""
+    if signal is post_save and not created:
+        return
+    if crossed_fanout_limit(instance.subscriber_id, signal is post_save):
+        invalidate('feed_popular_authors')
+
+
+@receiver(recipes_changed)
+def invalidate_changed_recipes(sender, recipes, **kwargs):
+    invalidate(*(tag for recipe in recipes
+                 for tag in MODEL_TAGS[Recipe](recipe)))
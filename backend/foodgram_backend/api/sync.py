@@ -0,0 +1,160 @@
+"""
+Синхронизация клиентов по изменениям.
+
+Клиент передает курсор из предыдущего ответа и получает теги,
+ингредиенты и рецепты, измененные после него, и id удаленных объектов
+(Tombstone). Курсор хранит для каждого источника позицию (время, id)
+последней отданной записи; за один ответ отдается не больше limit
+записей всех источников. Записи моложе SYNC_SETTLE_SECONDS не
+отдаются: транзакция, начатая раньше, могла еще не зафиксироваться, и
+ее изменения оказались бы позади курсора.
+"""
+
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodeError
+from datetime import datetime, timedelta, timezone
+
+from django.db.models import Q
+from django.utils.timezone import now
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from api.constants import SYNC_SETTLE_SECONDS
+from api.fast_serializers import recipe_payloads
+from recipes.constants import TOMBSTONE_RETENTION_DAYS
+from recipes.models import Ingredient, Recipe, Tag, Tombstone
+
+# Источники изменений: менеджер, поле времени и поля записи
+SOURCES = {
+    'tags': (lambda: Tag.objects, 'updated_at', ('name', 'slug')),
+    'ingredients': (lambda: Ingredient.objects, 'updated_at',
+                    ('name', 'measurement_unit')),
+    'recipes': (lambda: Recipe.objects, 'updated_at', ()),
+    'deleted': (lambda: Tombstone.objects, 'deleted_at',
+                ('model', 'object_id')),
+}
+
+# Ключ списка удаленных объектов для модели записи об удалении
+DELETED_KEYS = {
+    'recipe': 'recipes',
+    'ingredient': 'ingredients',
+    'tag': 'tags',
+}
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Границы позиции курсора: время, представимое datetime, и id,
+# помещающийся в bigint базы
+MAX_MICROS = (datetime.max.replace(tzinfo=timezone.utc)
+              - EPOCH) // timedelta(microseconds=1)
+MAX_ID = 2 ** 63 - 1
+
+
+class CursorExpired(APIException):
+    """Записи об удалениях после курсора уже очищены."""
+
+    status_code = status.HTTP_410_GONE
+    default_detail = 'Курсор устарел, нужна полная синхронизация.'
+    default_code = 'cursor_expired'
+
+
+def to_micros(moment):
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(value):
+    return EPOCH + timedelta(microseconds=value)
+
+
+def encode_cursor(positions):
+    return urlsafe_b64encode(
+        json.dumps(positions, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(value):
+    """Позиции источников из курсора; ValueError, если курсор неверный."""
+    try:
+        positions = json.loads(urlsafe_b64decode(value.encode('ascii')))
+    except (DecodeError, UnicodeError) as error:
+        raise ValueError(value) from error
+    if not isinstance(positions, dict) or set(positions) != set(SOURCES):
+        raise ValueError(value)
+    for position in positions.values():
+        if position is None:
+            continue
+        if (not isinstance(position, list) or len(position) != 2
+                or not isinstance(position[0], int)
+                or not 0 <= position[0] <= MAX_MICROS
+                or not isinstance(position[1], (int, type(None)))
+                or position[1] is not None
+                and not 0 <= position[1] <= MAX_ID):
+            raise ValueError(value)
+    return positions
+
+
+def _after(field, position):
+    """Условие на записи после позиции (время, id)."""
+    moment, pk = from_micros(position[0]), position[1]
+    condition = Q(**{f'{field}__gt': moment})
+    if pk is not None:
+        condition |= Q(**{field: moment, 'id__gt': pk})
+    return condition
+
+
+def read_batch(request, positions, limit):
+    """
+    Изменения после позиций курсора (None - первая синхронизация).
+
+    Возвращает данные ответа: записи источников, удаленные id по
+    моделям, новый курсор и признак has_more, что изменений больше
+    limit. Дочитанный источник получает позицию на границе выборки,
+    поэтому курсор активного клиента не устаревает без удалений.
+    """
+    until = now() - timedelta(seconds=SYNC_SETTLE_SECONDS)
+    if positions is None:
+        positions = dict.fromkeys(SOURCES)
+        positions['deleted'] = [to_micros(until), None]
+    else:
+        deleted = positions['deleted']
+        expired = now() - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+        if deleted is None or from_micros(deleted[0]) < expired:
+            raise CursorExpired
+    rows = {}
+    has_more = False
+    remaining = limit
+    for name, (manager, field, columns) in SOURCES.items():
+        if not remaining:
+            rows[name] = []
+            has_more = True
+            continue
+        queryset = manager().filter(**{f'{field}__lte': until})
+        if positions[name] is not None:
+            queryset = queryset.filter(_after(field, positions[name]))
+        found = list(queryset.order_by(field, 'id').values_list(
+            'id', field, *columns)[:remaining + 1])
+        if len(found) > remaining:
+            found = found[:remaining]
+            has_more = True
+            positions[name] = [to_micros(found[-1][1]), found[-1][0]]
+        else:
+            positions[name] = [to_micros(until), None]
+        remaining -= len(found)
+        rows[name] = found
+
+    deleted = {key: [] for key in DELETED_KEYS.values()}
+    for _, _, model, object_id in rows['deleted']:
+        deleted[DELETED_KEYS[model]].append(object_id)
+    return {
+        'cursor': encode_cursor(positions),
+        'has_more': has_more,
+        'tags': [
+            {'id': pk, 'name': name, 'slug': slug}
+            for pk, _, name, slug in rows['tags']],
+        'ingredients': [
+            {'id': pk, 'name': name, 'measurement_unit': unit}
+            for pk, _, name, unit in rows['ingredients']],
+        'recipes': recipe_payloads(
+            [pk for pk, _ in rows['recipes']], request),
+        'deleted': deleted,
+    }
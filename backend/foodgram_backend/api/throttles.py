@@ -0,0 +1,175 @@
+"""
+Ограничение частоты дорогих запросов.
+
+Вход и смена пароля считают PBKDF2, создание рецепта и загрузка аватара
+декодируют изображение. Запрос такого класса (scope) расходует токен из
+корзины клиента и из общей корзины класса; корзины пополняются с
+постоянной скоростью. Когда средняя загрузка процессора превышает
+THROTTLE_LOAD_START, запрос расходует из общей корзины больше токенов,
+и дорогие запросы отклоняются раньше, чем процессор будет занят ими
+целиком. Отклоненный запрос получает 429 с заголовком Retry-After.
+
+Корзины хранятся в общем кэше, а пока он недоступен - в памяти
+процесса. Чтение и запись корзины не атомарны: одновременные запросы
+могут пройти сверх вместимости на несколько токенов.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+from api.cache import shared_cache
+from api.constants import (THROTTLE_CLIENT_BUCKETS, THROTTLE_LOAD_LIMIT,
+                           THROTTLE_LOAD_START, THROTTLE_LOCAL_BUCKETS_SIZE,
+                           THROTTLE_MAX_COST, THROTTLE_TOTAL_BUCKETS)
+from api.metrics import THROTTLED_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Корзины процесса на время недоступности общего кэша: ключ -> состояние
+_local_buckets = {}
+_local_lock = threading.Lock()
+
+
+class LocalBuckets:
+    """Хранилище корзин в памяти процесса с интерфейсом кэша."""
+
+    def get_many(self, keys):
+        with _local_lock:
+            return {key: _local_buckets[key] for key in keys
+                    if key in _local_buckets}
+
+    def set_many(self, data, timeout):
+        with _local_lock:
+            if len(_local_buckets) > THROTTLE_LOCAL_BUCKETS_SIZE:
+                _local_buckets.clear()
+            _local_buckets.update(data)
+
+
+def load_cost():
+    """Количество токенов общей корзины на запрос при текущей загрузке."""
+    try:
+        load = os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return 1
+    if load <= THROTTLE_LOAD_START:
+        return 1
+    share = min(1, (load - THROTTLE_LOAD_START) / (
+        THROTTLE_LOAD_LIMIT - THROTTLE_LOAD_START))
+    return 1 + share * (THROTTLE_MAX_COST - 1)
+
+
+def take(buckets, now):
+    """
+    Расходует токены из корзин, если их хватает во всех.
+
+    buckets - список (ключ, вместимость, токенов в минуту, стоимость).
+    Возвращает None, если запрос разрешен, иначе время в секундах, через
+    которое токенов станет достаточно.
+    """
+    keys = [key for key, *_ in buckets]
+    try:
+        storage = shared_cache()
+        states = storage.get_many(keys)
+    except Exception:
+        # Бэкенд общего кэша (Redis, memcached) сообщает о недоступности
+        # своими исключениями
+        logger.warning('Общий кэш недоступен, корзины хранятся в процессе.',
+                       exc_info=True)
+        storage = LocalBuckets()
+        states = storage.get_many(keys)
+    updated = {}
+    wait = timeout = 0
+    for key, capacity, per_minute, cost in buckets:
+        rate = per_minute / 60
+        # Корзина, которая успеет наполниться, из кэша не нужна
+        timeout = max(timeout, math.ceil(capacity / rate))
+        cost = min(cost, capacity)
+        tokens = capacity
+        if key in states:
+            tokens, moment = states[key]
+            tokens = min(capacity, tokens + (now - moment) * rate)
+        if tokens < cost:
+            wait = max(wait, (cost - tokens) / rate)
+        updated[key] = (tokens - cost, now)
+    if wait:
+        return wait
+    try:
+        storage.set_many(updated, timeout)
+    except Exception:
+        logger.warning('Общий кэш недоступен, корзины хранятся в процессе.',
+                       exc_info=True)
+        LocalBuckets().set_many(updated, timeout)
+    return None
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Ограничение частоты запросов класса scope корзинами токенов.
+
+    Клиент - пользователь или, для анонимного запроса, IP-адрес;
+    подклассы могут добавить другие признаки клиента в clients().
+    """
+
+    scope = None
+
+    def clients(self, request):
+        if request.user and request.user.is_authenticated:
+            return [f'user:{request.user.pk}']
+        return [f'ip:{self.get_ident(request)}']
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        if not settings.THROTTLING:
+            return True
+        buckets = [
+            (f'throttle:{self.scope}:{client}',
+             *THROTTLE_CLIENT_BUCKETS[self.scope], 1)
+            for client in self.clients(request)]
+        buckets.append((f'throttle:{self.scope}',
+                        *THROTTLE_TOTAL_BUCKETS[self.scope], load_cost()))
+        self.wait_seconds = take(buckets, time.time())
+        if self.wait_seconds is None:
+            return True
+        THROTTLED_REQUESTS.labels(self.scope).inc()
+        return False
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class LoginThrottle(TokenBucketThrottle):
+    """Вход: корзины IP-адреса и учетной записи, на которую входят."""
+
+    scope = 'login'
+
+    def clients(self, request):
+        clients = super().clients(request)
+        data = request.data
+        email = data.get('email') if isinstance(data, dict) else None
+        if isinstance(email, str) and email:
+            clients.append(f'email:{email.lower()}')
+        return clients
+
+
+class PasswordThrottle(TokenBucketThrottle):
+    """Регистрация и смена пароля."""
+
+    scope = 'password'
+
+
+class UploadThrottle(TokenBucketThrottle):
+    """Запросы с загрузкой изображений; удаление и чтение не ограничены."""
+
+    scope = 'upload'
+
+    def allow_request(self, request, view):
+        if request.method not in ('POST', 'PUT', 'PATCH'):
+            self.wait_seconds = None
+            return True
+        return super().allow_request(request, view)
@@ -3,9 +3,10 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from api.views import (IngredientsViewSet, LoginView, LogoutView,
-                       ReciepesViewSet, TagsViewSet,
-                       UserViewSet, short_link_redirect)
+from api.views import (EventsTicketView, IngredientsViewSet, LoginView,
+                       LogoutView, ReciepesViewSet, SyncView, TagsViewSet,
+                       UserViewSet, download_shopping_cart,
+                       events_unavailable, short_link_redirect)
 
 app_name = 'api'
 
@@ -21,6 +22,15 @@ urlpatterns = [
 
     path('auth/token/logout/', LogoutView.as_view(), name='logout'),
 
+    path('sync/', SyncView.as_view(), name='sync'),
+
+    path('events/', events_unavailable, name='events'),
+
+    path('events/ticket/', EventsTicketView.as_view(), name='events-ticket'),
+
+    path('recipes/download_shopping_cart/', download_shopping_cart,
+         name='recipes-download-shopping-cart'),
+
     path('', include(router.urls)),
 
     path('<str:short_code>', short_link_redirect, name='short_link_redirect')
@@ -1,16 +1,21 @@
 """Вьюсеты."""
 
-from hashids import Hashids
+from asgiref.sync import sync_to_async
 
-from django.conf import settings
 from django.contrib.auth import authenticate
-from django.db.models import Sum
-from django.http import FileResponse
+from django.db.models import (BooleanField, Count, OuterRef, Prefetch, Q,
+                              Subquery, Sum, Value, prefetch_related_objects)
+from django.http import (Http404, HttpResponseNotAllowed, JsonResponse,
+                         StreamingHttpResponse)
 from django.shortcuts import get_object_or_404, redirect
+from django.utils.cache import patch_cache_control
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
+from rest_framework.authentication import TokenAuthentication
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import action
+from rest_framework.exceptions import (AuthenticationFailed, NotAuthenticated,
+                                       ValidationError)
 from rest_framework.filters import OrderingFilter, SearchFilter
 from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.permissions import (AllowAny, IsAuthenticated,
@@ -19,28 +24,40 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
-from api.constants import MIN_LENGTH_HASH_CODE
+from api.constants import (SHOPPING_CART_CHUNK_SIZE,
+                           SHORT_LINK_REDIRECT_MAX_AGE, SYNC_BATCH_SIZE,
+                           SYNC_MAX_BATCH_SIZE)
+from api.fast_serializers import recipe_payloads
+from api.events import issue_ticket
 from api.filters import IngredientFilter, RecipeFilter
-from api.paginators import RecipePagination
-from api.permissions import IsAuthorOrReadOnly
+from api.instrumentation import span
+from api.interactions import feed_popular_authors
+from api.metrics import (IMAGE_UPLOADS, RECIPES_CREATED,
+                         SHOPPING_CART_DOWNLOADS)
+from api.paginators import FeedCursorPagination, RecipePagination
+from api.permissions import IsAuthorOrReadOnly, IsCurrentUser
 from api.serializers import (AvatarSerializer, BaseUserSerializer,
                              FavoriteSerializer, IngredientsSerializer,
                              LoginSerializer, RecipeCreateUpdateSerializer,
-                             RecipeSerializer, SetPasswordSerializer,
+                             RecipeIdsSerializer, RecipeSerializer,
+                             SetPasswordSerializer,
                              ShoppingCartSerializer, ShortRecipeSerializer,
                              SubscribedUserSerializer, SubscriptionSerializer,
                              TagsSerializer, UserCreateSerializer,
                              UserRegistrationSerializer)
-from recipes.models import (Ingredient, RecipeIngredient, Recipe, ShoppingCart,
-                            Tag, User)
-
-hashids = Hashids(min_length=MIN_LENGTH_HASH_CODE, salt=settings.SECRET_KEY)
+from api.short_links import resolver as short_links
+from api.sync import decode_cursor, read_batch
+from api.throttles import LoginThrottle, PasswordThrottle, UploadThrottle
+from recipes.feed import fan_out_recipe, get_feed_ids
+from recipes.models import (Ingredient, RecipeIngredient, Recipe,
+                            ShoppingCart, Tag, User)
 
 
 class LoginView(APIView):
     """Получение токена."""
 
     permission_classes = (AllowAny,)
+    throttle_classes = (LoginThrottle,)
 
     def post(self, request):
         """Получение токена авторизации по email и паролю."""
@@ -74,6 +91,57 @@ class LogoutView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class EventsTicketView(APIView):
+    """Одноразовый билет для подключения к потоку событий."""
+
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        return Response(
+            {'ticket': issue_ticket(request.user.pk)},
+            status=status.HTTP_201_CREATED)
+
+
+def events_unavailable(request):
+    """
+    Поток событий при запуске через WSGI.
+
+    Под ASGI запросы к потоку обслуживает api.events.events_app до
+    Django, через WSGI поток недоступен.
+    """
+    return JsonResponse(
+        {'detail': 'Поток событий доступен только при запуске через ASGI '
+                   '(GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker).'},
+        status=501, json_dumps_params={'ensure_ascii': False})
+
+
+class SyncView(APIView):
+    """
+    Изменения тегов, ингредиентов и рецептов для синхронизации клиентов.
+
+    Без параметра since отдаются все объекты, дальше клиент передает
+    курсор из предыдущего ответа и получает только изменения и id
+    удаленных объектов. Пока has_more истинно, клиент сразу запрашивает
+    следующую пачку.
+    """
+
+    permission_classes = (AllowAny,)
+    use_read_replica = True
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params['limit'])
+        except (KeyError, ValueError):
+            limit = SYNC_BATCH_SIZE
+        limit = min(max(limit, 1), SYNC_MAX_BATCH_SIZE)
+        since = request.query_params.get('since')
+        try:
+            positions = decode_cursor(since) if since else None
+        except ValueError:
+            raise ValidationError({'since': 'Неверный курсор.'})
+        return Response(read_batch(request, positions, limit))
+
+
 def handle_action(request, pk, model, serializer, context_key, viewset):
     """Реализована общая логика методов favorite, shopping_cart, subscribe."""
     obj = get_object_or_404(model, pk=pk)
@@ -92,18 +160,67 @@ def handle_action(request, pk, model, serializer, context_key, viewset):
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class UserViewSet(ModelViewSet):
+class SparseFieldsetMixin:
+    """
+    Поддержка параметров fields и expand.
+
+    fields — список полей ответа через запятую, expand — связи, которые
+    нужно вывести вложенными объектами. Без fields ответ полный.
+    """
+
+    def get_sparse_fieldset(self):
+        if not hasattr(self, '_sparse_fieldset'):
+            params = self.request.query_params
+            fields = params.get('fields')
+            self._sparse_fieldset = (
+                None if fields is None else set(fields.split(',')),
+                set(params.get('expand', '').split(',')))
+        return self._sparse_fieldset
+
+    def includes(self, name):
+        """Попадет ли поле в ответ."""
+        fields, expand = self.get_sparse_fieldset()
+        return fields is None or name in fields or name in expand
+
+    def expands(self, name):
+        """Будет ли связь выведена вложенным объектом."""
+        fields, expand = self.get_sparse_fieldset()
+        return fields is None or name in expand
+
+    def only_fields(self, queryset, names):
+        """Ограничивает выборку столбцами запрошенных полей."""
+        if self.get_sparse_fieldset()[0] is None:
+            return queryset
+        return queryset.only(
+            'id', *(name for name in names if self.includes(name)))
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        fields, expand = self.get_sparse_fieldset()
+        if fields is not None:
+            context.update(fields=fields, expand=expand)
+        return context
+
+
+class UserViewSet(SparseFieldsetMixin, ModelViewSet):
     """View для запросов к пользователям."""
 
-    queryset = User.objects.all()
+    queryset = User.objects.filter(deleted_at__isnull=True)
     serializer_class = BaseUserSerializer
     permission_classes = (AllowAny,)
     pagination_class = LimitOffsetPagination
+    use_read_replica = True
     filter_backends = (SearchFilter, OrderingFilter)
     search_fields = ('recipes__tags__slug', 'username',)
     ordering_fields = ('username',)
     http_method_names = ('get', 'post', 'put', 'delete')
 
+    def get_queryset(self):
+        """Загружаем только поля, которые попадут в ответ."""
+        return self.only_fields(
+            super().get_queryset(),
+            ('username', 'email', 'first_name', 'last_name', 'avatar'))
+
     def get_permissions(self):
         """Установка прав доступа."""
         permission_classes_map = {
@@ -113,11 +230,23 @@ class UserViewSet(ModelViewSet):
             'subscribe': (IsAuthenticated,),
             'recipes': (AllowAny,),
             'create': (AllowAny,),
+            'update': (IsAuthenticated, IsCurrentUser),
+            'destroy': (IsAuthenticated, IsCurrentUser),
             'set_password': (IsAuthenticated,)
         }
         return [permission() for permission in permission_classes_map.get(
             self.action, self.permission_classes)]
 
+    def get_throttles(self):
+        """Ограничение частоты запросов с хешированием пароля и загрузкой."""
+        throttle_classes_map = {
+            'create': (PasswordThrottle,),
+            'set_password': (PasswordThrottle,),
+            'avatar': (UploadThrottle,),
+        }
+        return [throttle() for throttle in throttle_classes_map.get(
+            self.action, self.throttle_classes)]
+
     def create(self, request, *args, **kwargs):
         """Создание пользователя."""
         serializer = UserCreateSerializer(data=request.data)
@@ -143,6 +272,9 @@ class UserViewSet(ModelViewSet):
         user.set_password(serializer.validated_data['password'])
         user.save()
 
+    def perform_destroy(self, instance):
+        instance.soft_delete()
+
     @action(detail=False, methods=['get'])
     def me(self, request):
         """Получение своих данных."""
@@ -177,6 +309,7 @@ class UserViewSet(ModelViewSet):
             serializer = AvatarSerializer(user, data=request.data)
             serializer.is_valid(raise_exception=True)
             serializer.save()
+            IMAGE_UPLOADS.labels('avatar').inc()
             return Response(serializer.data)
         user.avatar = None
         user.save()
@@ -186,12 +319,30 @@ class UserViewSet(ModelViewSet):
     def subscriptions(self, request):
         """Получение списка подписок."""
         user = request.user
-        queryset = User.objects.filter(subscribers__user=user)
+        queryset = self.only_fields(User.objects.filter(
+            subscribers__user=user, deleted_at__isnull=True),
+            ('username', 'email', 'first_name', 'last_name', 'avatar'))
+        if self.includes('recipes_count'):
+            queryset = queryset.annotate(recipes_count=Count(
+                'recipes', filter=Q(recipes__deleted_at__isnull=True)))
+        queryset = queryset.annotate(is_subscribed=Value(
+            True, output_field=BooleanField()))
         recipes_limit = request.query_params.get('recipes_limit')
         page = self.paginate_queryset(queryset)
-        serializer = SubscribedUserSerializer(
-            page, many=True, context={
-                'request': request, 'recipes_limit': recipes_limit})
+        if self.includes('recipes'):
+            recipes = Recipe.objects.only(
+                'name', 'image', 'cooking_time', 'author_id')
+            if recipes_limit and recipes_limit.isdigit():
+                # Из базы читаются только первые recipes_limit рецептов
+                # каждого автора, а не все его рецепты
+                recipes = recipes.filter(id__in=Subquery(
+                    Recipe.objects.filter(
+                        author_id=OuterRef('author_id')).values('id')[
+                        :int(recipes_limit)]))
+            prefetch_related_objects(page, Prefetch('recipes', recipes))
+        context = self.get_serializer_context()
+        context['recipes_limit'] = recipes_limit
+        serializer = SubscribedUserSerializer(page, many=True, context=context)
         return self.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=['post', 'delete'])
@@ -201,27 +352,116 @@ class UserViewSet(ModelViewSet):
             request, pk, User, SubscriptionSerializer, 'author', self)
 
 
-class ReciepesViewSet(viewsets.ModelViewSet):
+class ReciepesViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """Вьюсет для обработки запросов к рецептам."""
 
     queryset = Recipe.objects.all().order_by('-pub_date')
     serializer_class = RecipeSerializer
     permission_classes = (IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly)
     pagination_class = RecipePagination
+    use_read_replica = True
     filter_backends = (DjangoFilterBackend, SearchFilter, OrderingFilter)
     filterset_class = RecipeFilter
     http_method_names = ('get', 'post', 'patch', 'delete')
 
+    def get_queryset(self):
+        """Загружаем только поля и связи, которые попадут в ответ."""
+        queryset = self.only_fields(
+            super().get_queryset(),
+            ('name', 'image', 'text', 'cooking_time', 'author'))
+        if self.expands('author'):
+            queryset = queryset.prefetch_related('author')
+        if self.includes('tags'):
+            queryset = queryset.prefetch_related('tags')
+        if self.expands('ingredients'):
+            queryset = queryset.prefetch_related(
+                'recipeingredient_set__ingredient')
+        elif self.includes('ingredients'):
+            queryset = queryset.prefetch_related('recipeingredient_set')
+        return queryset
+
+    def serialize_recipes(self, recipe_ids):
+        """
+        Представления рецептов в порядке recipe_ids.
+
+        Полные представления собираются из закэшированных карточек или
+        быстрым путем без сериализаторов, сокращенные (с параметром
+        fields) — через RecipeSerializer.
+        """
+        if self.get_sparse_fieldset()[0] is None:
+            with span('serialize'):
+                return recipe_payloads(recipe_ids, self.request)
+        recipes = self.get_queryset().in_bulk(recipe_ids)
+        return self.get_serializer(
+            [recipes[pk] for pk in recipe_ids if pk in recipes],
+            many=True).data
+
+    def retrieve(self, request, *args, **kwargs):
+        """Рецепт из закэшированной карточки без загрузки модели."""
+        pk = kwargs[self.lookup_field]
+        if not pk.isdigit():
+            raise Http404
+        rows = self.serialize_recipes([int(pk)])
+        if not rows:
+            raise Http404
+        return Response(rows[0])
+
+    def multi_get(self, ids):
+        """
+        Рецепты с id из списка ids в порядке запроса.
+
+        Повторы id отбрасываются, id отсутствующих рецептов выводятся в
+        missing.
+        """
+        serializer = RecipeIdsSerializer(data={'ids': ids})
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = list(dict.fromkeys(serializer.validated_data['ids']))
+        rows = self.serialize_recipes(recipe_ids)
+        missing = []
+        if len(rows) < len(recipe_ids):
+            found = set(Recipe.objects.filter(
+                id__in=recipe_ids).values_list('id', flat=True))
+            missing = [pk for pk in recipe_ids if pk not in found]
+        return Response({
+            'count': len(rows), 'results': rows, 'missing': missing})
+
+    def list(self, request, *args, **kwargs):
+        """
+        Список рецептов: страница id и быстрая сборка представлений.
+
+        С параметром ids=1,2,3 выводятся рецепты с этими id без
+        фильтров и пагинации.
+        """
+        if 'ids' in request.query_params:
+            return self.multi_get(request.query_params['ids'].split(','))
+        queryset = self.filter_queryset(super().get_queryset())
+        page = self.paginate_queryset(queryset.values_list('id', flat=True))
+        return self.get_paginated_response(self.serialize_recipes(page))
+
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        recipe = serializer.save(author=self.request.user)
+        fan_out_recipe(recipe)
+        RECIPES_CREATED.inc()
+        IMAGE_UPLOADS.labels('recipe').inc()
+
+    def perform_update(self, serializer):
+        uploaded = 'image' in serializer.validated_data
+        serializer.save()
+        if uploaded:
+            IMAGE_UPLOADS.labels('recipe').inc()
+
+    def perform_destroy(self, instance):
+        instance.soft_delete()
 
     def get_permissions(self):
         """Установка прав доступа."""
         permission_classes_map = {
             'get_link': (AllowAny,),
             'retrieve': (AllowAny,),
+            'similar': (AllowAny,),
+            'multi_get_recipes': (AllowAny,),
             'shopping_cart': (IsAuthenticated,),
-            'download_shopping_cart': (IsAuthenticated,),
+            'feed': (IsAuthenticated,),
             'favorite': (IsAuthenticated,),
             'update': (IsAuthorOrReadOnly,),
             'destroy': (IsAuthorOrReadOnly,),
@@ -230,6 +470,15 @@ class ReciepesViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes_map.get(
             self.action, self.permission_classes)]
 
+    def get_throttles(self):
+        """Ограничение частоты запросов с загрузкой изображения."""
+        throttle_classes_map = {
+            'create': (UploadThrottle,),
+            'partial_update': (UploadThrottle,),
+        }
+        return [throttle() for throttle in throttle_classes_map.get(
+            self.action, self.throttle_classes)]
+
     def get_serializer_class(self):
         if self.action in ('create', 'update', 'partial_update'):
             return RecipeCreateUpdateSerializer
@@ -241,32 +490,29 @@ class ReciepesViewSet(viewsets.ModelViewSet):
         return handle_action(
             request, pk, Recipe, ShoppingCartSerializer, 'recipe', self)
 
-    def get_shopping_cart_data(self, user):
-        """Формирование данных для списка покупок."""
-        recipe_cart = ShoppingCart.objects.filter(
-            user=user).values_list('recipe', flat=True)
-        return RecipeIngredient.objects.filter(
-            recipe__in=recipe_cart).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount')).order_by('recipe__name')
-
-    def create_shopping_cart_text(self, queryset):
-        """Формирование текста для списка покупок."""
-        return '\n'.join(
-            f"{data['ingredient__name'].capitalize()} - {data['amount']} "
-            f"{data['ingredient__measurement_unit']}."
-            for data in queryset)
-
     @action(detail=False, methods=['get'])
-    def download_shopping_cart(self, request):
-        """Метод для скачивания списка покупок."""
-        user = request.user
-        queryset = self.get_shopping_cart_data(user)
-        shopping_cart_text = self.create_shopping_cart_text(queryset)
-        response = FileResponse(
-            shopping_cart_text, content_type='text/plain')
-        response['Content-Disposition'] = 'attachment; filename="cart.txt"'
-        return response
+    def feed(self, request):
+        """Метод для получения ленты рецептов авторов из подписок."""
+        paginator = FeedCursorPagination()
+        authors = feed_popular_authors(request.user)
+        recipe_ids = paginator.paginate_ids(
+            request, lambda before, limit: get_feed_ids(
+                request.user, before, limit, authors))
+        return paginator.get_paginated_response(
+            self.serialize_recipes(recipe_ids))
+
+    @action(detail=False, methods=['post'], url_path='multi-get')
+    def multi_get_recipes(self, request):
+        """Рецепты по списку id из тела запроса, для длинных списков."""
+        ids = (request.data.get('ids')
+               if isinstance(request.data, dict) else None)
+        # Тело JSON может быть любым значением, а IntegerField приводит
+        # строки и bool к числу, поэтому типы проверяются строго
+        if not isinstance(ids, list) or any(
+                type(pk) is not int for pk in ids):
+            raise ValidationError(
+                {'ids': 'Ожидается объект с полем ids - списком целых id.'})
+        return self.multi_get(ids)
 
     @action(detail=True, methods=['post', 'delete'])
     def favorite(self, request, pk=None):
@@ -278,24 +524,100 @@ class ReciepesViewSet(viewsets.ModelViewSet):
     def get_link(self, request, pk=None):
         """Метод для возврата короткой ссылки."""
         recipe = get_object_or_404(Recipe, pk=pk)
-        short_id = hashids.encode(recipe.pk)
-        url = f'/api/{short_id}'
+        url = f'/api/{recipe.short_code}'
         absolut_url = request.build_absolute_uri(url)
         return Response(
             {'short-link': absolut_url},
             status=status.HTTP_200_OK)
 
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """Метод для получения похожих рецептов.
+
+        Соседи рассчитываются заранее командой build_similar_recipes.
+        """
+        if not pk.isdigit():
+            raise Http404
+        recipe = get_object_or_404(Recipe.objects.only('id'), pk=pk)
+        queryset = Recipe.objects.filter(
+            similar_to__recipe=recipe).order_by('-similar_to__score')
+        serializer = ShortRecipeSerializer(
+            queryset, many=True, context={'request': request})
+        return Response(serializer.data)
+
 
-def short_link_redirect(request, short_code):
-    """Метод для редиректа с короткой ссылки."""
+def token_user(request):
+    """Пользователь по токену из заголовка Authorization или None."""
+    result = TokenAuthentication().authenticate(request)
+    return result[0] if result else None
+
+
+def unauthorized(detail):
+    response = JsonResponse(
+        {'detail': detail}, status=401,
+        json_dumps_params={'ensure_ascii': False})
+    response['WWW-Authenticate'] = TokenAuthentication.keyword
+    return response
+
+
+def shopping_cart_text(user):
+    """Текст списка покупок: ингредиенты рецептов из корзины."""
+    recipe_cart = ShoppingCart.objects.filter(
+        user=user, recipe__deleted_at__isnull=True).values_list(
+        'recipe', flat=True)
+    queryset = RecipeIngredient.objects.filter(
+        recipe__in=recipe_cart).values(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).annotate(amount=Sum('amount')).order_by('recipe__name')
+    return '\n'.join(
+        f"{data['ingredient__name'].capitalize()} - {data['amount']} "
+        f"{data['ingredient__measurement_unit']}."
+        for data in queryset)
+
+
+async def download_shopping_cart(request):
+    """
+    Метод для скачивания списка покупок.
+
+    Асинхронный: запросы к базе выполняются в потоке через
+    sync_to_async, а отдача файла медленному клиенту под ASGI не
+    занимает поток воркера.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(('GET', 'HEAD'))
     try:
-        recipe_id = hashids.decode(short_code)[0]
-        if not recipe_id:
-            return Response(status=status.HTTP_404_NOT_FOUND)
-        recipe = get_object_or_404(Recipe, pk=recipe_id)
-        return redirect(f'recipes/{recipe.pk}/')
-    except (IndexError, ValueError):
-        return Response(status=status.HTTP_404_NOT_FOUND)
+        user = await sync_to_async(token_user)(request)
+    except AuthenticationFailed as error:
+        return unauthorized(error.detail)
+    if user is None:
+        return unauthorized(NotAuthenticated.default_detail)
+    text = (await sync_to_async(shopping_cart_text)(user)).encode()
+    response = StreamingHttpResponse(
+        (text[start:start + SHOPPING_CART_CHUNK_SIZE]
+         for start in range(0, len(text), SHOPPING_CART_CHUNK_SIZE)),
+        content_type='text/plain')
+    response['Content-Disposition'] = 'attachment; filename="cart.txt"'
+    SHOPPING_CART_DOWNLOADS.inc()
+    return response
+
+
+async def short_link_redirect(request, short_code):
+    """
+    Метод для редиректа с короткой ссылки.
+
+    Известные и отброшенные фильтром коды разрешаются без запроса к
+    базе; редирект кэшируется клиентами.
+    """
+    # Обращения к кэшу и базе блокируют и выполняются в потоке
+    found, recipe_id = await sync_to_async(short_links.cached)(short_code)
+    if not found:
+        recipe_id = await sync_to_async(short_links.resolve)(short_code)
+    if recipe_id is None:
+        raise Http404
+    response = redirect(f'recipes/{recipe_id}/')
+    patch_cache_control(
+        response, public=True, max_age=SHORT_LINK_REDIRECT_MAX_AGE)
+    return response
 
 
 class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
@@ -305,6 +627,7 @@ class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = IngredientsSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
+    use_read_replica = True
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
 
@@ -316,6 +639,7 @@ class TagsViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = TagsSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
+    use_read_replica = True
     filter_backends = (SearchFilter, OrderingFilter)
     search_fields = ('slug',)
     ordering_fields = ('name',)
@@ -3,6 +3,9 @@ ASGI config for foodgram_backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Поток событий пользователя (api/events.py) обслуживается отдельным
+ASGI-приложением, остальные запросы - Django.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 """
@@ -13,4 +16,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram_backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from api.constants import EVENTS_PATH  # noqa: E402
+from api.events import events_app  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == EVENTS_PATH:
+        return await events_app(scope, receive, send)
+    return await django_application(scope, receive, send)
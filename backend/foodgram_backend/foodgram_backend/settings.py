@@ -1,4 +1,6 @@
 import os
+import sys
+import tempfile
 from pathlib import Path
 
 from django.core.management.utils import get_random_secret_key
@@ -10,6 +12,13 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = os.getenv('SECRET_KEY', get_random_secret_key())
 
+# Соль коротких кодов рецептов (recipes/short_codes.py). По умолчанию -
+# SECRET_KEY из окружения, как у ссылок, выданных до появления
+# Recipe.short_code. Случайный SECRET_KEY процесса не годится: коды,
+# выданные разными процессами, могли бы совпасть
+SHORT_CODE_SALT = os.getenv(
+    'SHORT_CODE_SALT', os.getenv('SECRET_KEY', 'foodgram'))
+
 DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
 
 ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', 'localhost, 127.0.0.1').split(', ')
@@ -29,15 +38,29 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.ServerTimingMiddleware',
+    'api.middleware.QueryInspectorMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'api.middleware.PathScopedMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+# Middleware, которые PathScopedMiddleware выполняет для всех путей,
+# кроме api.constants.LEAN_MIDDLEWARE_PATHS (админка, redoc)
+PATH_SCOPED_MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Проверки админки ищут эти middleware только в MIDDLEWARE; их заменяют
+# api.E408-E410 (api/checks.py), учитывающие PATH_SCOPED_MIDDLEWARE
+SILENCED_SYSTEM_CHECKS = ['admin.E408', 'admin.E409', 'admin.E410']
+
 ROOT_URLCONF = 'foodgram_backend.urls'
 
 TEMPLATES = [
@@ -60,25 +83,102 @@ WSGI_APPLICATION = 'foodgram_backend.wsgi.application'
 
 PRODUCTION = os.getenv('PRODUCTION', 'False').lower() == 'true'
 
+# Время жизни соединения с базой в секундах; 0 - закрывать после запроса
+CONN_MAX_AGE = int(os.getenv('CONN_MAX_AGE', 60))
+
+# Проверять постоянное соединение при первом обращении к нему в запросе
+# (api/db_connections.py)
+CONN_HEALTH_CHECKS = os.getenv(
+    'CONN_HEALTH_CHECKS', 'False').lower() == 'true'
+
 if not PRODUCTION:
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.sqlite3',
+            'ENGINE': 'api.db_backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': CONN_MAX_AGE,
         }
     }
 else:
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.postgresql',
+            'ENGINE': 'api.db_backends.postgresql',
             'NAME': os.getenv('POSTGRES_DB', 'django'),
             'USER': os.getenv('POSTGRES_USER', 'django'),
             'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
             'HOST': os.getenv('DB_HOST', ''),
-            'PORT': os.getenv('DB_PORT', '5432')
+            'PORT': os.getenv('DB_PORT', '5432'),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
         }
     }
 
+# Реплики для чтения через запятую: файлы SQLite или host:port PostgreSQL
+DB_REPLICAS = [replica.strip() for replica in os.getenv(
+    'DB_REPLICAS', '').split(',') if replica.strip()]
+for number, replica in enumerate(DB_REPLICAS, 1):
+    if PRODUCTION:
+        host, _, port = replica.partition(':')
+        location = {
+            'HOST': host,
+            'PORT': port or DATABASES['default']['PORT'],
+            'OPTIONS': {'connect_timeout': 2},
+        }
+    else:
+        location = {'NAME': BASE_DIR / replica}
+    DATABASES[f'replica{number}'] = dict(
+        DATABASES['default'], **location, TEST={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['api.db_routing.ReplicaRouter']
+
+DB_REPLICA_STICKY_SECONDS = int(os.getenv('DB_REPLICA_STICKY_SECONDS', 5))
+DB_REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', 5))
+
+# Локальный уровень кэша процесса перед общим уровнем и хранилище версий
+# тегов кэша (api/cache.py)
+CACHES = {
+    'default': {
+        'BACKEND': 'api.cache.TwoTierCache',
+        'OPTIONS': {'LOCAL': 'local', 'SHARED': 'shared', 'TAGS': 'tags'},
+    },
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'foodgram',
+        'TIMEOUT': int(os.getenv('CACHE_LOCAL_TIMEOUT', 5)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_LOCAL_MAX_ENTRIES', 10000)),
+        },
+    },
+}
+
+# Общий уровень в production - memcached. Версии тегов хранит отдельный
+# memcached, запущенный с -M: заполнившись, он отвечает ошибкой, а не
+# вытесняет версии. При разработке оба - файлы во временном каталоге,
+# версии тегов не вытесняются
+if PRODUCTION:
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', 'memcached:11211'),
+    }
+    CACHES['tags'] = {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': os.getenv('CACHE_TAGS_LOCATION', 'memcached-tags:11211'),
+        'TIMEOUT': None,
+    }
+else:
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', os.path.join(
+            tempfile.gettempdir(), 'foodgram_cache')),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    }
+    CACHES['tags'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_TAGS_LOCATION', os.path.join(
+            tempfile.gettempdir(), 'foodgram_cache_tags')),
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': sys.maxsize},
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -123,6 +223,57 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.TokenAuthentication',
     ),
 
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+
+    'DEFAULT_PARSER_CLASSES': (
+        'api.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
+
+    # Количество прокси перед приложением (nginx) для определения IP-адреса
+    # клиента по X-Forwarded-For при ограничении частоты запросов
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 1)),
+}
+
+THROTTLING = os.getenv('THROTTLING', 'True').lower() == 'true'
+
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'False').lower() == 'true'
+SERVER_TIMING_SAMPLE_RATE = float(os.getenv('SERVER_TIMING_SAMPLE_RATE', 1))
+
+METRICS = os.getenv('METRICS', 'False').lower() == 'true'
+
+QUERY_INSPECTOR = os.getenv('QUERY_INSPECTOR', 'False').lower() == 'true'
+QUERY_INSPECTOR_RAISE = os.getenv(
+    'QUERY_INSPECTOR_RAISE', 'False').lower() == 'true'
+QUERY_INSPECTOR_REPEAT_THRESHOLD = int(
+    os.getenv('QUERY_INSPECTOR_REPEAT_THRESHOLD', 5))
+QUERY_INSPECTOR_SLOW_MS = float(os.getenv('QUERY_INSPECTOR_SLOW_MS', 100))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api.performance': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'api.queries': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
 }
@@ -6,6 +6,8 @@ from django.contrib import admin
 from django.urls import include, path
 from django.views.generic import TemplateView
 
+from api.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path(
@@ -16,6 +18,9 @@ urlpatterns = [
     path('api/', include('api.urls')),
 ]
 
+if settings.METRICS:
+    urlpatterns.append(path('metrics/', metrics_view, name='metrics'))
+
 if settings.DEBUG:
     urlpatterns += static(
         settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,105 @@
+"""
+Настройки gunicorn.
+
+Воркеры gthread: поток, ожидающий базу или клиента, не занимает
+процесс целиком. Количество процессов и потоков задается через
+GUNICORN_WORKERS и GUNICORN_THREADS, по умолчанию - по числу ядер.
+Каждый поток держит свое постоянное соединение с базой (CONN_MAX_AGE),
+так что соединений не больше workers * threads на каждую базу.
+
+С GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker приложение
+обслуживается через ASGI: тело запроса читается и ответ отдается в
+цикле событий, так что медленные клиенты не занимают потоки.
+Синхронные представления при этом выполняются по очереди в одном
+потоке воркера, поэтому воркеров нужно столько же, сколько для gthread.
+
+Поток событий /api/events/ (Server-Sent Events, api/events.py) работает
+только через ASGI: с gthread этот путь отвечает 501.
+"""
+
+import multiprocessing
+import os
+import shutil
+
+from prometheus_client import multiprocess
+from prometheus_client.mmap_dict import MmapedDict
+
+bind = '0.0.0.0:8000'
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv(
+    'GUNICORN_WORKERS', multiprocessing.cpu_count() + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+
+wsgi_app = ('foodgram_backend.asgi:application'
+            if worker_class.startswith('uvicorn')
+            else 'foodgram_backend.wsgi:application')
+
+# Приложение импортируется один раз в мастере, воркеры получают его
+# при fork: быстрее запуск и общая память под код
+preload_app = True
+
+# Перезапуск воркера после max_requests запросов ограничивает рост
+# памяти; разброс не дает всем воркерам перезапуститься одновременно
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# Типы метрик, значения которых складываются по воркерам, и имя, под
+# которым хранятся суммы значений остановленных воркеров
+MERGED_METRIC_TYPES = ('counter', 'histogram', 'summary')
+MERGED_METRICS_ID = 'merged'
+
+
+def on_starting(server):
+    """Очищает метрики, оставшиеся от предыдущего запуска."""
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+
+def post_fork(server, worker):
+    """Не дает воркерам унаследовать соединения мастера с базой."""
+    from django.db import connections
+    connections.close_all()
+
+
+def merge_dead_worker_metrics(directory, pid):
+    """
+    Переносит счетчики и гистограммы воркера pid в файлы сумм.
+
+    Воркеры перезапускаются каждые max_requests запросов, и без
+    переноса каталог метрик рос бы на файл каждого типа с каждым
+    перезапуском, а сбор метрик читал бы их все.
+    """
+    for metric_type in MERGED_METRIC_TYPES:
+        path = os.path.join(directory, f'{metric_type}_{pid}.db')
+        if not os.path.exists(path):
+            continue
+        source = MmapedDict(path, read_mode=True)
+        merged = MmapedDict(os.path.join(
+            directory, f'{metric_type}_{MERGED_METRICS_ID}.db'))
+        try:
+            for key, value, timestamp in source.read_all_values():
+                total, _ = merged.read_value(key)
+                merged.write_value(key, total + value, timestamp)
+        finally:
+            source.close()
+            merged.close()
+        os.remove(path)
+
+
+def child_exit(server, worker):
+    """Убирает из метрик файлы остановленного воркера."""
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        multiprocess.mark_process_dead(worker.pid)
+        # Память остановленного воркера (gauge в режиме all) не нужна
+        path = os.path.join(directory, f'gauge_all_{worker.pid}.db')
+        if os.path.exists(path):
+            os.remove(path)
+        merge_dead_worker_metrics(directory, worker.pid)
@@ -0,0 +1,84 @@
+"""
+Массовая вставка записей.
+
+Идентификаторы назначаются заранее, начиная с max(id) + 1: так связи
+можно строить до вставки, а bulk_create не нужно возвращать ключи
+(SQLite этого не умеет). После вставки последовательности PostgreSQL
+сдвигаются за новые идентификаторы. Так заполняется база, в которую
+никто больше не пишет.
+
+В базу, работающую под нагрузкой, записи вставляются через
+insert_with_ids(): идентификаторы выдает последовательность базы, и
+одновременные вставки приложения их не занимают.
+"""
+
+from contextlib import contextmanager
+from itertools import islice
+
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+from django.db.models import Max
+
+
+def next_id(model):
+    """Первый свободный идентификатор модели."""
+    return (model._base_manager.aggregate(Max('pk'))['pk__max'] or 0) + 1
+
+
+def bulk_insert(model, objects, batch_size, ignore_conflicts=False):
+    """
+    Вставляет объекты из итератора пачками по batch_size.
+
+    Одновременно в памяти находится только одна пачка. Возвращает
+    количество переданных объектов.
+    """
+    objects = iter(objects)
+    total = 0
+    while True:
+        batch = list(islice(objects, batch_size))
+        if not batch:
+            return total
+        with transaction.atomic():
+            model.objects.bulk_create(
+                batch, ignore_conflicts=ignore_conflicts)
+        total += len(batch)
+
+
+def insert_with_ids(model, objects, batch_size):
+    """
+    Вставляет объекты списка objects с идентификаторами, выданными базой.
+
+    PostgreSQL возвращает ключи из bulk_create, и они записываются в
+    объекты. SQLite ключи не возвращает; id назначаются от max(id) + 1,
+    а счетчик AUTOINCREMENT сдвигается за них самой базой.
+    """
+    if not connection.features.can_return_rows_from_bulk_insert:
+        first_id = next_id(model)
+        for number, instance in enumerate(objects):
+            instance.pk = first_id + number
+    bulk_insert(model, objects, batch_size)
+    return objects
+
+
+def reset_sequences(*models):
+    """Сдвигает последовательности идентификаторов за максимальный id."""
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+@contextmanager
+def explicit_dates(model):
+    """Позволяет задать значения полей с auto_now и auto_now_add."""
+    fields = [field for field in model._meta.concrete_fields
+              if isinstance(field, models.DateField)
+              and (field.auto_now or field.auto_now_add)]
+    flags = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, flags):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
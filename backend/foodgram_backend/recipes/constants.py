@@ -22,8 +22,89 @@ MAX_LENGTH_TAG_NAME = 32
 # Максимальная длина slug
 MAX_LENGTH_TAG_SLUG = 32
 
+# Максимальная длина имени модели в записи об удалении
+MAX_LENGTH_TOMBSTONE_MODEL = 16
+
+# Максимальная длина типа события пользователя
+MAX_LENGTH_EVENT_KIND = 16
+
 # Минимальное значение времени приготовления (мин.)
 MIN_COOKING_TIME = 1
 
 # Минимальное значение количества ингредиента
 MIN_INGREDIENT_AMOUNT = 1
+
+# Количество похожих рецептов, сохраняемых для каждого рецепта
+SIMILAR_RECIPES_LIMIT = 6
+
+# Вес тега относительно ингредиента при расчете сходства
+SIMILARITY_TAG_WEIGHT = 0.5
+
+# Максимальная доля рецептов с ингредиентом, при которой он учитывается
+SIMILARITY_MAX_INGREDIENT_SHARE = 0.2
+
+# Количество рецептов с ингредиентом, до которого он учитывается всегда:
+# в небольшом каталоге любой общий ингредиент превышает долю
+SIMILARITY_MIN_COMMON_INGREDIENT_RECIPES = 50
+
+# Количество рецептов, обрабатываемых за одно матричное умножение
+SIMILARITY_BATCH_SIZE = 512
+
+# Максимальное количество рецептов в ленте подписок пользователя.
+# Ленты обрезаются не при записи, а командой purge_deleted: между ее
+# запусками лента растет на число новых рецептов авторов из подписок,
+# поэтому purge_deleted нужно запускать по расписанию (cron) не реже
+# раза в сутки
+FEED_MAX_LENGTH = 1000
+
+# Количество подписчиков, начиная с которого рецепты автора не
+# раскладываются по лентам, а подмешиваются при чтении
+FEED_FANOUT_SUBSCRIBERS_LIMIT = 5000
+
+# Время хранения списка популярных авторов пользователя в кэше (сек.)
+FEED_POPULAR_AUTHORS_TIMEOUT = 300
+
+# Количество записей, удаляемых одним запросом при очистке
+PURGE_BATCH_SIZE = 1000
+
+# Срок хранения записей об удалении для синхронизации клиентов (дни)
+TOMBSTONE_RETENTION_DAYS = 90
+
+# Срок хранения событий потока изменений пользователей (дни)
+EVENT_RETENTION_DAYS = 1
+
+# Количество записей, вставляемых одним запросом генератором данных
+DATASET_BATCH_SIZE = 5000
+
+# Количество рецептов, генерируемых за один шаг
+DATASET_CHUNK_SIZE = 50000
+
+# Показатель степенного закона популярности авторов, рецептов и тегов
+DATASET_POWER_LAW_EXPONENT = 1.1
+
+# Общее изображение всех сгенерированных рецептов
+DATASET_PLACEHOLDER_IMAGE = 'generated/placeholder.png'
+
+# Количество рецептов, читаемых из базы за один шаг при выгрузке
+EXPORT_CHUNK_SIZE = 1000
+
+# Количество рецептов, вставляемых за одну транзакцию при загрузке
+IMPORT_BATCH_SIZE = 1000
+
+# Имя файла с рецептами в каталоге выгрузки
+EXPORT_RECIPES_FILE = 'recipes.jsonl'
+
+# Имя архива с изображениями рецептов в каталоге выгрузки
+EXPORT_MEDIA_FILE = 'media.tar'
+
+# Имя файла с позицией прерванной загрузки в каталоге выгрузки
+IMPORT_PROGRESS_FILE = 'import.progress'
+
+# Минимальная длина короткого кода рецепта
+MIN_LENGTH_SHORT_CODE = 5
+
+# Максимальная длина короткого кода рецепта
+MAX_LENGTH_SHORT_CODE = 16
+
+# Количество попыток назначить рецепту свободный короткий код
+SHORT_CODE_ATTEMPTS = 5
@@ -0,0 +1,157 @@
+"""Лента рецептов авторов, на которых подписан пользователь.
+
+Новые рецепты раскладываются по лентам подписчиков при публикации
+(fan-out on write). Рецепты авторов с очень большим числом подписчиков
+в ленты не пишутся, а подмешиваются при чтении (fan-out on read).
+Лента упорядочена по id рецепта: он растет вместе с датой публикации.
+Ленты обрезаются до FEED_MAX_LENGTH записей не при чтении, а командой
+purge_deleted (trim_feeds).
+"""
+
+from collections import defaultdict
+
+from django.db.models import Count, OuterRef, Subquery
+
+from recipes.bulk import bulk_insert
+from recipes.constants import FEED_FANOUT_SUBSCRIBERS_LIMIT, FEED_MAX_LENGTH
+from recipes.models import FeedEntry, Recipe, Subscription
+
+
+def _subscriber_ids(author):
+    """Подписчики автора или None, если автор слишком популярен."""
+    subscribers = list(Subscription.objects.filter(
+        subscriber=author).values_list(
+        'user_id', flat=True)[:FEED_FANOUT_SUBSCRIBERS_LIMIT + 1])
+    if len(subscribers) > FEED_FANOUT_SUBSCRIBERS_LIMIT:
+        return None
+    return subscribers
+
+
+def crossed_fanout_limit(author_id, added):
+    """
+    Перешло ли число подписчиков автора через
+    FEED_FANOUT_SUBSCRIBERS_LIMIT после подписки (added) или отписки.
+    """
+    count = Subscription.objects.filter(
+        subscriber_id=author_id)[:FEED_FANOUT_SUBSCRIBERS_LIMIT + 2].count()
+    return count == FEED_FANOUT_SUBSCRIBERS_LIMIT + added
+
+
+def fan_out_recipe(recipe):
+    """Добавляет новый рецепт в ленты подписчиков автора."""
+    subscribers = _subscriber_ids(recipe.author)
+    if not subscribers:
+        return
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, recipe=recipe)
+         for user_id in subscribers),
+        ignore_conflicts=True)
+
+
+def fan_out_recipes(recipes, batch_size):
+    """
+    Добавляет пачку новых рецептов в ленты подписчиков их авторов.
+
+    Для массовой загрузки: подписчики всех авторов читаются одним
+    запросом, авторы с fan-out on read пропускаются, как в
+    fan_out_recipe. Возвращает количество добавляемых записей.
+    """
+    recipe_ids = defaultdict(list)
+    for recipe in recipes:
+        recipe_ids[recipe.author_id].append(recipe.id)
+    popular = set(Subscription.objects.filter(
+        subscriber_id__in=recipe_ids).order_by().values(
+        'subscriber').annotate(
+        subscribers_count=Count('id')).filter(
+        subscribers_count__gt=FEED_FANOUT_SUBSCRIBERS_LIMIT).values_list(
+        'subscriber', flat=True))
+    subscriptions = Subscription.objects.filter(
+        subscriber_id__in=recipe_ids.keys() - popular).values_list(
+        'subscriber_id', 'user_id').iterator()
+    return bulk_insert(FeedEntry, (
+        FeedEntry(user_id=user_id, recipe_id=recipe_id)
+        for author_id, user_id in subscriptions
+        for recipe_id in recipe_ids[author_id]),
+        batch_size, ignore_conflicts=True)
+
+
+def backfill(user, author):
+    """Добавляет в ленту последние рецепты автора при подписке."""
+    if _subscriber_ids(author) is None:
+        return
+    recipe_ids = Recipe.objects.filter(author=author).order_by(
+        '-id').values_list('id', flat=True)[:FEED_MAX_LENGTH]
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user=user, recipe_id=recipe_id)
+         for recipe_id in recipe_ids),
+        ignore_conflicts=True)
+
+
+def drop_author(user, author):
+    """Удаляет из ленты рецепты автора при отписке."""
+    FeedEntry.objects.filter(user=user, recipe__author=author).delete()
+
+
+def trim_feeds(batch_size):
+    """
+    Удаляет из лент записи старше FEED_MAX_LENGTH последних.
+
+    Ленты обходятся пачками по batch_size пользователей, каждая пачка
+    обрезается одним запросом. Возвращает итератор количества удаленных
+    записей по пачкам.
+    """
+    cutoff = FeedEntry.objects.filter(
+        user_id=OuterRef('user_id')).order_by('-recipe_id').values(
+        'recipe_id')[FEED_MAX_LENGTH:FEED_MAX_LENGTH + 1]
+    last_user_id = 0
+    while True:
+        user_ids = list(FeedEntry.objects.filter(
+            user_id__gt=last_user_id).order_by('user_id').values_list(
+            'user_id', flat=True).distinct()[:batch_size])
+        if not user_ids:
+            return
+        deleted, _ = FeedEntry.objects.filter(
+            user_id__in=user_ids, recipe_id__lte=Subquery(cutoff)).delete()
+        yield deleted
+        last_user_id = user_ids[-1]
+
+
+def popular_authors(user):
+    """Авторы с fan-out on read среди подписок пользователя."""
+    # Без order_by() сортировка Subscription по умолчанию попадает в
+    # GROUP BY, и каждая группа - одна подписка
+    return list(Subscription.objects.filter(
+        subscriber__in=Subscription.objects.filter(
+            user=user).values('subscriber')
+    ).order_by().values('subscriber').annotate(
+        subscribers_count=Count('id')
+    ).filter(
+        subscribers_count__gt=FEED_FANOUT_SUBSCRIBERS_LIMIT
+    ).values_list('subscriber', flat=True))
+
+
+def get_feed_ids(user, before=None, limit=FEED_MAX_LENGTH, authors=None):
+    """
+    Возвращает до limit id опубликованных рецептов ленты до before.
+
+    authors - авторы с fan-out on read, если они уже известны
+    (например, из кэша); иначе они выбираются из базы.
+    """
+    # Записи удаленных рецептов остаются в ленте до очистки
+    entries = FeedEntry.objects.filter(
+        user=user, recipe__deleted_at__isnull=True)
+    if before is not None:
+        entries = entries.filter(recipe_id__lt=before)
+    recipe_ids = list(entries.order_by('-recipe_id').values_list(
+        'recipe_id', flat=True)[:limit])
+    if authors is None:
+        authors = popular_authors(user)
+    if authors:
+        recipes = Recipe.objects.filter(author__in=authors)
+        if before is not None:
+            recipes = recipes.filter(id__lt=before)
+        recipe_ids = sorted(
+            set(recipe_ids).union(recipes.order_by('-id').values_list(
+                'id', flat=True)[:limit]),
+            reverse=True)[:limit]
+    return recipe_ids
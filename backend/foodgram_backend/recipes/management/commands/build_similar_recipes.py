@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from recipes.constants import SIMILAR_RECIPES_LIMIT, SIMILARITY_BATCH_SIZE
+from recipes.similarity import (METRICS, build_similar_recipes,
+                                last_build_time)
+
+
+class Command(BaseCommand):
+    """Команда на расчет похожих рецептов."""
+
+    help = ('Пересчитывает похожие рецепты. По умолчанию обрабатываются '
+            'только рецепты, измененные после предыдущего запуска.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать похожие рецепты для всех рецептов.')
+        parser.add_argument(
+            '--metric', choices=METRICS, default=METRICS[0],
+            help='Мера сходства рецептов.')
+        parser.add_argument(
+            '--limit', type=int, default=SIMILAR_RECIPES_LIMIT,
+            help='Количество похожих рецептов для каждого рецепта.')
+        parser.add_argument(
+            '--batch-size', type=int, default=SIMILARITY_BATCH_SIZE,
+            help='Количество рецептов в одной пачке.')
+
+    def handle(self, *args, **options):
+        since = None if options['full'] else last_build_time()
+        if since is None:
+            self.stdout.write('Полный пересчет похожих рецептов.')
+        else:
+            self.stdout.write(f'Пересчет рецептов, измененных после {since}.')
+
+        def progress(done, total):
+            self.stdout.write(f'Обработано {done} из {total} рецептов.')
+
+        processed = build_similar_recipes(
+            metric=options['metric'], limit=options['limit'],
+            batch_size=options['batch_size'], since=since, progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Расчет завершен. Обработано {processed} рецептов.'))
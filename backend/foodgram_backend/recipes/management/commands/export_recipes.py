@@ -0,0 +1,129 @@
+import json
+import resource
+import tarfile
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.constants import (EXPORT_CHUNK_SIZE, EXPORT_MEDIA_FILE,
+                               EXPORT_RECIPES_FILE)
+from recipes.models import Recipe, RecipeIngredient
+
+
+class Command(BaseCommand):
+    """Команда на выгрузку рецептов с ингредиентами, тегами и изображениями."""
+
+    help = ('Выгружает опубликованные рецепты в каталог: recipes.jsonl - '
+            'по рецепту в строке с автором, тегами и ингредиентами, '
+            'media.tar - файлы изображений. Рецепты читаются из базы '
+            'пачками, поэтому память не зависит от их количества. '
+            'Выгрузка загружается командой import_recipes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Каталог выгрузки.')
+        parser.add_argument(
+            '--chunk-size', type=int, default=EXPORT_CHUNK_SIZE,
+            help='Количество рецептов, читаемых из базы за один шаг.')
+
+    def chunk_links(self, recipe_ids):
+        """Теги и ингредиенты рецептов пачки по id рецепта."""
+        tags = {pk: [] for pk in recipe_ids}
+        for recipe_id, name, slug in Recipe.tags.through.objects.filter(
+                recipe_id__in=recipe_ids).order_by('tag__slug').values_list(
+                'recipe_id', 'tag__name', 'tag__slug'):
+            tags[recipe_id].append({'name': name, 'slug': slug})
+        ingredients = {pk: [] for pk in recipe_ids}
+        for recipe_id, name, unit, amount in RecipeIngredient.objects.filter(
+                recipe_id__in=recipe_ids).order_by('id').values_list(
+                'recipe_id', 'ingredient__name',
+                'ingredient__measurement_unit', 'amount'):
+            ingredients[recipe_id].append(
+                {'name': name, 'measurement_unit': unit, 'amount': amount})
+        return tags, ingredients
+
+    def add_image(self, archive, name):
+        """Добавляет файл изображения в архив; False, если его нет."""
+        try:
+            file = default_storage.open(name)
+        except OSError:
+            return False
+        with file:
+            info = tarfile.TarInfo(name)
+            info.size = file.size
+            archive.addfile(info, file)
+        return True
+
+    def export_images(self, archive, chunk_size):
+        """
+        Добавляет в архив изображения опубликованных рецептов.
+
+        Имена читаются из базы без повторов в порядке сортировки, поэтому
+        общее изображение (например, у сгенерированных рецептов)
+        попадает в архив один раз, а память не зависит от количества
+        файлов. Возвращает количество добавленных файлов.
+        """
+        images = 0
+        for name in Recipe.objects.exclude(image='').order_by(
+                'image').values_list('image', flat=True).distinct().iterator(
+                chunk_size=chunk_size):
+            if self.add_image(archive, name):
+                images += 1
+            else:
+                self.stderr.write(f'Нет файла изображения {name}.')
+        return images
+
+    def handle(self, *args, **options):
+        directory = Path(options['directory'])
+        chunk_size = options['chunk_size']
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            output = open(directory / EXPORT_RECIPES_FILE, 'w',
+                          encoding='utf-8')
+            archive = tarfile.open(directory / EXPORT_MEDIA_FILE, 'w')
+        except OSError as error:
+            raise CommandError(f'Не удалось создать выгрузку: {error}')
+        started = time.monotonic()
+        exported = 0
+        recipes = Recipe.objects.select_related('author').order_by(
+            'id').iterator(chunk_size=chunk_size)
+        with output, archive:
+            images = self.export_images(archive, chunk_size)
+            memory = resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss // 1024
+            self.stdout.write(
+                f'  изображений {images}. Пиковая память {memory} МБ.')
+            while True:
+                chunk = list(islice(recipes, chunk_size))
+                if not chunk:
+                    break
+                tags, ingredients = self.chunk_links(
+                    [recipe.id for recipe in chunk])
+                for recipe in chunk:
+                    author = recipe.author
+                    output.write(json.dumps({
+                        'id': recipe.id,
+                        'name': recipe.name,
+                        'text': recipe.text,
+                        'cooking_time': recipe.cooking_time,
+                        'pub_date': recipe.pub_date.isoformat(),
+                        'image': recipe.image.name,
+                        'author': {
+                            'email': author.email,
+                            'username': author.username,
+                            'first_name': author.first_name,
+                            'last_name': author.last_name,
+                        },
+                        'tags': tags[recipe.id],
+                        'ingredients': ingredients[recipe.id],
+                    }, ensure_ascii=False) + '\n')
+                exported += len(chunk)
+                memory = resource.getrusage(
+                    resource.RUSAGE_SELF).ru_maxrss // 1024
+                self.stdout.write(
+                    f'  рецептов {exported}. Пиковая память {memory} МБ.')
+        self.stdout.write(self.style.SUCCESS(
+            f'Выгружено рецептов: {exported} за '
+            f'{time.monotonic() - started:.1f} с.'))
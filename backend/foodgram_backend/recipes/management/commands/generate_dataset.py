@@ -0,0 +1,300 @@
+import base64
+import csv
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from recipes.bulk import bulk_insert, explicit_dates, next_id, reset_sequences
+from recipes.constants import (DATASET_BATCH_SIZE, DATASET_CHUNK_SIZE,
+                               DATASET_PLACEHOLDER_IMAGE,
+                               DATASET_POWER_LAW_EXPONENT,
+                               FEED_FANOUT_SUBSCRIBERS_LIMIT, FEED_MAX_LENGTH)
+from recipes.models import (Favorite, FeedEntry, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, Subscription, Tag,
+                            User)
+from recipes.short_codes import encode
+
+INGREDIENTS_FILE = settings.BASE_DIR.parent.parent / 'data' / 'ingredients.csv'
+
+PLACEHOLDER_PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwAD'
+    'hgGAWjR9awAAAABJRU5ErkJggg==')
+
+FIRST_NAMES = ('Анна', 'Иван', 'Мария', 'Олег', 'Елена', 'Павел', 'Ольга')
+LAST_NAMES = ('Смирнов', 'Иванов', 'Кузнецов', 'Попов', 'Соколов')
+TAG_NAMES = ('Завтрак', 'Обед', 'Ужин', 'Десерт', 'Выпечка', 'Салат',
+             'Суп', 'Напиток', 'Закуска', 'Веганское')
+
+
+class Command(BaseCommand):
+    """Команда на генерацию большого набора данных для нагрузочных тестов."""
+
+    help = ('Генерирует пользователей, рецепты с ингредиентами и тегами, '
+            'избранное, списки покупок и подписки. Популярность авторов, '
+            'рецептов, ингредиентов и тегов подчиняется степенному закону. '
+            'Результат определяется параметром --seed. Похожие рецепты '
+            'после генерации строятся командой build_similar_recipes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=len(TAG_NAMES))
+        parser.add_argument('--favorites', type=int, default=20000)
+        parser.add_argument('--carts', type=int, default=5000)
+        parser.add_argument('--subscriptions', type=int, default=5000)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, nargs=2, default=(3, 10),
+            metavar=('MIN', 'MAX'),
+            help='Границы количества ингредиентов в рецепте.')
+        parser.add_argument(
+            '--feeds', action='store_true',
+            help='Заполнить ленты подписок сгенерированных пользователей.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--exponent', type=float, default=DATASET_POWER_LAW_EXPONENT,
+            help='Показатель степенного закона популярности.')
+        parser.add_argument(
+            '--batch-size', type=int, default=DATASET_BATCH_SIZE,
+            help='Количество записей, вставляемых одним запросом.')
+        parser.add_argument(
+            '--ingredients-file', default=INGREDIENTS_FILE,
+            help='CSV с ингредиентами для пустой таблицы ингредиентов.')
+
+    def stage(self, name, count):
+        now = time.monotonic()
+        elapsed = now - self.stage_started
+        self.stage_started = now
+        self.stdout.write(
+            f'{name}: {count} за {elapsed:.1f} с '
+            f'({count / max(elapsed, 1e-3):.0f} в секунду).')
+
+    def popular(self, pool):
+        """Перемешанные значения и веса их популярности по убыванию."""
+        ranks = np.arange(1, len(pool) + 1, dtype=float)
+        weights = ranks ** -self.exponent
+        return self.rng.permutation(pool), weights / weights.sum()
+
+    def draw(self, popular, size):
+        pool, weights = popular
+        return pool[self.rng.choice(len(pool), size, p=weights)]
+
+    def pairs(self, count, left, right, distinct=False):
+        """Уникальные пары значений, выбранных по популярности."""
+        pairs = np.unique(np.column_stack(
+            (self.draw(left, count), self.draw(right, count))), axis=0)
+        if distinct:
+            pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+        return pairs
+
+    def with_ids(self, model, rows):
+        """Объекты модели с заранее назначенными идентификаторами."""
+        first_id = next_id(model)
+        return (model(id=first_id + number, **fields)
+                for number, fields in enumerate(rows))
+
+    def load_ingredients(self, path):
+        if not Ingredient.objects.exists():
+            try:
+                with open(path, encoding='utf-8') as file:
+                    rows = [row for row in csv.reader(file) if len(row) == 2]
+            except OSError as error:
+                raise CommandError(
+                    f'Не удалось прочитать ингредиенты: {error}')
+            bulk_insert(Ingredient, self.with_ids(Ingredient, (
+                {'name': name, 'measurement_unit': unit}
+                for name, unit in rows)), self.batch_size,
+                ignore_conflicts=True)
+            reset_sequences(Ingredient)
+        return dict(Ingredient.objects.values_list('id', 'name'))
+
+    def create_tags(self, count):
+        existing = Tag.objects.count()
+        bulk_insert(Tag, self.with_ids(Tag, (
+            {'name': (TAG_NAMES[number] if number < len(TAG_NAMES)
+                      else f'Тег {number}'),
+             'slug': f'tag-{number}'}
+            for number in range(existing, count))), self.batch_size,
+            ignore_conflicts=True)
+        return np.array(Tag.objects.values_list('id', flat=True))
+
+    def create_users(self, count):
+        first_id = next_id(User)
+        password = make_password(None)
+        names = self.rng.integers(
+            0, len(FIRST_NAMES) * len(LAST_NAMES), count).tolist()
+        bulk_insert(User, (
+            User(id=first_id + number,
+                 username=f'generated{first_id + number}',
+                 email=f'generated{first_id + number}@example.com',
+                 first_name=FIRST_NAMES[name % len(FIRST_NAMES)],
+                 last_name=LAST_NAMES[name // len(FIRST_NAMES)],
+                 password=password)
+            for number, name in enumerate(names)), self.batch_size)
+        return np.arange(first_id, first_id + count)
+
+    def ingredient_matrix(self, size, ingredients, low, high):
+        """Различные ингредиенты рецептов, -1 на месте пропусков."""
+        draws = self.draw(ingredients, (size, high))
+        counts = self.rng.integers(low, high + 1, size)
+        draws[np.arange(high) >= counts[:, None]] = -1
+        draws.sort(axis=1)
+        draws[:, 1:][draws[:, 1:] == draws[:, :-1]] = -1
+        return draws
+
+    def create_recipes(self, count, authors, ingredients, names, tags, low,
+                       high):
+        """Создает рецепты со связями и возвращает их id и авторов."""
+        first_id = next_id(Recipe)
+        recipe_ids = np.arange(first_id, first_id + count)
+        recipe_authors = self.draw(authors, count)
+        started = timezone.now() - timedelta(minutes=count)
+        created = ingredients_count = tags_count = 0
+        for start in range(0, count, DATASET_CHUNK_SIZE):
+            chunk = slice(start, start + DATASET_CHUNK_SIZE)
+            ids = recipe_ids[chunk]
+            size = len(ids)
+            matrix = self.ingredient_matrix(size, ingredients, low, high)
+            cooking_times = self.rng.integers(5, 180, size).tolist()
+            recipes = []
+            for recipe_id, author_id, row, cooking_time in zip(
+                    ids.tolist(), recipe_authors[chunk].tolist(),
+                    matrix.tolist(), cooking_times):
+                date = started + timedelta(minutes=recipe_id - first_id)
+                main = names[max(row)]
+                recipes.append(Recipe(
+                    id=recipe_id, author_id=author_id,
+                    name=f'{main.capitalize()} №{recipe_id}',
+                    image=DATASET_PLACEHOLDER_IMAGE,
+                    text=f'Рецепт с ингредиентом «{main}».',
+                    cooking_time=cooking_time, pub_date=date,
+                    updated_at=date, short_code=encode(recipe_id)))
+            with explicit_dates(Recipe):
+                bulk_insert(Recipe, recipes, self.batch_size)
+
+            rows, columns = np.nonzero(matrix >= 0)
+            amounts = self.rng.integers(1, 500, len(rows)).tolist()
+            link_id = next_id(RecipeIngredient)
+            ingredients_count += bulk_insert(RecipeIngredient, (
+                RecipeIngredient(
+                    id=link_id + number, recipe_id=recipe_id,
+                    ingredient_id=ingredient_id, amount=amount)
+                for number, (recipe_id, ingredient_id, amount) in enumerate(
+                    zip(ids[rows].tolist(),
+                        matrix[rows, columns].tolist(), amounts))),
+                self.batch_size)
+
+            recipe_tags = np.unique(np.column_stack((
+                np.repeat(ids, 2), self.draw(tags, size * 2))), axis=0)
+            tag_model = Recipe.tags.through
+            link_id = next_id(tag_model)
+            tags_count += bulk_insert(tag_model, (
+                tag_model(id=link_id + number, recipe_id=recipe_id,
+                          tag_id=tag_id)
+                for number, (recipe_id, tag_id) in enumerate(
+                    recipe_tags.tolist())), self.batch_size)
+            created += size
+            self.stdout.write(f'  рецептов {created} из {count}')
+        self.stage(f'Рецепты (ингредиентов {ingredients_count}, тегов '
+                   f'{tags_count})', count)
+        return recipe_ids, recipe_authors
+
+    def create_pairs(self, model, target, pairs):
+        first_id = next_id(model)
+        return bulk_insert(model, (
+            model(**{'id': first_id + number, 'user_id': user_id,
+                     f'{target}_id': target_id})
+            for number, (user_id, target_id) in enumerate(pairs.tolist())),
+            self.batch_size, ignore_conflicts=True)
+
+    def create_feeds(self, subscriptions, recipe_ids, recipe_authors):
+        """Раскладывает рецепты авторов по лентам подписчиков."""
+        authors, subscribers = np.unique(
+            subscriptions[:, 1], return_counts=True)
+        popular = authors[subscribers > FEED_FANOUT_SUBSCRIBERS_LIMIT]
+        subscriptions = subscriptions[
+            ~np.isin(subscriptions[:, 1], popular)]
+        order = np.lexsort((-recipe_ids, recipe_authors))
+        sorted_ids = recipe_ids[order]
+        sorted_authors = recipe_authors[order]
+        starts = np.searchsorted(sorted_authors, subscriptions[:, 1])
+        ends = np.searchsorted(
+            sorted_authors, subscriptions[:, 1], side='right')
+        lengths = np.minimum(ends - starts, FEED_MAX_LENGTH)
+        first_id = next_id(FeedEntry)
+
+        def entries():
+            number = 0
+            for start in range(0, len(subscriptions), DATASET_CHUNK_SIZE):
+                chunk = slice(start, start + DATASET_CHUNK_SIZE)
+                chunk_lengths = lengths[chunk]
+                offsets = np.arange(chunk_lengths.sum()) - np.repeat(
+                    np.cumsum(chunk_lengths) - chunk_lengths, chunk_lengths)
+                users = np.repeat(subscriptions[chunk, 0], chunk_lengths)
+                recipes = sorted_ids[
+                    np.repeat(starts[chunk], chunk_lengths) + offsets]
+                for user_id, recipe_id in zip(
+                        users.tolist(), recipes.tolist()):
+                    yield FeedEntry(
+                        id=first_id + number, user_id=user_id,
+                        recipe_id=recipe_id)
+                    number += 1
+
+        return bulk_insert(
+            FeedEntry, entries(), self.batch_size, ignore_conflicts=True)
+
+    def handle(self, *args, **options):
+        low, high = options['ingredients_per_recipe']
+        if not 1 <= low <= high:
+            raise CommandError('Неверные границы количества ингредиентов.')
+        if options['users'] < 2:
+            raise CommandError('Нужно хотя бы два пользователя.')
+        self.rng = np.random.default_rng(options['seed'])
+        self.exponent = options['exponent']
+        self.batch_size = options['batch_size']
+        started = self.stage_started = time.monotonic()
+
+        names = self.load_ingredients(options['ingredients_file'])
+        ingredients = self.popular(np.array(sorted(names)))
+        tags = self.popular(self.create_tags(options['tags']))
+        self.stage('Ингредиенты и теги', len(names))
+        users = self.create_users(options['users'])
+        self.stage('Пользователи', options['users'])
+        if not default_storage.exists(DATASET_PLACEHOLDER_IMAGE):
+            default_storage.save(
+                DATASET_PLACEHOLDER_IMAGE, ContentFile(PLACEHOLDER_PNG))
+        recipe_ids, recipe_authors = self.create_recipes(
+            options['recipes'], self.popular(users), ingredients, names,
+            tags, low, high)
+
+        active_users = self.popular(users)
+        recipes = self.popular(recipe_ids)
+        self.stage('Избранное', self.create_pairs(
+            Favorite, 'recipe',
+            self.pairs(options['favorites'], active_users, recipes)))
+        self.stage('Списки покупок', self.create_pairs(
+            ShoppingCart, 'recipe',
+            self.pairs(options['carts'], active_users, recipes)))
+        subscriptions = self.pairs(
+            options['subscriptions'], active_users, self.popular(users),
+            distinct=True)
+        self.stage('Подписки', self.create_pairs(
+            Subscription, 'subscriber', subscriptions))
+        if options['feeds']:
+            self.stage('Ленты подписок', self.create_feeds(
+                subscriptions, recipe_ids, recipe_authors))
+
+        reset_sequences(
+            Tag, User, Recipe, RecipeIngredient, Recipe.tags.through,
+            Favorite, ShoppingCart, Subscription, FeedEntry)
+        # Массовая вставка не отправляет сигналы, сбрасывающие кэш
+        cache.clear()
+        self.stdout.write(self.style.SUCCESS(
+            f'Генерация завершена за {time.monotonic() - started:.1f} с.'))
@@ -0,0 +1,261 @@
+import json
+import resource
+import tarfile
+import time
+from pathlib import Path, PurePosixPath
+from uuid import uuid4
+
+from django.contrib.auth.hashers import make_password
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from recipes.bulk import bulk_insert, explicit_dates, insert_with_ids
+from recipes.constants import (EXPORT_MEDIA_FILE, EXPORT_RECIPES_FILE,
+                               IMPORT_BATCH_SIZE, IMPORT_PROGRESS_FILE)
+from recipes.feed import fan_out_recipes
+from recipes.models import (Ingredient, Recipe, RecipeIngredient, Tag, User,
+                            recipes_changed)
+from recipes.short_codes import encode
+
+
+class Command(BaseCommand):
+    """Команда на загрузку рецептов, выгруженных командой export_recipes."""
+
+    help = ('Загружает рецепты из каталога выгрузки export_recipes. '
+            'Рецепты получают новые id, авторы сопоставляются по email, '
+            'теги - по slug, ингредиенты - по названию; недостающие '
+            'создаются. Рецепты вставляются пачками, каждая в своей '
+            'транзакции, а позиция в файле сохраняется в import.progress: '
+            'прерванная загрузка при повторном запуске продолжается с '
+            'места остановки. Рецепт, уже существующий у автора с тем же '
+            'названием и описанием, пропускается. Новые рецепты '
+            'добавляются в ленты подписчиков авторов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Каталог выгрузки.')
+        parser.add_argument(
+            '--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+            help='Количество рецептов, вставляемых за одну транзакцию.')
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать загрузку заново, не учитывая import.progress.')
+
+    def report(self, message):
+        memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+        self.stdout.write(f'  {message}. Пиковая память {memory} МБ.')
+
+    def load_progress(self):
+        if self.restart or not self.progress_path.exists():
+            return {'media': False, 'offset': 0}
+        try:
+            return json.loads(self.progress_path.read_text())
+        except (OSError, ValueError) as error:
+            raise CommandError(
+                f'Не удалось прочитать {self.progress_path}: {error}')
+
+    def save_progress(self, progress):
+        self.progress_path.write_text(json.dumps(progress))
+
+    def extract_media(self, path):
+        """Сохраняет файлы архива, которых еще нет в хранилище."""
+        saved = 0
+        with tarfile.open(path, 'r|') as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                name = PurePosixPath(member.name)
+                if name.is_absolute() or '..' in name.parts:
+                    self.stderr.write(f'Пропущен файл {member.name}.')
+                    continue
+                if default_storage.exists(member.name):
+                    continue
+                file = File(archive.extractfile(member))
+                file.size = member.size
+                default_storage.save(member.name, file)
+                saved += 1
+        return saved
+
+    def read_batches(self, file):
+        """Пачки рецептов из файла и позиция после каждой пачки."""
+        while True:
+            records = []
+            while len(records) < self.batch_size:
+                line = file.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError as error:
+                    raise CommandError(
+                        f'Неверная строка в {EXPORT_RECIPES_FILE} перед '
+                        f'позицией {file.tell()}: {error}')
+            if not records:
+                return
+            yield records, file.tell()
+
+    def author_ids(self, records):
+        """id авторов по email; недостающие пользователи создаются."""
+        authors = {record['author']['email']: record['author']
+                   for record in records}
+        ids = dict(User.objects.filter(email__in=authors).values_list(
+            'email', 'id'))
+        missing = [author for email, author in authors.items()
+                   if email not in ids]
+        if missing:
+            taken = set(User.objects.filter(username__in=[
+                author['username'] for author in missing]).values_list(
+                'username', flat=True))
+            password = make_password(None)
+            users = [
+                User(email=author['email'], username=author['username'],
+                     first_name=author['first_name'],
+                     last_name=author['last_name'], password=password)
+                for author in missing]
+            # Занятое имя дополняется id пользователя, известным только
+            # после вставки; до нее имя временно заменяется уникальным
+            renamed = []
+            for user in users:
+                if user.username in taken:
+                    renamed.append((user, user.username))
+                    user.username = uuid4().hex
+                taken.add(user.username)
+            insert_with_ids(User, users, self.batch_size)
+            for user, username in renamed:
+                user.username = f'{username}-{user.id}'
+            User.objects.bulk_update(
+                [user for user, _ in renamed], ['username'])
+            ids.update((user.email, user.id) for user in users)
+            self.created['пользователей'] += len(users)
+        return ids
+
+    def tag_ids(self, records):
+        """id тегов по slug; недостающие теги создаются."""
+        tags = {tag['slug']: tag for record in records
+                for tag in record['tags']}
+        ids = dict(Tag.objects.filter(slug__in=tags).values_list(
+            'slug', 'id'))
+        missing = insert_with_ids(Tag, [
+            Tag(name=tag['name'], slug=slug)
+            for slug, tag in tags.items() if slug not in ids],
+            self.batch_size)
+        ids.update((tag.slug, tag.id) for tag in missing)
+        self.created['тегов'] += len(missing)
+        return ids
+
+    def ingredient_ids(self, records):
+        """id ингредиентов по названию; недостающие создаются."""
+        ingredients = {item['name']: item['measurement_unit']
+                       for record in records
+                       for item in record['ingredients']}
+        ids = dict(Ingredient.objects.filter(
+            name__in=ingredients).values_list('name', 'id'))
+        missing = insert_with_ids(Ingredient, [
+            Ingredient(name=name, measurement_unit=unit)
+            for name, unit in ingredients.items() if name not in ids],
+            self.batch_size)
+        ids.update((ingredient.name, ingredient.id)
+                   for ingredient in missing)
+        self.created['ингредиентов'] += len(missing)
+        return ids
+
+    def import_batch(self, records):
+        """Вставляет рецепты пачки; возвращает новые рецепты."""
+        authors = self.author_ids(records)
+        tags = self.tag_ids(records)
+        ingredients = self.ingredient_ids(records)
+        # Рецепты, уже загруженные прерванным запуском или существующие,
+        # определяются по уникальному сочетанию автора, названия и описания
+        keys = set(Recipe.all_objects.filter(
+            author_id__in=authors.values(),
+            name__in={record['name'] for record in records}).values_list(
+            'author_id', 'name', 'text'))
+        now = timezone.now()
+        recipes = []
+        new_records = []
+        for record in records:
+            key = (authors[record['author']['email']], record['name'],
+                   record['text'])
+            if key in keys:
+                continue
+            keys.add(key)
+            recipes.append(Recipe(
+                author_id=key[0], name=record['name'], text=record['text'],
+                cooking_time=record['cooking_time'], image=record['image'],
+                pub_date=parse_datetime(record['pub_date']),
+                updated_at=now))
+            new_records.append(record)
+        with explicit_dates(Recipe):
+            insert_with_ids(Recipe, recipes, self.batch_size)
+        for recipe in recipes:
+            recipe.short_code = encode(recipe.id)
+        Recipe.all_objects.bulk_update(
+            recipes, ['short_code'], self.batch_size)
+        bulk_insert(RecipeIngredient, (
+            RecipeIngredient(
+                recipe_id=recipe.id,
+                ingredient_id=ingredients[item['name']],
+                amount=item['amount'])
+            for recipe, record in zip(recipes, new_records)
+            for item in record['ingredients']), self.batch_size)
+        tag_model = Recipe.tags.through
+        bulk_insert(tag_model, (
+            tag_model(recipe_id=recipe.id, tag_id=tags[tag['slug']])
+            for recipe, record in zip(recipes, new_records)
+            for tag in record['tags']), self.batch_size)
+        fan_out_recipes(recipes, self.batch_size)
+        return recipes
+
+    def handle(self, *args, **options):
+        directory = Path(options['directory'])
+        self.batch_size = options['batch_size']
+        self.restart = options['restart']
+        self.progress_path = directory / IMPORT_PROGRESS_FILE
+        progress = self.load_progress()
+        started = time.monotonic()
+        self.created = dict.fromkeys(
+            ('пользователей', 'тегов', 'ингредиентов'), 0)
+
+        try:
+            if not progress['media']:
+                saved = self.extract_media(directory / EXPORT_MEDIA_FILE)
+                self.report(f'Сохранено изображений: {saved}')
+                progress['media'] = True
+                self.save_progress(progress)
+            file = open(directory / EXPORT_RECIPES_FILE, 'rb')
+        except (OSError, tarfile.TarError) as error:
+            raise CommandError(f'Не удалось прочитать выгрузку: {error}')
+
+        imported = skipped = 0
+        with file:
+            file.seek(progress['offset'])
+            for records, offset in self.read_batches(file):
+                try:
+                    with transaction.atomic():
+                        recipes = self.import_batch(records)
+                except (KeyError, TypeError) as error:
+                    raise CommandError(
+                        f'Неполная запись рецепта перед позицией {offset} '
+                        f'в {EXPORT_RECIPES_FILE}: нет поля {error}.')
+                # Массовая вставка не отправляет сигналы, сбрасывающие кэш
+                # списков рецептов, авторов и коротких ссылок
+                recipes_changed.send(sender=Recipe, recipes=recipes)
+                imported += len(recipes)
+                skipped += len(records) - len(recipes)
+                progress['offset'] = offset
+                self.save_progress(progress)
+                self.report(
+                    f'рецептов загружено {imported}, пропущено {skipped}')
+
+        self.progress_path.unlink()
+        created = ', '.join(
+            f'{name} {count}' for name, count in self.created.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено рецептов: {imported}, пропущено существующих: '
+            f'{skipped}. Создано {created}. Загрузка заняла '
+            f'{time.monotonic() - started:.1f} с.'))
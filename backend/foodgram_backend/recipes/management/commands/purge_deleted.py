@@ -0,0 +1,68 @@
+import resource
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from recipes.constants import (EVENT_RETENTION_DAYS, PURGE_BATCH_SIZE,
+                               TOMBSTONE_RETENTION_DAYS)
+from recipes.feed import trim_feeds
+from recipes.models import Recipe, Tombstone, User, UserEvent
+from recipes.purge import PurgeError, Purger
+
+
+class Command(BaseCommand):
+    """Команда на удаление пользователей и рецептов, помеченных удаленными."""
+
+    help = ('Удаляет помеченных удаленными пользователей и рецепты вместе '
+            'с зависимыми записями пачками, а также записи об удалении '
+            'и события пользователей старше срока хранения, и обрезает '
+            'ленты подписок до последних FEED_MAX_LENGTH записей. '
+            'Прерванный запуск можно повторить: удаление продолжится с '
+            'того же места.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=PURGE_BATCH_SIZE,
+            help='Количество записей, удаляемых одним запросом.')
+        parser.add_argument(
+            '--pause', type=float, default=0,
+            help='Пауза между пачками в секундах.')
+
+    def report(self, model, deleted):
+        memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+        self.stdout.write(
+            f'{model._meta.label}: удалено {deleted}, '
+            f'всего {self.purger.deleted[model._meta.label]}. '
+            f'Пиковая память {memory} МБ.')
+        if self.pause:
+            time.sleep(self.pause)
+
+    def handle(self, *args, **options):
+        self.pause = options['pause']
+        self.purger = Purger(options['batch_size'], progress=self.report)
+        started = time.monotonic()
+        try:
+            self.purger.purge(User.objects.filter(deleted_at__isnull=False))
+            self.purger.purge(
+                Recipe.all_objects.filter(deleted_at__isnull=False))
+            self.purger.purge(Tombstone.objects.filter(
+                deleted_at__lt=timezone.now() - timedelta(
+                    days=TOMBSTONE_RETENTION_DAYS)))
+            self.purger.purge(UserEvent.objects.filter(
+                created_at__lt=timezone.now() - timedelta(
+                    days=EVENT_RETENTION_DAYS)))
+        except PurgeError as error:
+            raise CommandError(error)
+        trimmed = 0
+        for deleted in trim_feeds(options['batch_size']):
+            trimmed += deleted
+            self.stdout.write(
+                f'Ленты подписок: удалено {deleted}, всего {trimmed}.')
+            if self.pause:
+                time.sleep(self.pause)
+        self.stdout.write(self.style.SUCCESS(
+            f'Очистка завершена за {time.monotonic() - started:.1f} с. '
+            f'Удалено записей: '
+            f'{sum(self.purger.deleted.values()) + trimmed}.'))
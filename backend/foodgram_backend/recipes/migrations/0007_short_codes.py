@@ -0,0 +1,39 @@
+# Generated by Django 3.2 on 2026-10-19 11:15
+
+from django.conf import settings
+from django.db import migrations, models
+from hashids import Hashids
+
+MIN_LENGTH_SHORT_CODE = 5
+BATCH_SIZE = 1000
+
+
+def fill_codes(apps, schema_editor):
+    """Назначает коды рецептам, созданным до появления поля."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    hashids = Hashids(
+        min_length=MIN_LENGTH_SHORT_CODE, salt=settings.SHORT_CODE_SALT)
+    while True:
+        batch = list(Recipe.objects.filter(
+            short_code__isnull=True).only('id')[:BATCH_SIZE])
+        if not batch:
+            return
+        for recipe in batch:
+            recipe.short_code = hashids.encode(recipe.id)
+        Recipe.objects.bulk_update(batch, ['short_code'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='short_code',
+            field=models.CharField(blank=True, editable=False, max_length=16, null=True, unique=True, verbose_name='Короткий код'),
+        ),
+        migrations.RunPython(fill_codes, migrations.RunPython.noop),
+    ]
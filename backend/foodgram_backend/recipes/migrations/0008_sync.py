@@ -0,0 +1,53 @@
+# Generated by Django 3.2 on 2026-10-19 18:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def record_soft_deleted(apps, schema_editor):
+    """Записи об удалении для рецептов, помеченных удаленными раньше."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Tombstone = apps.get_model('recipes', 'Tombstone')
+    Tombstone.objects.bulk_create(
+        (Tombstone(model='recipe', object_id=recipe_id,
+                   deleted_at=deleted_at)
+         for recipe_id, deleted_at in Recipe.objects.filter(
+             deleted_at__isnull=False).values_list('id', 'deleted_at')),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_short_codes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now, verbose_name='Дата изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now, verbose_name='Дата изменения'),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('recipe', 'Рецепт'), ('ingredient', 'Ингредиент'), ('tag', 'Тег')], max_length=16, verbose_name='Модель')),
+                ('object_id', models.BigIntegerField(verbose_name='id объекта')),
+                ('deleted_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Дата удаления')),
+            ],
+            options={
+                'verbose_name': 'Удаленный объект',
+                'verbose_name_plural': 'Удаленные объекты',
+                'ordering': ['deleted_at', 'id'],
+            },
+        ),
+        migrations.RunPython(record_soft_deleted, migrations.RunPython.noop),
+    ]
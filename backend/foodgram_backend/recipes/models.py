@@ -4,14 +4,26 @@ from django.contrib.auth.models import AbstractUser
 from django.conf import settings
 from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.db.models import UniqueConstraint
+from django.db import IntegrityError, models
+from django.db.models import Exists, UniqueConstraint
+from django.dispatch import Signal
+from django.utils import timezone
 
 from recipes.constants import (FORBIDDEN_USERNAME, MIN_COOKING_TIME,
-                               MAX_LENGTH_EMAIL, MAX_LENGTH_INGREDIENT_NAME,
+                               MAX_LENGTH_EMAIL, MAX_LENGTH_EVENT_KIND,
+                               MAX_LENGTH_INGREDIENT_NAME,
                                MAX_LENGTH_MEASUREMENT_UNIT,
-                               MAX_LENGTH_RECIPE_NAME, MAX_LENGTH_TAG_NAME,
-                               MAX_LENGTH_TAG_SLUG, MIN_INGREDIENT_AMOUNT)
+                               MAX_LENGTH_RECIPE_NAME,
+                               MAX_LENGTH_SHORT_CODE, MAX_LENGTH_TAG_NAME,
+                               MAX_LENGTH_TAG_SLUG,
+                               MAX_LENGTH_TOMBSTONE_MODEL,
+                               MIN_INGREDIENT_AMOUNT, SHORT_CODE_ATTEMPTS)
+from recipes.short_codes import encode
+
+# Рецепты изменены массовой операцией (update у QuerySet, bulk_create),
+# которая не отправляет post_save; recipes - список измененных рецептов
+# с заполненными id, author_id и short_code
+recipes_changed = Signal()
 
 
 class User(AbstractUser):
@@ -23,6 +35,8 @@ class User(AbstractUser):
     email = models.EmailField(
         ('email address'), unique=True, max_length=MAX_LENGTH_EMAIL)
     avatar = models.ImageField('Аватар', blank=True, null=True)
+    deleted_at = models.DateTimeField(
+        'Дата удаления', blank=True, null=True, db_index=True)
 
     class Meta:
         """Meta."""
@@ -40,6 +54,25 @@ class User(AbstractUser):
             raise ValidationError(
                 {'username': ['Установите другое имя пользователя.']})
 
+    def soft_delete(self):
+        """
+        Помечает пользователя и его рецепты удаленными.
+
+        Сами записи удаляются пачками командой purge_deleted.
+        """
+        self.deleted_at = timezone.now()
+        self.is_active = False
+        self.save(update_fields=['deleted_at', 'is_active'])
+        recipes = Recipe.all_objects.filter(
+            author=self, deleted_at__isnull=True)
+        deleted = list(recipes.only('id', 'author_id', 'short_code'))
+        recipes.update(deleted_at=self.deleted_at)
+        Tombstone.objects.bulk_create(
+            Tombstone(model='recipe', object_id=recipe.id,
+                      deleted_at=self.deleted_at)
+            for recipe in deleted)
+        recipes_changed.send(sender=Recipe, recipes=deleted)
+
 
 class Ingredient(models.Model):
     """Класс ингредиентов."""
@@ -51,6 +84,8 @@ class Ingredient(models.Model):
     measurement_unit = models.CharField(
         'Единица измерения',
         max_length=MAX_LENGTH_MEASUREMENT_UNIT)
+    updated_at = models.DateTimeField(
+        'Дата изменения', auto_now=True, db_index=True)
 
     class Meta:
         """Meta."""
@@ -74,6 +109,8 @@ class Tag(models.Model):
     name = models.CharField('Наименование', max_length=MAX_LENGTH_TAG_NAME)
     slug = models.SlugField(
         'Слаг', unique=True, max_length=MAX_LENGTH_TAG_SLUG)
+    updated_at = models.DateTimeField(
+        'Дата изменения', auto_now=True, db_index=True)
 
     class Meta:
         """Meta."""
@@ -87,6 +124,13 @@ class Tag(models.Model):
         return self.name
 
 
+class PublishedRecipeManager(models.Manager):
+    """Менеджер, скрывающий рецепты, ожидающие удаления."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Recipe(models.Model):
     """Класс рецептов."""
 
@@ -110,6 +154,16 @@ class Recipe(models.Model):
         verbose_name='Автор'
     )
     pub_date = models.DateTimeField('Дата добавления', auto_now_add=True)
+    updated_at = models.DateTimeField(
+        'Дата изменения', auto_now=True, db_index=True)
+    deleted_at = models.DateTimeField(
+        'Дата удаления', blank=True, null=True, db_index=True)
+    short_code = models.CharField(
+        'Короткий код', max_length=MAX_LENGTH_SHORT_CODE, unique=True,
+        null=True, blank=True, editable=False)
+
+    objects = PublishedRecipeManager()
+    all_objects = models.Manager()
 
     class Meta:
         """Meta."""
@@ -127,6 +181,33 @@ class Recipe(models.Model):
         """Вывод названия при обращении."""
         return self.name
 
+    def save(self, *args, **kwargs):
+        """Сохраняет рецепт и при создании назначает ему короткий код."""
+        super().save(*args, **kwargs)
+        if self.short_code is not None:
+            return
+        # id известен только после вставки: код записывается одним
+        # UPDATE без повторного save() и его сигналов. Код, занятый
+        # рецептом, получившим его с прежней солью, пропускается
+        for attempt in range(SHORT_CODE_ATTEMPTS):
+            code = encode(self.pk, attempt)
+            if Recipe.all_objects.filter(
+                ~Exists(Recipe.all_objects.filter(short_code=code)),
+                pk=self.pk,
+            ).update(short_code=code):
+                self.short_code = code
+                recipes_changed.send(sender=Recipe, recipes=[self])
+                return
+        raise IntegrityError(
+            f'Не удалось назначить короткий код рецепту {self.pk}')
+
+    def soft_delete(self):
+        """Помечает рецепт удаленным до очистки командой purge_deleted."""
+        self.deleted_at = timezone.now()
+        self.save(update_fields=['deleted_at'])
+        Tombstone.objects.create(
+            model='recipe', object_id=self.pk, deleted_at=self.deleted_at)
+
 
 class Subscription(models.Model):
     """Модель подписок."""
@@ -255,3 +336,154 @@ class RecipeIngredient(models.Model):
 
     def __str__(self):
         return f'{self.ingredient.name} в {self.recipe.name}'
+
+
+class SimilarRecipe(models.Model):
+    """Похожие рецепты, рассчитанные по ингредиентам и тегам."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_links',
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField('Степень сходства')
+    computed_at = models.DateTimeField('Дата расчета', auto_now=True)
+
+    class Meta:
+        """Meta."""
+
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        ordering = ['recipe', '-score']
+        constraints = [
+            UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_similar_recipe')
+        ]
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'], name='similar_recipe_score_idx')
+        ]
+
+    def __str__(self):
+        return f'{self.similar.name} похож на {self.recipe.name}'
+
+
+class FeedEntry(models.Model):
+    """Запись в ленте рецептов авторов, на которых подписан пользователь."""
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+
+    class Meta:
+        """Meta."""
+
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента подписок'
+        ordering = ['user', '-recipe']
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry')
+        ]
+
+    def __str__(self):
+        return f'{self.recipe.name!r} в ленте у {self.user.username}'
+
+
+class Tombstone(models.Model):
+    """
+    Запись об удалении рецепта, ингредиента или тега.
+
+    По этим записям клиенты синхронизации узнают об удаленных объектах.
+    Записи старше TOMBSTONE_RETENTION_DAYS удаляет команда purge_deleted.
+    """
+
+    MODELS = (
+        ('recipe', 'Рецепт'),
+        ('ingredient', 'Ингредиент'),
+        ('tag', 'Тег'),
+    )
+
+    model = models.CharField(
+        'Модель', max_length=MAX_LENGTH_TOMBSTONE_MODEL, choices=MODELS)
+    object_id = models.BigIntegerField('id объекта')
+    deleted_at = models.DateTimeField(
+        'Дата удаления', default=timezone.now, db_index=True)
+
+    class Meta:
+        """Meta."""
+
+        verbose_name = 'Удаленный объект'
+        verbose_name_plural = 'Удаленные объекты'
+        ordering = ['deleted_at', 'id']
+
+    def __str__(self):
+        return f'{self.model} {self.object_id}'
+
+
+class UserEvent(models.Model):
+    """
+    Событие потока изменений пользователя.
+
+    Событие с user адресовано этому пользователю, событие с author -
+    всем подписчикам автора. Записи старше EVENT_RETENTION_DAYS удаляет
+    команда purge_deleted.
+    """
+
+    KINDS = (
+        ('favorite', 'Избранное'),
+        ('cart', 'Список покупок'),
+        ('follow', 'Подписка'),
+        ('recipe', 'Новый рецепт'),
+    )
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='events',
+        verbose_name='Получатель'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='published_events',
+        verbose_name='Автор'
+    )
+    kind = models.CharField(
+        'Тип', max_length=MAX_LENGTH_EVENT_KIND, choices=KINDS)
+    object_id = models.BigIntegerField('id объекта')
+    added = models.BooleanField('Добавлен', default=True)
+    created_at = models.DateTimeField(
+        'Дата события', default=timezone.now, db_index=True)
+
+    class Meta:
+        """Meta."""
+
+        verbose_name = 'Событие'
+        verbose_name_plural = 'События'
+        ordering = ['id']
+
+    def __str__(self):
+        return f'{self.kind} {self.object_id}'
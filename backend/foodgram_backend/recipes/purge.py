@@ -0,0 +1,71 @@
+"""Пакетное удаление пользователей и рецептов, помеченных удаленными.
+
+Вместо коллектора Django, который загружает все связанные объекты
+в память и держит блокировки до конца удаления, зависимые записи
+удаляются снизу вверх ограниченными пачками через прямой DELETE.
+Каждая пачка фиксируется отдельно, поэтому прерванная очистка
+продолжается с того же места при следующем запуске.
+"""
+
+from django.db import models, router
+
+
+class PurgeError(Exception):
+    """Удаление невозможно без нарушения ограничений связей."""
+
+
+def _dependents(model):
+    """Связи, указывающие на модель, включая скрытые таблицы M2M."""
+    for field in model._meta.get_fields(include_hidden=True):
+        if field.auto_created and not field.concrete and (
+                field.one_to_many or field.one_to_one):
+            yield field
+
+
+class Purger:
+    """
+    Удаляет записи queryset вместе с зависимыми пачками по batch_size.
+
+    progress(model, deleted) вызывается после каждой удаленной пачки.
+    """
+
+    def __init__(self, batch_size, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.deleted = {}
+
+    def purge(self, queryset):
+        """Удаляет все записи queryset и возвращает их количество."""
+        model = queryset.model
+        using = router.db_for_write(model)
+        total = 0
+        while True:
+            pks = list(queryset.using(using).values_list(
+                'pk', flat=True)[:self.batch_size])
+            if not pks:
+                return total
+            self._purge_dependents(model, pks)
+            deleted = model._base_manager.using(using).filter(
+                pk__in=pks)._raw_delete(using)
+            total += deleted
+            label = model._meta.label
+            self.deleted[label] = self.deleted.get(label, 0) + deleted
+            if self.progress:
+                self.progress(model, deleted)
+
+    def _purge_dependents(self, model, pks):
+        for relation in _dependents(model):
+            related_model = relation.related_model
+            field_name = relation.field.name
+            children = related_model._base_manager.filter(
+                **{f'{field_name}__in': pks})
+            on_delete = relation.on_delete
+            if on_delete is models.CASCADE:
+                self.purge(children)
+            elif on_delete is models.SET_NULL:
+                children.update(**{field_name: None})
+            elif on_delete in (models.PROTECT, models.RESTRICT):
+                if children.exists():
+                    raise PurgeError(
+                        f'{related_model._meta.label} ссылается на '
+                        f'{model._meta.label} с ограничением удаления.')
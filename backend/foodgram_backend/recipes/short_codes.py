@@ -0,0 +1,38 @@
+"""
+Короткие коды рецептов.
+
+Код - hashids от id рецепта с постоянной солью SHORT_CODE_SALT, как и у
+ссылок, выданных до появления поля Recipe.short_code. Код сохраняется
+при создании рецепта, так что короткие ссылки не зависят от настроек
+запущенного процесса. С одной солью коды разных id не совпадают; код,
+занятый рецептом, получившим его с другой солью, заменяется кодом с
+номером попытки.
+"""
+
+from django.conf import settings
+from hashids import Hashids
+
+from recipes.constants import MIN_LENGTH_SHORT_CODE, PURGE_BATCH_SIZE
+
+hashids = Hashids(
+    min_length=MIN_LENGTH_SHORT_CODE, salt=settings.SHORT_CODE_SALT)
+
+
+def encode(recipe_id, attempt=0):
+    """Короткий код рецепта с идентификатором recipe_id."""
+    if attempt:
+        return hashids.encode(recipe_id, attempt)
+    return hashids.encode(recipe_id)
+
+
+def fill_short_codes(model, batch_size=PURGE_BATCH_SIZE):
+    """Заполняет короткие коды рецептов, у которых их нет."""
+    manager = model._base_manager
+    while True:
+        batch = list(manager.filter(short_code__isnull=True).only('id')[
+            :batch_size])
+        if not batch:
+            return
+        for recipe in batch:
+            recipe.short_code = encode(recipe.id)
+        manager.bulk_update(batch, ['short_code'])
@@ -0,0 +1,53 @@
+"""
+Записи об удалении и события пользователей.
+
+Удаление рецептов, ингредиентов и тегов записывается в Tombstone для
+синхронизации клиентов, изменения избранного, списка покупок, подписок
+и новые рецепты - в UserEvent для потока событий (api/events.py).
+"""
+
+from django.db.models.signals import post_delete, post_save
+
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                            Subscription, Tag, Tombstone, UserEvent)
+
+# Тип события и поле с id объекта для моделей, изменения которых
+# отправляются пользователю
+USER_EVENTS = {
+    Favorite: ('favorite', 'recipe_id'),
+    ShoppingCart: ('cart', 'recipe_id'),
+    Subscription: ('follow', 'subscriber_id'),
+}
+
+
+def record_deletion(sender, instance, **kwargs):
+    Tombstone.objects.create(
+        model=sender._meta.model_name, object_id=instance.pk)
+
+
+def record_user_event(sender, instance, signal, created=False, **kwargs):
+    if signal is post_save and not created:
+        return
+    kind, field = USER_EVENTS[sender]
+    UserEvent.objects.create(
+        user_id=instance.user_id, kind=kind,
+        object_id=getattr(instance, field), added=signal is post_save)
+
+
+def record_new_recipe(sender, instance, created, **kwargs):
+    if created:
+        UserEvent.objects.create(
+            author_id=instance.author_id, kind='recipe',
+            object_id=instance.pk)
+
+
+# Мягкое удаление рецепта записывается в Recipe.soft_delete, очистка
+# purge_deleted сигналов не отправляет
+for model in (Recipe, Ingredient, Tag):
+    post_delete.connect(record_deletion, sender=model)
+
+for model in USER_EVENTS:
+    post_save.connect(record_user_event, sender=model)
+    post_delete.connect(record_user_event, sender=model)
+
+post_save.connect(record_new_recipe, sender=Recipe)
@@ -0,0 +1,165 @@
+"""Расчет похожих рецептов по пересечению ингредиентов и тегов.
+
+Рецепты кодируются разреженными бинарными векторами (CSR): отдельно
+по ингредиентам и по тегам. Кандидаты в соседи находятся матричным
+умножением по ингредиентам, вклад тегов добавляется только для найденных
+пар, поэтому немногочисленные и распространенные теги не делают
+произведение плотным.
+"""
+
+from itertools import chain
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Max
+from scipy import sparse
+
+from recipes.constants import (SIMILAR_RECIPES_LIMIT, SIMILARITY_BATCH_SIZE,
+                               SIMILARITY_MAX_INGREDIENT_SHARE,
+                               SIMILARITY_MIN_COMMON_INGREDIENT_RECIPES,
+                               SIMILARITY_TAG_WEIGHT)
+from recipes.models import Recipe, RecipeIngredient, SimilarRecipe
+
+METRICS = ('cosine', 'jaccard')
+
+CHUNK_SIZE = 10000
+
+
+def _load_pairs(queryset):
+    """Загружает пары (рецепт, признак) в массив без списка кортежей."""
+    flat = chain.from_iterable(queryset.iterator(chunk_size=CHUNK_SIZE))
+    return np.fromiter(flat, dtype=np.int64).reshape(-1, 2)
+
+
+def _build_matrix(recipe_ids, pairs):
+    """Строит бинарную CSR-матрицу рецепты x признаки."""
+    if not len(recipe_ids) or not len(pairs):
+        return sparse.csr_matrix((len(recipe_ids), 0), dtype=np.float32)
+    rows = np.searchsorted(recipe_ids, pairs[:, 0])
+    rows = np.minimum(rows, len(recipe_ids) - 1)
+    # Пары рецептов, созданных во время загрузки, отбрасываются.
+    known = recipe_ids[rows] == pairs[:, 0]
+    features, columns = np.unique(pairs[known, 1], return_inverse=True)
+    data = np.ones(len(columns), dtype=np.float32)
+    return sparse.csr_matrix(
+        (data, (rows[known], columns.reshape(-1))),
+        shape=(len(recipe_ids), len(features)))
+
+
+class RecipeVectors:
+    """Векторное представление всех рецептов."""
+
+    def __init__(self, tag_weight=SIMILARITY_TAG_WEIGHT,
+                 max_ingredient_share=SIMILARITY_MAX_INGREDIENT_SHARE,
+                 min_common_recipes=SIMILARITY_MIN_COMMON_INGREDIENT_RECIPES):
+        self.recipe_ids = np.fromiter(
+            Recipe.objects.order_by('id').values_list(
+                'id', flat=True).iterator(chunk_size=CHUNK_SIZE),
+            dtype=np.int64)
+        self.ingredients = _build_matrix(
+            self.recipe_ids,
+            _load_pairs(RecipeIngredient.objects.values_list(
+                'recipe_id', 'ingredient_id')))
+        self.tags = _build_matrix(
+            self.recipe_ids,
+            _load_pairs(Recipe.tags.through.objects.values_list(
+                'recipe_id', 'tag_id')))
+        self.tag_weight = tag_weight
+        # Слишком распространенные ингредиенты (соль, вода) не говорят
+        # о сходстве рецептов и делают произведение матриц плотным.
+        # Ингредиенты, встречающиеся не больше чем в min_common_recipes
+        # рецептах, остаются, иначе в небольшом каталоге соседей нет.
+        counts = np.asarray(self.ingredients.sum(axis=0)).ravel()
+        keep = sparse.diags((counts <= max(
+            max_ingredient_share * len(self), min_common_recipes)).astype(
+            np.float32))
+        self.ingredients = (self.ingredients @ keep).tocsr()
+        self.ingredients.eliminate_zeros()
+        self.sizes = (
+            np.asarray(self.ingredients.sum(axis=1)).ravel()
+            + tag_weight * np.asarray(self.tags.sum(axis=1)).ravel())
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    def rows(self, ids):
+        """Номера строк матрицы для переданных id рецептов."""
+        return np.flatnonzero(np.isin(self.recipe_ids, list(ids)))
+
+    def overlapping(self, rows):
+        """Строки рецептов, имеющих общие ингредиенты с переданными."""
+        products = self.ingredients[rows] @ self.ingredients.T
+        return np.unique(products.indices)
+
+    def neighbours(self, rows, metric='cosine', limit=SIMILAR_RECIPES_LIMIT):
+        """Возвращает top-K соседей для строк rows одной пачкой.
+
+        Результат — массивы (рецепт, похожий рецепт, сходство).
+        """
+        products = (self.ingredients[rows] @ self.ingredients.T).tocoo()
+        left, right = products.row, products.col
+        shared = products.data.astype(np.float64)
+        tags = self.tags[rows]
+        shared += self.tag_weight * np.asarray(
+            tags[left].multiply(self.tags[right]).sum(axis=1)).ravel()
+        left_rows = np.asarray(rows)[left]
+        size_left, size_right = self.sizes[left_rows], self.sizes[right]
+        if metric == 'jaccard':
+            scores = shared / (size_left + size_right - shared)
+        else:
+            scores = shared / np.sqrt(size_left * size_right)
+        mask = left_rows != right
+        left, right, scores = left[mask], right[mask], scores[mask]
+        order = np.lexsort((-scores, left))
+        left, right, scores = left[order], right[order], scores[order]
+        starts = np.searchsorted(left, left, side='left')
+        top = np.arange(len(left)) - starts < limit
+        return (self.recipe_ids[np.asarray(rows)[left[top]]],
+                self.recipe_ids[right[top]], scores[top])
+
+
+def last_build_time():
+    """Время последнего расчета похожих рецептов."""
+    return SimilarRecipe.objects.aggregate(
+        last=Max('computed_at'))['last']
+
+
+def rows_to_refresh(vectors, since):
+    """Строки рецептов, чьи соседи могли измениться после since."""
+    touched = set(Recipe.objects.filter(
+        updated_at__gt=since).values_list('id', flat=True))
+    if not touched:
+        return np.array([], dtype=np.int64)
+    touched.update(SimilarRecipe.objects.filter(
+        similar_id__in=touched).values_list('recipe_id', flat=True))
+    rows = vectors.rows(touched)
+    return np.union1d(rows, vectors.overlapping(rows))
+
+
+def build_similar_recipes(metric='cosine', limit=SIMILAR_RECIPES_LIMIT,
+                          batch_size=SIMILARITY_BATCH_SIZE, since=None,
+                          progress=None):
+    """Пересчитывает таблицу похожих рецептов.
+
+    Без since пересчитываются все рецепты, иначе — только затронутые
+    изменениями после since. Возвращает количество обработанных рецептов.
+    """
+    vectors = RecipeVectors()
+    if since is None:
+        rows = np.arange(len(vectors))
+    else:
+        rows = rows_to_refresh(vectors, since)
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        recipes, similar, scores = vectors.neighbours(batch, metric, limit)
+        with transaction.atomic():
+            SimilarRecipe.objects.filter(
+                recipe_id__in=vectors.recipe_ids[batch].tolist()).delete()
+            SimilarRecipe.objects.bulk_create(
+                SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                              score=score)
+                for recipe_id, similar_id, score in zip(
+                    recipes.tolist(), similar.tolist(), scores.tolist()))
+        if progress:
+            progress(min(start + batch_size, len(rows)), len(rows))
+    return len(rows)
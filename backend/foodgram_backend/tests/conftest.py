@@ -0,0 +1,163 @@
+import pytest
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from api.short_links import resolver as short_links
+from recipes.feed import backfill
+from recipes.models import (Favorite, FeedEntry, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, SimilarRecipe,
+                            Subscription, Tag, User)
+from recipes.short_codes import fill_short_codes
+
+# Размеры страниц, на которых проверяются списки
+PAGE_SIZES = (1, 5, 20)
+
+# Количество пользователей и рецептов каждого из них в тестовых данных
+SEED_USERS = 25
+SEED_RECIPES_PER_USER = 2
+
+# Количество авторов, на которых подписан проверяющий пользователь
+SEED_SUBSCRIPTIONS = 20
+
+PASSWORD = 'Budget-pass-123'
+
+IMAGE = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAf'
+         'FcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg==')
+
+
+@pytest.fixture(autouse=True)
+def isolated_caches(settings, tmp_path):
+    """
+    Кэш и медиафайлы тестов отделены от рабочих.
+
+    Уровни кэша и версии тегов - LocMemCache процесса теста, поэтому их
+    очистка не затрагивает общий кэш запущенного приложения.
+    """
+    settings.CACHES = {
+        'default': {
+            'BACKEND': 'api.cache.TwoTierCache',
+            'OPTIONS': {'LOCAL': 'local', 'SHARED': 'shared', 'TAGS': 'tags'},
+        },
+        'local': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'tests-local',
+        },
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'tests-shared',
+        },
+        'tags': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'tests-tags',
+            'TIMEOUT': None,
+        },
+    }
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.THROTTLING = False
+    cache.clear()
+    short_links.clear()
+    yield
+    cache.clear()
+    short_links.clear()
+
+
+@pytest.fixture(scope='session')
+def password_hash():
+    return make_password(PASSWORD)
+
+
+@pytest.fixture
+def seed(db, password_hash):
+    """Тестовые данные и значения для путей запросов."""
+    Tag.objects.bulk_create(
+        Tag(name=f'Тег {number}', slug=f'tag-{number}')
+        for number in range(3))
+    tags = list(Tag.objects.order_by('id'))
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+        for number in range(10))
+    ingredients = list(Ingredient.objects.order_by('id'))
+    User.objects.bulk_create(
+        User(username=f'user{number}', email=f'user{number}@example.com',
+             first_name='Имя', last_name='Фамилия', password=password_hash,
+             avatar='users/avatar.png')
+        for number in range(SEED_USERS))
+    users = list(User.objects.order_by('id'))
+    Recipe.objects.bulk_create(
+        Recipe(author=user, name=f'Рецепт {user.username}-{number}',
+               image='recipes/images/recipe.png', text='Описание',
+               cooking_time=10)
+        for user in users for number in range(SEED_RECIPES_PER_USER))
+    fill_short_codes(Recipe)
+    recipes = list(Recipe.objects.order_by('id'))
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(
+            recipe=recipe, ingredient=ingredients[(recipe.id + shift) % 10],
+            amount=shift + 1)
+        for recipe in recipes for shift in range(3))
+    Recipe.tags.through.objects.bulk_create(
+        Recipe.tags.through(
+            recipe_id=recipe.id, tag_id=tags[(recipe.id + shift) % 3].id)
+        for recipe in recipes for shift in range(2))
+    SimilarRecipe.objects.bulk_create(
+        SimilarRecipe(recipe=recipe, similar=recipes[(index + shift) % len(
+            recipes)], score=1 / shift)
+        for index, recipe in enumerate(recipes) for shift in range(1, 6))
+
+    user = users[0]
+    authors = users[1:SEED_SUBSCRIPTIONS + 1]
+    Subscription.objects.bulk_create(
+        Subscription(user=user, subscriber=author) for author in authors)
+    for author in authors:
+        backfill(user, author)
+    foreign = [recipe for recipe in recipes if recipe.author_id != user.id]
+    Favorite.objects.bulk_create(
+        Favorite(user=user, recipe=recipe) for recipe in foreign[:30])
+    ShoppingCart.objects.bulk_create(
+        ShoppingCart(user=user, recipe=recipe) for recipe in foreign[:30])
+    token = Token.objects.create(user=user)
+    assert FeedEntry.objects.filter(user=user).count() >= max(PAGE_SIZES)
+    # Заполнение базы не должно оставлять значений в кэше
+    cache.clear()
+    return {
+        'user': user,
+        'token': token.key,
+        'me': user.id,
+        'author': authors[0].id,
+        'free_author': users[-1].id,
+        'recipe': foreign[0].id,
+        'free_recipe': foreign[-1].id,
+        'own_recipe': Recipe.objects.filter(author=user).first().id,
+        'short_code': foreign[0].short_code,
+        'tag': tags[0].id,
+        'tag_slug': tags[0].slug,
+        'ingredient': ingredients[0].id,
+        'payloads': {
+            'recipe': {
+                'name': 'Новый рецепт', 'text': 'Описание',
+                'cooking_time': 5, 'image': IMAGE,
+                'tags': [tag.id for tag in tags[:2]],
+                'ingredients': [{'id': ingredient.id, 'amount': 10}
+                                for ingredient in ingredients[:3]],
+            },
+            'user': {
+                'email': 'new@example.com', 'username': 'new',
+                'first_name': 'Имя', 'last_name': 'Фамилия',
+                'password': PASSWORD,
+            },
+            'avatar': {'avatar': IMAGE},
+            'ids': {'ids': [foreign[0].id, foreign[-1].id, 999999]},
+        },
+    }
+
+
+@pytest.fixture
+def anonymous_client():
+    return Client()
+
+
+@pytest.fixture
+def authenticated_client(seed):
+    return Client(HTTP_AUTHORIZATION=f'Token {seed["token"]}')
@@ -0,0 +1,16 @@
+from io import StringIO
+
+from django.core.management import call_command
+
+from api.management.commands import bench_renderers
+
+
+def test_bench_renderers_runs(seed, monkeypatch):
+    monkeypatch.setattr(bench_renderers, 'UPLOAD_BODY_SIZE', 1024)
+    stdout, stderr = StringIO(), StringIO()
+    call_command('bench_renderers', repeat=1, stdout=stdout, stderr=stderr)
+    assert stderr.getvalue() == ''
+    output = stdout.getvalue()
+    for path in bench_renderers.ENDPOINTS:
+        assert f'GET {path}' in output
+    assert 'POST /api/recipes/' in output
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+from django.db import OperationalError
+
+from api import events
+
+
+def test_poll_recovers_after_database_error(monkeypatch):
+    """Опрос, упавший на чтении из базы, повторяется и доходит до ready."""
+    calls = []
+
+    async def last_event_id():
+        calls.append('last_event_id')
+        if len(calls) == 1:
+            raise OperationalError('база недоступна')
+        return 7
+
+    async def fetch_events(after):
+        calls.append(('fetch_events', after))
+        hub.connections.clear()
+        return []
+
+    monkeypatch.setattr(events, 'last_event_id', last_event_id)
+    monkeypatch.setattr(events, 'fetch_events', fetch_events)
+    monkeypatch.setattr(events, 'EVENTS_POLL_INTERVAL', 0)
+    hub = events.EventHub()
+
+    async def run():
+        hub.subscribe(object())
+        await asyncio.wait_for(hub.ready.wait(), 1)
+        await asyncio.wait_for(hub.task, 1)
+
+    asyncio.run(run())
+    assert hub.last_id == 7
+    assert calls == ['last_event_id', 'last_event_id', ('fetch_events', 7)]
+
+
+async def call(scope):
+    """Ответ events_app на запрос, от которого клиент сразу отключился."""
+    messages = []
+
+    async def receive():
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        messages.append(message)
+
+    await events.events_app(dict({
+        'type': 'http', 'method': 'GET', 'path': '/api/events/',
+        'headers': [], 'query_string': b''}, **scope), receive, send)
+    return messages
+
+
+@pytest.mark.parametrize('query', (
+    b'', b'token=0123456789abcdef', b'ticket=not-issued', b'ticket=a b'))
+def test_stream_rejects_missing_ticket(query):
+    messages = asyncio.run(call({'query_string': query}))
+    assert messages[0]['status'] == 401
+
+
+def test_ticket_is_single_use(seed, authenticated_client):
+    response = authenticated_client.post('/api/events/ticket/')
+    assert response.status_code == 201
+    ticket = response.json()['ticket']
+    assert events.redeem_ticket(ticket) == seed['user'].id
+    assert events.redeem_ticket(ticket) is None
+
+
+def test_events_path_rejected_under_wsgi(anonymous_client):
+    response = anonymous_client.get('/api/events/')
+    assert response.status_code == 501
+    assert 'ASGI' in response.json()['detail']
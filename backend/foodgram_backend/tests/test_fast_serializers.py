@@ -0,0 +1,69 @@
+"""
+Быстрые представления рецептов совпадают с RecipeSerializer.
+
+recipe_rows() и recipe_payloads() собирают ответ без сериализаторов
+DRF; тесты сверяют их вывод с RecipeSerializer для анонимного
+пользователя и для пользователя с избранным, корзиной и подписками.
+"""
+
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.fast_serializers import recipe_payloads, recipe_rows
+from api.renderers import Fragment, orjson
+from api.serializers import RecipeSerializer
+from recipes.models import Recipe
+
+
+def decoded(rows):
+    """Представления с фрагментами orjson, раскодированными в словари."""
+    return [orjson.loads(orjson.dumps(row)) if isinstance(row, Fragment)
+            else row for row in rows]
+
+
+@pytest.fixture(params=('anonymous', 'authenticated'))
+def request_for(request, seed):
+    factory = APIRequestFactory()
+    drf_request = Request(factory.get('/api/recipes/'))
+    drf_request.user = (
+        seed['user'] if request.param == 'authenticated' else AnonymousUser())
+    return drf_request
+
+
+@pytest.fixture
+def recipe_ids(seed):
+    """Все рецепты в перемешанном порядке, удаленный и несуществующий."""
+    ids = list(Recipe.objects.values_list('id', flat=True))
+    Recipe.objects.filter(id=ids[1]).update(deleted_at=timezone.now())
+    return ids[::2] + ids[1::2] + [999999]
+
+
+def expected(recipe_ids, request):
+    recipes = Recipe.objects.in_bulk(recipe_ids)
+    return RecipeSerializer(
+        [recipes[pk] for pk in recipe_ids if pk in recipes],
+        many=True, context={'request': request}).data
+
+
+def test_recipe_rows_match_serializer(recipe_ids, request_for):
+    assert recipe_rows(recipe_ids, request_for) == expected(
+        recipe_ids, request_for)
+
+
+def test_recipe_payloads_match_serializer(recipe_ids, request_for):
+    serialized = expected(recipe_ids, request_for)
+    # Первый вызов собирает карточки, второй берет их из кэша
+    assert decoded(recipe_payloads(recipe_ids, request_for)) == serialized
+    assert decoded(recipe_payloads(recipe_ids, request_for)) == serialized
+
+
+def test_flags_are_set_for_authenticated_user(recipe_ids, seed):
+    drf_request = Request(APIRequestFactory().get('/api/recipes/'))
+    drf_request.user = seed['user']
+    rows = decoded(recipe_payloads(recipe_ids, drf_request))
+    for flag in ('is_favorited', 'is_in_shopping_cart'):
+        assert {row[flag] for row in rows} == {True, False}
+    assert {row['author']['is_subscribed'] for row in rows} == {True, False}
@@ -0,0 +1,42 @@
+from django.utils import timezone
+
+from api.interactions import feed_popular_authors
+from recipes import feed
+from recipes.models import FeedEntry, Recipe, Subscription, User
+
+
+def test_feed_skips_deleted_recipes(seed, authenticated_client):
+    recipe_ids = feed.get_feed_ids(seed['user'])
+    Recipe.objects.filter(id=recipe_ids[0]).update(deleted_at=timezone.now())
+    assert feed.get_feed_ids(seed['user']) == recipe_ids[1:]
+    response = authenticated_client.get('/api/recipes/feed/')
+    assert recipe_ids[0] not in [
+        recipe['id'] for recipe in response.json()['results']]
+
+
+def test_feed_read_does_not_trim(seed, authenticated_client, monkeypatch):
+    monkeypatch.setattr(feed, 'FEED_MAX_LENGTH', 5)
+    entries = FeedEntry.objects.filter(user=seed['user']).count()
+    authenticated_client.get('/api/recipes/feed/')
+    assert FeedEntry.objects.filter(user=seed['user']).count() == entries
+
+
+def test_trim_feeds_keeps_latest_entries(seed, monkeypatch):
+    monkeypatch.setattr(feed, 'FEED_MAX_LENGTH', 5)
+    latest = list(FeedEntry.objects.filter(user=seed['user']).order_by(
+        '-recipe_id').values_list('recipe_id', flat=True)[:5])
+    entries = FeedEntry.objects.count()
+    assert sum(feed.trim_feeds(batch_size=1)) == entries - 5
+    assert list(FeedEntry.objects.filter(user=seed['user']).order_by(
+        '-recipe_id').values_list('recipe_id', flat=True)) == latest
+
+
+def test_popular_authors_follow_subscriber_limit(seed, monkeypatch):
+    monkeypatch.setattr(feed, 'FEED_FANOUT_SUBSCRIBERS_LIMIT', 1)
+    user, author = seed['user'], User.objects.get(id=seed['author'])
+    assert feed_popular_authors(user) == []
+    other = User.objects.exclude(id__in=(user.id, author.id)).first()
+    subscription = Subscription.objects.create(user=other, subscriber=author)
+    assert feed_popular_authors(user) == [author.id]
+    subscription.delete()
+    assert feed_popular_authors(user) == []
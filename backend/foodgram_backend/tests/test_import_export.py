@@ -0,0 +1,159 @@
+import json
+import tarfile
+from io import StringIO
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+
+from recipes.bulk import insert_with_ids
+from recipes.constants import (EXPORT_MEDIA_FILE, EXPORT_RECIPES_FILE,
+                               IMPORT_PROGRESS_FILE)
+from recipes.management.commands.import_recipes import Command as Import
+from recipes.models import FeedEntry, Recipe, Tag, User
+
+SHARED_IMAGE = 'recipes/images/recipe.png'
+OWN_IMAGE = 'recipes/images/own.png'
+
+
+def run(command, *args, **options):
+    stdout = StringIO()
+    call_command(command, *args, stdout=stdout, stderr=StringIO(), **options)
+    return stdout.getvalue()
+
+
+@pytest.fixture
+def export(seed, tmp_path):
+    """Каталог выгрузки рецептов seed и записи из нее."""
+    default_storage.save(SHARED_IMAGE, ContentFile(b'shared'))
+    default_storage.save(OWN_IMAGE, ContentFile(b'own'))
+    Recipe.objects.filter(id=seed['free_recipe']).update(image=OWN_IMAGE)
+    directory = tmp_path / 'export'
+    run('export_recipes', str(directory), chunk_size=7)
+    with open(directory / EXPORT_RECIPES_FILE, encoding='utf-8') as file:
+        records = [json.loads(line) for line in file]
+    return directory, records
+
+
+@pytest.fixture
+def other_database(seed, export):
+    """
+    База, куда переносится выгрузка: рецептов нет, id заняты другими
+    рецептами, имя одного автора занято пользователем с другим email.
+    """
+    Recipe.all_objects.all().delete()
+    author = seed['user']
+    for number in range(5):
+        Recipe.objects.create(
+            author=author, name=f'Другой рецепт {number}', text='Описание',
+            cooking_time=1, image=SHARED_IMAGE)
+    renamed = User.objects.get(id=seed['free_author'])
+    renamed.delete()
+    User.objects.create(username=renamed.username, email='other@example.com')
+    return renamed
+
+
+def imported(records):
+    """Загруженные рецепты по (email автора, название)."""
+    return {(recipe.author.email, recipe.name): recipe
+            for recipe in Recipe.objects.select_related('author').filter(
+                name__in=[record['name'] for record in records])}
+
+
+def test_export_writes_each_image_once(export):
+    directory, records = export
+    with tarfile.open(directory / EXPORT_MEDIA_FILE) as archive:
+        names = archive.getnames()
+    assert sorted(names) == [OWN_IMAGE, SHARED_IMAGE]
+    assert len(records) == Recipe.objects.count()
+
+
+def test_round_trip_remaps_ids(seed, export, other_database):
+    directory, records = export
+    output = run('import_recipes', str(directory), batch_size=10)
+    assert f'Загружено рецептов: {len(records)}' in output
+    assert not (directory / IMPORT_PROGRESS_FILE).exists()
+    recipes = imported(records)
+    assert len(recipes) == len(records)
+    for record in records:
+        recipe = recipes[record['author']['email'], record['name']]
+        assert recipe.id != record['id']
+        assert recipe.short_code
+        assert recipe.image.name == record['image']
+        assert sorted(recipe.tags.values_list('slug', flat=True)) == sorted(
+            tag['slug'] for tag in record['tags'])
+        assert sorted(recipe.recipeingredient_set.values_list(
+            'ingredient__name', 'amount')) == sorted(
+            (item['name'], item['amount'])
+            for item in record['ingredients'])
+
+
+def test_round_trip_renames_taken_username(export, other_database):
+    directory, records = export
+    run('import_recipes', str(directory))
+    author = User.objects.get(email=other_database.email)
+    assert author.username == f'{other_database.username}-{author.id}'
+    assert User.objects.get(
+        username=other_database.username).email == 'other@example.com'
+
+
+def test_round_trip_fans_out_and_invalidates(
+        seed, export, other_database, anonymous_client):
+    directory, records = export
+    # Фильтр коротких ссылок строится до загрузки
+    anonymous_client.get('/api/unknown')
+    run('import_recipes', str(directory))
+    followed = User.objects.get(id=seed['author'])
+    recipe_ids = set(Recipe.objects.filter(
+        author=followed).values_list('id', flat=True))
+    assert recipe_ids
+    assert recipe_ids <= set(FeedEntry.objects.filter(
+        user=seed['user']).values_list('recipe_id', flat=True))
+    recipe = Recipe.objects.filter(id__in=recipe_ids).first()
+    response = anonymous_client.get(f'/api/{recipe.short_code}')
+    assert response.status_code == 302
+
+
+def test_import_resumes_from_progress(export, other_database, monkeypatch):
+    directory, records = export
+    import_batch = Import.import_batch
+    calls = []
+
+    def failing_batch(self, batch):
+        calls.append(batch)
+        if len(calls) == 3:
+            raise RuntimeError('Прервано')
+        return import_batch(self, batch)
+
+    monkeypatch.setattr(Import, 'import_batch', failing_batch)
+    with pytest.raises(RuntimeError):
+        run('import_recipes', str(directory), batch_size=10)
+    assert json.loads((directory / IMPORT_PROGRESS_FILE).read_text())[
+        'offset'] > 0
+    assert len(imported(records)) == 20
+    monkeypatch.setattr(Import, 'import_batch', import_batch)
+    output = run('import_recipes', str(directory), batch_size=10)
+    assert (f'Загружено рецептов: {len(records) - 20}, '
+            'пропущено существующих: 0') in output
+    assert len(imported(records)) == len(records)
+
+
+def test_import_skips_existing_recipes(export):
+    directory, records = export
+    count = Recipe.objects.count()
+    output = run('import_recipes', str(directory))
+    assert (f'Загружено рецептов: 0, '
+            f'пропущено существующих: {len(records)}') in output
+    assert Recipe.objects.count() == count
+
+
+def test_insert_with_ids_uses_ids_of_rows(db):
+    Tag.objects.create(name='Первый', slug='first')
+    Tag.objects.filter(slug='first').delete()
+    Tag.objects.create(name='Есть', slug='existing')
+    tags = insert_with_ids(Tag, [
+        Tag(name=f'Тег {number}', slug=f'tag-{number}')
+        for number in range(5)], batch_size=2)
+    assert dict(Tag.objects.filter(slug__startswith='tag-').values_list(
+        'id', 'slug')) == {tag.id: tag.slug for tag in tags}
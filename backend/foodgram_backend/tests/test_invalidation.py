@@ -0,0 +1,12 @@
+from recipes.models import Recipe, User
+
+
+def test_user_soft_delete_drops_cached_recipes(seed, anonymous_client):
+    recipe = Recipe.objects.get(id=seed['recipe'])
+    paths = {f'/api/recipes/{recipe.id}/': 200,
+             f'/api/{recipe.short_code}': 302}
+    for path, status in paths.items():
+        assert anonymous_client.get(path).status_code == status
+    User.objects.get(id=recipe.author_id).soft_delete()
+    for path in paths:
+        assert anonymous_client.get(path).status_code == 404
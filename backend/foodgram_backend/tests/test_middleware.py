@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.checks import run_checks
+from django.http import HttpResponse
+from django.test import Client, RequestFactory
+
+from api.middleware import PathScopedMiddleware
+from conftest import PASSWORD
+
+SESSION = 'django.contrib.sessions.middleware.SessionMiddleware'
+
+
+class RecordingMiddleware:
+    """Синхронный middleware, запоминающий вызовы своих хуков."""
+
+    calls = []
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        self.calls.append(('call', request.path))
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        self.calls.append(('view', request.path))
+
+    def process_exception(self, request, exception):
+        self.calls.append(('exception', request.path))
+        return HttpResponse(status=503)
+
+
+@pytest.fixture
+def recording(settings):
+    RecordingMiddleware.calls = []
+    settings.PATH_SCOPED_MIDDLEWARE = [
+        SESSION, f'{__name__}.RecordingMiddleware']
+    return RecordingMiddleware.calls
+
+
+def test_api_skips_session_and_csrf(seed):
+    client = Client(enforce_csrf_checks=True)
+    response = client.post(
+        '/api/auth/token/login/',
+        {'email': seed['user'].email, 'password': PASSWORD},
+        content_type='application/json')
+    assert response.status_code == 200
+    assert not hasattr(response.wsgi_request, 'session')
+    assert not response.cookies
+
+
+def test_admin_gets_session_and_csrf(db):
+    client = Client(enforce_csrf_checks=True)
+    response = client.get('/admin/login/')
+    assert response.status_code == 200
+    assert hasattr(response.wsgi_request, 'session')
+    assert 'csrftoken' in response.cookies
+    # Проверка CSRF выполняется в process_view CsrfViewMiddleware
+    response = client.post('/admin/login/', {'username': 'admin'})
+    assert response.status_code == 403
+
+
+@pytest.mark.parametrize('path, scoped', (
+    ('/api/recipes/', False),
+    ('/admin/login/', True),
+))
+def test_hooks_run_only_outside_api(recording, path, scoped):
+    middleware = PathScopedMiddleware(lambda request: HttpResponse())
+    request = RequestFactory().get(path)
+    middleware(request)
+    assert middleware.process_view(request, None, (), {}) is None
+    response = middleware.process_exception(request, ValueError())
+    expected = [('call', path), ('view', path), ('exception', path)]
+    assert recording == (expected if scoped else [])
+    assert (response is not None) is scoped
+    assert hasattr(request, 'session') is scoped
+
+
+@pytest.mark.parametrize('path, scoped', (
+    ('/api/recipes/', False),
+    ('/admin/login/', True),
+))
+def test_async_chain(recording, path, scoped):
+    async def get_response(request):
+        return HttpResponse()
+
+    middleware = PathScopedMiddleware(get_response)
+    assert asyncio.iscoroutinefunction(middleware)
+    request = RequestFactory().get(path)
+    response = async_to_sync(middleware)(request)
+    assert response.status_code == 200
+    assert recording == ([('call', path)] if scoped else [])
+    assert hasattr(request, 'session') is scoped
+
+
+def test_admin_middleware_check(settings):
+    assert not [error for error in run_checks()
+                if error.id.startswith('api.')]
+    settings.PATH_SCOPED_MIDDLEWARE = [
+        path for path in settings.PATH_SCOPED_MIDDLEWARE if path != SESSION]
+    assert [error.id for error in run_checks()
+            if error.id.startswith('api.')] == ['api.E410']
+    settings.MIDDLEWARE = [
+        path for path in settings.MIDDLEWARE
+        if path != 'api.middleware.PathScopedMiddleware']
+    assert sorted(error.id for error in run_checks()
+                  if error.id.startswith('api.')) == [
+        'api.E408', 'api.E409', 'api.E410']
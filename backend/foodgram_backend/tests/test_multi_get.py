@@ -0,0 +1,34 @@
+import pytest
+
+
+@pytest.mark.parametrize('body', (
+    [1, 2],
+    '"ids"',
+    {},
+    {'ids': None},
+    {'ids': '1,2'},
+    {'ids': ['1', '2']},
+    {'ids': [1.5]},
+    {'ids': [True]},
+    {'ids': [{'id': 1}]},
+    {'ids': []},
+    {'ids': [0]},
+))
+def test_invalid_body_is_bad_request(seed, anonymous_client, body):
+    response = anonymous_client.post(
+        '/api/recipes/multi-get/', body, content_type='application/json')
+    assert response.status_code == 400
+    assert 'ids' in response.json()
+
+
+def test_recipes_in_request_order(seed, anonymous_client):
+    ids = [seed['free_recipe'], seed['recipe'], seed['free_recipe'], 999999]
+    response = anonymous_client.post(
+        '/api/recipes/multi-get/', {'ids': ids},
+        content_type='application/json')
+    assert response.status_code == 200
+    data = response.json()
+    assert [recipe['id'] for recipe in data['results']] == [
+        seed['free_recipe'], seed['recipe']]
+    assert data['count'] == 2
+    assert data['missing'] == [999999]
@@ -0,0 +1,172 @@
+"""
+Количество SQL-запросов эндпоинтов api.
+
+Каждый запрос выполняется при пустом кэше, от анонимного и от
+авторизованного пользователя, а списки - на нескольких размерах
+страницы: бюджет не должен зависеть от размера страницы.
+"""
+
+import json
+
+import pytest
+from django.urls import URLResolver
+
+from api.urls import urlpatterns
+from conftest import PAGE_SIZES, PASSWORD
+
+# Маршрут, метод, путь, тело запроса, признак пагинации и ожидаемые
+# статус ответа и количество SQL-запросов для анонимного
+# и авторизованного пользователя
+CASES = (
+    ('api-root', 'get', '', None, False, (200, 0), (200, 1)),
+    ('login', 'post', 'auth/token/login/',
+     {'email': 'user0@example.com', 'password': PASSWORD}, False,
+     (200, 2), (200, 3)),
+    ('logout', 'post', 'auth/token/logout/', None, False,
+     (401, 0), (204, 2)),
+    ('short_link_redirect', 'get', '{short_code}', None, False,
+     (302, 3), (302, 3)),
+    ('sync', 'get', 'sync/', None, False, (200, 4), (200, 5)),
+    ('events', 'get', 'events/', None, False, (501, 0), (501, 0)),
+    ('events-ticket', 'post', 'events/ticket/', None, False,
+     (401, 0), (201, 1)),
+    ('recipes-list', 'get', 'recipes/', None, True, (200, 8), (200, 12)),
+    ('recipes-list', 'get', 'recipes/?is_favorited=1', None, True,
+     (200, 8), (200, 12)),
+    ('recipes-list', 'get', 'recipes/?is_in_shopping_cart=1', None, True,
+     (200, 8), (200, 12)),
+    ('recipes-list', 'get', 'recipes/?author={author}', None, True,
+     (200, 9), (200, 13)),
+    ('recipes-list', 'get', 'recipes/?tags={tag_slug}', None, True,
+     (200, 9), (200, 13)),
+    ('recipes-list', 'get', 'recipes/?fields=id,name,author', None, True,
+     (200, 4), (200, 5)),
+    ('recipes-list', 'get', 'recipes/?ids={recipe},{free_recipe},999999',
+     None, False, (200, 6), (200, 10)),
+    ('recipes-multi-get-recipes', 'post', 'recipes/multi-get/',
+     'ids', False, (200, 6), (200, 10)),
+    ('recipes-list', 'post', 'recipes/', 'recipe', False,
+     (401, 0), (201, 22)),
+    ('recipes-detail', 'get', 'recipes/{recipe}/', None, False,
+     (200, 5), (200, 9)),
+    ('recipes-detail', 'patch', 'recipes/{own_recipe}/', 'recipe', False,
+     (401, 0), (200, 27)),
+    ('recipes-detail', 'delete', 'recipes/{own_recipe}/', None, False,
+     (401, 6), (204, 9)),
+    ('recipes-download-shopping-cart', 'get',
+     'recipes/download_shopping_cart/', None, False, (401, 0), (200, 2)),
+    ('recipes-feed', 'get', 'recipes/feed/', None, True,
+     (401, 0), (200, 11)),
+    ('recipes-favorite', 'post', 'recipes/{free_recipe}/favorite/', None,
+     False, (401, 0), (201, 5)),
+    ('recipes-favorite', 'delete', 'recipes/{recipe}/favorite/', None,
+     False, (401, 0), (204, 6)),
+    ('recipes-shopping-cart', 'post',
+     'recipes/{free_recipe}/shopping_cart/', None, False,
+     (401, 0), (201, 5)),
+    ('recipes-shopping-cart', 'delete', 'recipes/{recipe}/shopping_cart/',
+     None, False, (401, 0), (204, 6)),
+    ('recipes-get-link', 'get', 'recipes/{recipe}/get-link/', None, False,
+     (200, 1), (200, 2)),
+    ('recipes-similar', 'get', 'recipes/{recipe}/similar/', None, False,
+     (200, 2), (200, 3)),
+    ('ingredients-list', 'get', 'ingredients/?name=Ингр', None, False,
+     (200, 1), (200, 2)),
+    ('ingredients-detail', 'get', 'ingredients/{ingredient}/', None,
+     False, (200, 1), (200, 2)),
+    ('tags-list', 'get', 'tags/', None, False, (200, 1), (200, 2)),
+    ('tags-detail', 'get', 'tags/{tag}/', None, False, (200, 1), (200, 2)),
+    ('users-list', 'get', 'users/', None, True, (200, 2), (200, 4)),
+    ('users-list', 'post', 'users/', 'user', False, (201, 5), (201, 6)),
+    ('users-detail', 'get', 'users/{author}/', None, False,
+     (200, 1), (200, 3)),
+    ('users-detail', 'put', 'users/{free_author}/', 'user', False,
+     (401, 0), (403, 2)),
+    ('users-detail', 'put', 'users/{me}/', 'user', False,
+     (401, 0), (200, 5)),
+    ('users-detail', 'delete', 'users/{free_author}/', None, False,
+     (401, 0), (403, 2)),
+    ('users-detail', 'delete', 'users/{me}/', None, False,
+     (401, 0), (204, 6)),
+    ('users-me', 'get', 'users/me/', None, False, (401, 0), (200, 2)),
+    ('users-avatar', 'put', 'users/me/avatar/', 'avatar', False,
+     (401, 0), (200, 2)),
+    ('users-avatar', 'delete', 'users/me/avatar/', None, False,
+     (401, 0), (204, 2)),
+    ('users-set-password', 'post', 'users/set_password/',
+     {'current_password': PASSWORD, 'new_password': 'Budget-pass-456'},
+     False, (401, 0), (204, 3)),
+    ('users-subscriptions', 'get', 'users/subscriptions/', None, True,
+     (401, 0), (200, 4)),
+    ('users-subscriptions', 'get', 'users/subscriptions/?recipes_limit=1',
+     None, True, (401, 0), (200, 4)),
+    ('users-subscribe', 'post', 'users/{free_author}/subscribe/', None,
+     False, (401, 0), (201, 12)),
+    ('users-subscribe', 'delete', 'users/{author}/subscribe/', None, False,
+     (401, 0), (204, 8)),
+)
+
+
+def api_routes(patterns=urlpatterns):
+    """Пары (имя маршрута, метод) всех эндпоинтов api/urls.py."""
+    routes = set()
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            routes |= api_routes(pattern.url_patterns)
+            continue
+        callback = pattern.callback
+        view_class = getattr(callback, 'cls', None)
+        actions = getattr(callback, 'actions', None)
+        if actions:
+            # DRF добавляет head в actions при первом GET-запросе
+            methods = [method for method in actions
+                       if method in view_class.http_method_names
+                       and method != 'head']
+        elif view_class is not None:
+            methods = [method for method in view_class.http_method_names
+                       if method not in ('head', 'options')
+                       and hasattr(view_class, method)]
+        else:
+            methods = ['get']
+        routes.update((pattern.name, method) for method in methods)
+    return routes
+
+
+def budget_params():
+    """Параметры тестов: запрос, клиент, размер страницы и ожидание."""
+    params = []
+    for _, method, path, data, paginated, *budgets in CASES:
+        for kind, expected in zip(('anonymous', 'authenticated'), budgets):
+            for size in PAGE_SIZES if paginated else (None,):
+                label = f'{method.upper()} /api/{path} {kind}'
+                if size is not None:
+                    label += f' limit={size}'
+                params.append(pytest.param(
+                    method, path, data, kind, size, expected, id=label))
+    return params
+
+
+def test_every_endpoint_has_budget():
+    checked = {(name, method) for name, method, *_ in CASES}
+    assert api_routes() - checked == set()
+
+
+@pytest.mark.parametrize(
+    'method, path, data, kind, size, expected', budget_params())
+def test_query_budget(request, django_assert_num_queries, seed, method, path,
+                      data, kind, size, expected):
+    client = request.getfixturevalue(f'{kind}_client')
+    path = '/api/' + path.format(**seed)
+    if size is not None:
+        separator = '&' if '?' in path else '?'
+        path = f'{path}{separator}limit={size}'
+    if isinstance(data, str):
+        data = seed['payloads'][data]
+    status, queries = expected
+    with django_assert_num_queries(queries):
+        if data is None:
+            response = getattr(client, method)(path)
+        else:
+            response = getattr(client, method)(
+                path, data=json.dumps(data), content_type='application/json')
+    assert response.status_code == status
@@ -0,0 +1,34 @@
+from recipes.models import Recipe
+from recipes.short_codes import encode
+
+
+def test_taken_short_code_is_replaced(seed):
+    """Код, занятый рецептом с прежней солью, заменяется следующим."""
+    recipe = Recipe.objects.get(id=seed['recipe'])
+    next_id = Recipe.all_objects.order_by('-id').first().id + 1
+    recipe.short_code = encode(next_id)
+    recipe.save(update_fields=['short_code'])
+    created = Recipe.objects.create(
+        author=seed['user'], name='Новый рецепт', text='Описание',
+        cooking_time=5, image='recipes/images/recipe.png')
+    assert created.id == next_id
+    assert created.short_code == encode(next_id, 1)
+    assert Recipe.objects.get(id=created.id).short_code == created.short_code
+
+
+def test_short_code_redirects_to_recipe(seed, anonymous_client):
+    response = anonymous_client.get(f'/api/{seed["short_code"]}')
+    assert response.status_code == 302
+    assert response['Location'].endswith(f'recipes/{seed["recipe"]}/')
+    assert anonymous_client.get('/api/zzzzzzz').status_code == 404
+
+
+def test_new_recipe_short_code_redirects(seed, anonymous_client):
+    """Ссылка нового рецепта открывается без ожидания обновления фильтра."""
+    assert anonymous_client.get(f'/api/{seed["short_code"]}').status_code == 302
+    created = Recipe.objects.create(
+        author=seed['user'], name='Новый рецепт', text='Описание',
+        cooking_time=5, image='recipes/images/recipe.png')
+    response = anonymous_client.get(f'/api/{created.short_code}')
+    assert response.status_code == 302
+    assert response['Location'].endswith(f'recipes/{created.id}/')
@@ -0,0 +1,98 @@
+import pytest
+from django.utils import timezone
+
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            SimilarRecipe, Tag, User)
+from recipes.similarity import RecipeVectors, build_similar_recipes
+
+# Ингредиенты и теги рецептов каталога
+CATALOG = {
+    'base': ('abc', 'breakfast'),
+    'twin': ('abc', 'breakfast'),
+    'close': ('abd', 'dinner'),
+    'other': ('ef', 'dinner'),
+    'lonely': ('gh', 'dinner'),
+}
+
+
+@pytest.fixture
+def catalog(db):
+    author = User.objects.create(
+        username='author', email='author@example.com')
+    ingredients = {
+        letter: Ingredient.objects.create(
+            name=letter, measurement_unit='г')
+        for letter in 'abcdefgh'}
+    tags = {slug: Tag.objects.create(name=slug, slug=slug)
+            for slug in ('breakfast', 'dinner')}
+    recipes = {}
+    for name, (letters, tag) in CATALOG.items():
+        recipe = Recipe.objects.create(
+            author=author, name=name, text=name, cooking_time=1,
+            image='recipes/images/recipe.png')
+        recipe.tags.set([tags[tag]])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredients[letter],
+                             amount=1)
+            for letter in letters)
+        recipes[name] = recipe
+    recipes['ingredients'] = ingredients
+    return recipes
+
+
+def similar_names(recipe):
+    return list(SimilarRecipe.objects.filter(recipe=recipe).order_by(
+        '-score').values_list('similar__name', flat=True))
+
+
+def test_neighbours_ranked_by_shared_ingredients_and_tags(catalog):
+    assert build_similar_recipes() == len(CATALOG)
+    assert similar_names(catalog['base']) == ['twin', 'close']
+    # Теги учитываются только для рецептов с общими ингредиентами
+    assert set(similar_names(catalog['close'])) == {'base', 'twin'}
+    assert similar_names(catalog['lonely']) == []
+
+
+def test_common_ingredients_cut_only_in_large_catalog(catalog):
+    vectors = RecipeVectors()
+    assert len(vectors.neighbours(vectors.rows([catalog['base'].id]))[0])
+    vectors = RecipeVectors(max_ingredient_share=0.2, min_common_recipes=0)
+    assert not len(vectors.neighbours(vectors.rows([catalog['base'].id]))[0])
+    # Ингредиенты a и b есть в трех рецептах из пяти и отбрасываются,
+    # у base остается общий только с twin ингредиент c
+    vectors = RecipeVectors(max_ingredient_share=0.5, min_common_recipes=0)
+    _, similar, _ = vectors.neighbours(vectors.rows([catalog['base'].id]))
+    assert similar.tolist() == [catalog['twin'].id]
+
+
+def test_incremental_rebuild_refreshes_touched_recipes(catalog):
+    build_similar_recipes()
+    since = timezone.now()
+    RecipeIngredient.objects.create(
+        recipe=catalog['lonely'], ingredient=catalog['ingredients']['e'],
+        amount=1)
+    catalog['lonely'].save()
+    processed = build_similar_recipes(since=since)
+    assert 0 < processed < len(CATALOG)
+    assert similar_names(catalog['lonely']) == ['other']
+    assert 'lonely' in similar_names(catalog['other'])
+    assert similar_names(catalog['base']) == ['twin', 'close']
+
+
+def test_similar_endpoint(catalog, anonymous_client):
+    build_similar_recipes()
+    response = anonymous_client.get(
+        f'/api/recipes/{catalog["base"].id}/similar/')
+    assert response.status_code == 200
+    assert [recipe['name'] for recipe in response.json()] == [
+        'twin', 'close']
+
+
+@pytest.mark.parametrize('recipe', ('abc', '999999', 'deleted'))
+def test_similar_unknown_recipe_not_found(catalog, anonymous_client, recipe):
+    build_similar_recipes()
+    if recipe == 'deleted':
+        catalog['base'].soft_delete()
+        recipe = catalog['base'].id
+    response = anonymous_client.get(f'/api/recipes/{recipe}/similar/')
+    assert response.status_code == 404
@@ -0,0 +1,14 @@
+from recipes.models import Recipe
+
+
+def test_recipes_limit_keeps_newest_recipes(seed, authenticated_client):
+    """recipes_limit ограничивает рецепты, но не их количество."""
+    response = authenticated_client.get(
+        '/api/users/subscriptions/?recipes_limit=1&limit=100')
+    assert response.status_code == 200
+    authors = response.json()['results']
+    assert authors
+    for author in authors:
+        newest = Recipe.objects.filter(author_id=author['id']).first()
+        assert [recipe['id'] for recipe in author['recipes']] == [newest.id]
+        assert author['recipes_count'] == 2
@@ -0,0 +1,35 @@
+import json
+from base64 import urlsafe_b64encode
+
+import pytest
+
+from api.sync import MAX_ID, MAX_MICROS, SOURCES
+
+
+def cursor(position):
+    positions = dict.fromkeys(SOURCES)
+    positions['recipes'] = position
+    return urlsafe_b64encode(json.dumps(positions).encode()).decode()
+
+
+@pytest.mark.parametrize('since', (
+    'not-a-cursor',
+    urlsafe_b64encode(b'[1, 2]').decode(),
+    cursor([MAX_MICROS + 1, 1]),
+    cursor([-1, 1]),
+    cursor([10 ** 30, None]),
+    cursor([0, MAX_ID + 1]),
+    cursor([0, 'id']),
+))
+def test_invalid_cursor_is_bad_request(seed, anonymous_client, since):
+    response = anonymous_client.get('/api/sync/', {'since': since})
+    assert response.status_code == 400
+    assert 'since' in response.json()
+
+
+def test_cursor_from_response_is_accepted(seed, anonymous_client):
+    response = anonymous_client.get('/api/sync/', {'limit': 5})
+    assert response.status_code == 200
+    response = anonymous_client.get(
+        '/api/sync/', {'since': response.json()['cursor']})
+    assert response.status_code == 200
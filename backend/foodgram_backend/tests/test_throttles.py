@@ -0,0 +1,71 @@
+import pytest
+from django.test import Client, RequestFactory
+
+from api.constants import (THROTTLE_CLIENT_BUCKETS, THROTTLE_MAX_COST,
+                           THROTTLE_TOTAL_BUCKETS)
+from api.db_routing import client_keys
+from api.throttles import load_cost, take
+
+LOGIN = '/api/auth/token/login/'
+
+
+@pytest.fixture
+def throttling(db, settings, monkeypatch):
+    """Включенное ограничение частоты при низкой загрузке процессора."""
+    settings.THROTTLING = True
+    monkeypatch.setattr('api.throttles.os.getloadavg', lambda: (0, 0, 0))
+
+
+def login(client, number, address):
+    """Вход с неверными данными: ограничение проверяется до view."""
+    return client.post(
+        LOGIN, {'email': f'nobody{number}@example.com', 'password': 'x'},
+        content_type='application/json',
+        HTTP_X_FORWARDED_FOR=f'10.0.0.1, {address}')
+
+
+def test_bucket_refills_over_time():
+    bucket = [('throttle:test', 2, 60, 1)]
+    assert take(bucket, 0) is None
+    assert take(bucket, 0) is None
+    assert take(bucket, 0) == pytest.approx(1)
+    assert take(bucket, 0.5) == pytest.approx(0.5)
+    assert take(bucket, 1) is None
+    assert take(bucket, 1) == pytest.approx(1)
+
+
+def test_load_raises_total_bucket_cost(monkeypatch):
+    monkeypatch.setattr('api.throttles.os.cpu_count', lambda: 1)
+    monkeypatch.setattr('api.throttles.os.getloadavg', lambda: (0.5, 0, 0))
+    assert load_cost() == 1
+    monkeypatch.setattr('api.throttles.os.getloadavg', lambda: (5, 0, 0))
+    assert load_cost() == THROTTLE_MAX_COST
+
+
+def test_login_is_limited_per_ip(throttling):
+    client = Client()
+    capacity = THROTTLE_CLIENT_BUCKETS['login'][0]
+    for number in range(capacity):
+        assert login(client, number, '192.0.2.1').status_code == 400
+    response = login(client, capacity, '192.0.2.1')
+    assert response.status_code == 429
+    assert int(response['Retry-After']) >= 1
+    # Первый адрес X-Forwarded-For задает клиент: корзина выбирается
+    # по адресу, который добавил прокси
+    assert login(client, capacity, '192.0.2.2').status_code == 400
+
+
+def test_total_bucket_sheds_load(throttling, monkeypatch):
+    monkeypatch.setattr('api.throttles.os.getloadavg', lambda: (1000, 0, 0))
+    client = Client()
+    allowed = THROTTLE_TOTAL_BUCKETS['login'][0] // THROTTLE_MAX_COST
+    for number in range(allowed):
+        assert login(client, number, f'192.0.2.{number}').status_code == 400
+    response = login(client, allowed, f'192.0.2.{allowed}')
+    assert response.status_code == 429
+
+
+def test_replica_stickiness_uses_throttle_ip():
+    request = RequestFactory().get(
+        '/api/recipes/', HTTP_X_FORWARDED_FOR='10.0.0.1, 192.0.2.1')
+    assert client_keys(request)[0].endswith('ip:192.0.2.1')